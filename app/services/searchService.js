@@ -82,32 +82,48 @@ export async function searchAgentsByCategory(query, categoryId, userLat = null,
   }
 }
 
-// Get search suggestions based on categories and popular searches
+// Get search suggestions (typo-tolerant agent and category names) from the API
 export async function getSearchSuggestions(query) {
+  // Static suggestions for an empty search box, or when the API is unreachable
+  const suggestions = [
+    'Electrician',
+    'Plumber', 
+    'Home Cleaning',
+    'AC Service',
+    'Carpentry',
+    'Painting',
+    'Gardening',
+    'Pest Control'
+  ];
+
+  if (!query || query.trim().length === 0) {
+    return suggestions;
+  }
+
   try {
-    // For now, return static suggestions based on categories
-    const suggestions = [
-      'Electrician',
-      'Plumber', 
-      'Home Cleaning',
-      'AC Service',
-      'Carpentry',
-      'Painting',
-      'Gardening',
-      'Pest Control'
-    ];
-    
-    // Filter suggestions based on query
-    if (query && query.length > 0) {
-      return suggestions.filter(suggestion => 
-        suggestion.toLowerCase().includes(query.toLowerCase())
-      );
+    const params = new URLSearchParams();
+    params.append('q', query);
+    params.append('limit', 8);
+
+    const response = await fetch(`${config.API_URL}/search/suggest?${params}`, {
+      method: 'GET',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+    });
+
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
     }
-    
-    return suggestions;
+
+    const results = await response.json();
+    // Agents can share a name; show each suggestion text once
+    return [...new Set(results.map(result => result.text))];
   } catch (error) {
     console.error('Error getting search suggestions:', error);
-    return [];
+    return suggestions.filter(suggestion => 
+      suggestion.toLowerCase().includes(query.toLowerCase())
+    );
   }
 }
 
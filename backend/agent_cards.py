@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Check or rebuild the materialized agent_cards table
+
+    python agent_cards.py check     # exit status 1 if it has drifted
+    python agent_cards.py rebuild
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from shared.database import engine, create_tables
+from shared.user import models  # noqa: F401 - loads all tables and their hooks
+from shared.agent.card_table import check, rebuild
+
+def check_agent_cards() -> bool:
+    with engine.connect() as connection:
+        result = check(connection)
+    if result["ok"]:
+        print("✅ agent_cards matches the agent tables")
+        return True
+    counts = result["counts"]
+    print(f"❌ agent_cards has drifted: {counts['missing']} missing, {counts['extra']} extra, {counts['stale']} stale")
+    for kind in ("missing", "extra", "stale"):
+        if result[kind]:
+            print(f"   {kind}: {', '.join(map(str, result[kind]))}")
+    return False
+
+def rebuild_agent_cards():
+    print("🔄 Rebuilding agent_cards...")
+    with engine.begin() as connection:
+        count = rebuild(connection)
+    print(f"✅ Rebuilt {count} agent cards")
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    create_tables()
+    if command == "check":
+        sys.exit(0 if check_agent_cards() else 1)
+    elif command == "rebuild":
+        rebuild_agent_cards()
+    else:
+        print(__doc__)
+        sys.exit(2)
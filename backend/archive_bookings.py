@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Move finished bookings older than BOOKING_ARCHIVE_AFTER_DAYS into the
+archive tables, one batch per transaction (the API also does this in the
+background through the booking.archive job)
+
+    python archive_bookings.py
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from shared.database import engine, create_tables
+from shared.user import models  # noqa: F401 - loads all tables and their hooks
+from shared.booking.archive import ARCHIVE_AFTER, archive_batch
+
+def archive_bookings() -> int:
+    print(f"🔄 Archiving finished bookings scheduled more than {ARCHIVE_AFTER.days} days ago...")
+    total = 0
+    while True:
+        with engine.begin() as connection:
+            moved = archive_batch(connection)
+        if not moved:
+            break
+        total += moved
+        print(f"   {total} archived")
+    print(f"✅ Archived {total} bookings")
+    return total
+
+if __name__ == "__main__":
+    create_tables()
+    archive_bookings()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Memory per agent and filter scan speed of AgentRecords (shared.agent.records)
+against the objects an ORM-based cache would hold: Agent instances with
+their User and AgentCategory rows, and AgentResponse models.
+
+Records are built and scanned at --agents. A million ORM objects take
+several GB, so they are measured on --sample agents and extrapolated; the
+per-agent figures don't depend on the count. Exits with status 1 if a
+records scan disagrees with the ORM scan over the same agents.
+
+Usage: python -m benchmarks.agent_records [--agents 1000000] [--sample 100000]
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.agent.routes import AgentResponse, calculate_distance
+from shared.agent.records import AgentRecords
+from shared.user.models import User, Agent, AgentCategory
+
+CENTER = (28.6139, 77.2090)
+CATEGORIES = [(i, name) for i, name in enumerate(
+    ["Home Cleaning", "Plumbing", "Electrical", "Carpentry", "Painting", "Appliance Repair", "Pest Control", "Gardening"], 1
+)]
+# The scanned filter: online cleaners within 5 km of the centre
+QUERY = {"category_id": 1, "is_online": True, "latitude": CENTER[0], "longitude": CENTER[1], "within_km": 5.0}
+
+def agents(count, seed=1):
+    """Deterministic agent tuples: id, name, lat, lng, rate, rating, ratings, score, online, category ids"""
+    rnd = random.Random(seed)
+    for i in range(1, count + 1):
+        yield (i, f"Agent {i}", round(CENTER[0] + rnd.gauss(0, 0.15), 5), round(CENTER[1] + rnd.gauss(0, 0.15), 5),
+               rnd.choice((15.0, 20.0, 25.0)), round(rnd.uniform(3, 5), 2), rnd.randint(0, 200),
+               round(rnd.uniform(3, 5), 2), rnd.random() < 0.4, rnd.sample(range(1, 9), rnd.randint(1, 3)))
+
+def build_records(count):
+    records = AgentRecords(CATEGORIES)
+    for agent_id, name, lat, lng, rate, rating, total, score, online, category_ids in agents(count):
+        records.append(agent_id, agent_id, name, lat, lng, rate, rating, total, score, online, True, category_ids)
+    records.compact()
+    return records
+
+def build_orm(count):
+    result = []
+    for agent_id, name, lat, lng, rate, rating, total, score, online, category_ids in agents(count):
+        user = User(id=agent_id, name=name, email=f"agent{agent_id}@example.com", location=f"{lat},{lng}", is_agent=True)
+        agent = Agent(id=agent_id, user_id=agent_id, rate_per_km=rate, is_online=online, avg_rating=rating,
+                      total_ratings=total, ranking_score=score, kyc_status="verified", user=user)
+        agent.categories = [AgentCategory(agent_id=agent_id, category_id=category_id) for category_id in category_ids]
+        result.append(agent)
+    return result
+
+def build_responses(count):
+    names = dict(CATEGORIES)
+    return [
+        AgentResponse(id=agent_id, user_id=agent_id, name=name, rate_per_km=rate, is_online=online, avg_rating=rating,
+                      total_ratings=total, categories=[names[category_id] for category_id in category_ids])
+        for agent_id, name, lat, lng, rate, rating, total, score, online, category_ids in agents(count)
+    ]
+
+def scan_orm(agents_, category_id, is_online, latitude, longitude, within_km):
+    result = []
+    for agent in agents_:
+        if agent.is_online != is_online:
+            continue
+        if not any(link.category_id == category_id for link in agent.categories):
+            continue
+        lat, lng = map(float, agent.user.location.split(","))
+        if calculate_distance(latitude, longitude, lat, lng) > within_km:
+            continue
+        result.append(agent.id)
+    return result
+
+def measure(build, count):
+    """(object, bytes allocated, seconds to build)"""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    built = build(count)
+    elapsed = time.perf_counter() - started
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return built, size, elapsed
+
+def timed(fn, repeat=3):
+    """(result, best seconds)"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--agents", type=int, default=1_000_000)
+    parser.add_argument("--sample", type=int, default=100_000)
+    args = parser.parse_args()
+    sample = min(args.sample, args.agents)
+    scale = args.agents / sample
+
+    records, records_bytes, records_build = measure(build_records, args.agents)
+    rows, records_scan = timed(lambda: list(records.scan(**QUERY)))
+    sample_rows = [row for row in rows if row < sample]
+    print(f"AgentRecords at {args.agents}: {records_bytes / args.agents:.0f} B/agent "
+          f"({records_bytes / 2**20:.0f} MiB, nbytes {records.nbytes() / 2**20:.0f} MiB), "
+          f"built in {records_build:.1f}s, scan {records_scan * 1000:.0f} ms ({len(rows)} matches)")
+
+    orm, orm_bytes, orm_build = measure(build_orm, sample)
+    matches, orm_scan = timed(lambda: scan_orm(orm, **QUERY))
+    del orm
+    print(f"ORM Agent+User+categories at {sample}: {orm_bytes / sample:.0f} B/agent, "
+          f"built in {orm_build:.1f}s, scan {orm_scan * 1000:.0f} ms; "
+          f"at {args.agents}: ~{orm_bytes * scale / 2**20:.0f} MiB, scan ~{orm_scan * scale * 1000:.0f} ms")
+
+    responses, response_bytes, _ = measure(build_responses, sample)
+    del responses
+    print(f"AgentResponse at {sample}: {response_bytes / sample:.0f} B/agent; "
+          f"at {args.agents}: ~{response_bytes * scale / 2**20:.0f} MiB")
+
+    print(f"Records use {orm_bytes / sample / (records_bytes / args.agents):.0f}x less memory than ORM objects "
+          f"and scan {orm_scan * scale / records_scan:.1f}x faster")
+    if [records.agent_id[row] for row in sample_rows] != matches:
+        print("❌ Records and ORM scans disagree")
+        return 1
+    print(f"✅ Scans agree on the first {sample} agents ({len(matches)} matches)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Free-agent lookup for a scheduled slot at scale: geo candidates near a
+location, filtered by time either with a bookings query (the overlap
+check against the bookings table) or with the availability index.
+
+Usage: python -m benchmarks.availability [--agents 100000] [--bookings-per-agent 3]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}/availability.db"
+
+import httpx
+import sqlalchemy as sa
+
+import main
+from shared.admission import AdmissionControlMiddleware
+from shared.agent.availability import availability, BOOKING_DURATION, BUSY_STATUSES
+from shared.agent.routes import _agent_candidates
+from shared.database import engine, ReadSessionLocal, create_tables
+from shared.user.models import User, Agent, AgentCategory, Booking, Category
+
+CENTER = (28.6139, 77.2090)
+
+def seed(agents, bookings_per_agent):
+    create_tables()
+    now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    users, agent_rows, links, bookings = [], [], [], []
+    for i in range(1, agents + 1):
+        lat = CENTER[0] + random.uniform(-0.3, 0.3)
+        lng = CENTER[1] + random.uniform(-0.3, 0.3)
+        users.append({"id": i, "name": f"Agent {i}", "email": f"agent{i}@example.com", "password_hash": "x",
+                      "location": f"{lat},{lng}", "is_agent": True})
+        agent_rows.append({"id": i, "user_id": i, "kyc_status": "verified", "is_online": i % 2 == 0,
+                           "rate_per_km": 20.0, "wallet_balance": 1000.0, "avg_rating": 4.0, "total_ratings": 10})
+        links.append({"agent_id": i, "category_id": 1 + i % 3})
+        for _ in range(bookings_per_agent):
+            bookings.append({"user_id": i, "agent_id": i, "category_id": 1 + i % 3,
+                             "status": random.choice(("pending", "accepted", "accepted", "cancelled")),
+                             "scheduled_time": now + timedelta(minutes=30 * random.randrange(0, 48 * 7)),
+                             "visit_charge": 100.0, "user_location": "0,0", "address": "x"})
+    with engine.begin() as connection:
+        connection.execute(sa.insert(Category), [{"id": n, "name": f"Category {n}"} for n in (1, 2, 3)])
+        connection.execute(sa.insert(User), users)
+        connection.execute(sa.insert(Agent), agent_rows)
+        connection.execute(sa.insert(AgentCategory), links)
+        connection.execute(sa.insert(Booking), bookings)
+    return now + timedelta(days=1, hours=10)
+
+def free_by_query(db, agent_ids, start, end):
+    busy = {
+        agent_id for agent_id, in db.query(Booking.agent_id).filter(
+            Booking.agent_id.in_(agent_ids),
+            Booking.status.in_(BUSY_STATUSES),
+            Booking.scheduled_time < end,
+            Booking.scheduled_time > start - BOOKING_DURATION
+        ).distinct()
+    }
+    return [agent_id for agent_id in agent_ids if agent_id not in busy]
+
+def best_ms(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+async def endpoint(start, radius, requests):
+    transport = httpx.ASGITransport(app=main.app)
+    latencies = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        for i in range(requests):
+            params = {"latitude": CENTER[0] + random.uniform(-0.002, 0.002), "longitude": CENTER[1] + random.uniform(-0.002, 0.002),
+                      "start": (start + timedelta(minutes=30 * (i % 8))).isoformat(), "radius": radius}
+            begin = time.perf_counter()
+            response = await client.get("/api/agents/available", params=params)
+            latencies.append(time.perf_counter() - begin)
+            assert response.status_code == 200, response.text
+    return latencies
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--agents", type=int, default=100000)
+    parser.add_argument("--bookings-per-agent", type=int, default=3)
+    parser.add_argument("--radius", type=float, default=5.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    random.seed(42)
+    slot = seed(args.agents, args.bookings_per_agent)
+    end = slot + timedelta(hours=2)
+
+    load_ms, _ = best_ms(availability.load, 1)
+    db = ReadSessionLocal()
+    candidates = _agent_candidates(db, latitude=CENTER[0], longitude=CENTER[1], within_km=args.radius)
+    agent_ids = [agent["id"] for agent in candidates]
+    query_ms, by_query = best_ms(lambda: free_by_query(db, agent_ids, slot, end), args.repeat)
+    index_ms, by_index = best_ms(lambda: availability.free_agents(agent_ids, slot, end), args.repeat)
+    db.close()
+    assert sorted(by_query) == sorted(by_index), "index and query disagree"
+
+    print(f"{args.agents} agents, {args.agents * args.bookings_per_agent} bookings, "
+          f"{len(agent_ids)} agents within {args.radius:g} km, {len(by_index)} free")
+    print(f"index build          {load_ms:8.1f} ms  {availability.stats()}")
+    print(f"time filter, query   {query_ms:8.2f} ms")
+    print(f"time filter, index   {index_ms:8.2f} ms  ({query_ms / index_ms:.0f}x faster)")
+
+    main.app.user_middleware = [m for m in main.app.user_middleware if m.cls is not AdmissionControlMiddleware]
+    latencies = asyncio.run(endpoint(slot, args.radius, 50))
+    print(f"GET /agents/available  first {latencies[0] * 1000:.1f} ms (loads geo candidates), "
+          f"then p50 {sorted(latencies[1:])[len(latencies) // 2] * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Peak memory of the admin booking export at growing table sizes. Each
+export is driven through the full ASGI app with a send() that counts and
+drops the body, under tracemalloc. Exits with status 1 if the peak grows
+with the number of rows instead of staying flat.
+
+Usage: python -m benchmarks.export_memory [--rows 1000 20000 200000] [--format csv|ndjson] [--gzip]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}/export_memory.db"
+
+import sqlalchemy as sa
+
+import main
+from shared.auth.jwt import create_access_token
+from shared.database import engine, create_tables
+from shared.user.models import User, Agent, Category, Booking
+
+INSERT_BATCH = 10000
+# Allowed growth of the peak from the smallest to the largest export
+TOLERANCE = 1.5
+
+def seed_base():
+    create_tables()
+    with engine.begin() as connection:
+        connection.execute(sa.insert(Category), [{"id": 1, "name": "Cleaning"}])
+        connection.execute(sa.insert(User), [
+            {"id": 1, "name": "Admin", "email": "admin@example.com", "password_hash": "x", "is_admin": True},
+            {"id": 2, "name": "Agent", "email": "agent@example.com", "password_hash": "x", "is_admin": False},
+        ])
+        connection.execute(sa.insert(Agent), [{"id": 1, "user_id": 2, "kyc_status": "verified"}])
+
+def grow_bookings(total):
+    """Add bookings until the table holds total rows"""
+    with engine.begin() as connection:
+        current = connection.execute(sa.select(sa.func.count()).select_from(Booking)).scalar()
+        start = datetime(2024, 1, 1)
+        for first in range(current, total, INSERT_BATCH):
+            connection.execute(sa.insert(Booking), [
+                {"user_id": 1, "agent_id": 1, "category_id": 1, "status": "completed",
+                 "scheduled_time": start + timedelta(minutes=n), "visit_charge": 120.5,
+                 "user_location": "28.6139,77.2090", "address": f"House {n}, Sector 21", "notes": "Ring twice"}
+                for n in range(first, min(first + INSERT_BATCH, total))
+            ])
+
+async def export(token, query):
+    """Run one export through the app; returns (status, body bytes)"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": "/api/admin/export/bookings", "raw_path": b"/api/admin/export/bookings",
+        "query_string": query.encode(), "root_path": "",
+        "headers": [(b"host", b"testserver"), (b"authorization", f"Bearer {token}".encode())],
+        "client": ("127.0.0.1", 50000), "server": ("testserver", 80),
+    }
+    received = {"status": None, "bytes": 0}
+    requested = []
+
+    async def receive():
+        if not requested:
+            requested.append(True)
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # The client stays connected until the response is complete
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            received["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            received["bytes"] += len(message.get("body", b""))
+
+    await main.app(scope, receive, send)
+    return received["status"], received["bytes"]
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 20000, 200000])
+    parser.add_argument("--format", choices=("csv", "ndjson"), default="csv")
+    parser.add_argument("--gzip", action="store_true")
+    args = parser.parse_args()
+
+    seed_base()
+    token = create_access_token({"sub": "admin@example.com", "is_admin": True})
+    query = f"format={args.format}&gzip={'true' if args.gzip else 'false'}"
+    # Warm up imports, pools and caches so they don't count towards the first size
+    asyncio.run(export(token, query))
+
+    peaks = []
+    print(f"{'rows':>10} {'bytes':>14} {'seconds':>8} {'peak KiB':>10}")
+    for rows in sorted(args.rows):
+        grow_bookings(rows)
+        tracemalloc.start()
+        started = time.perf_counter()
+        status, size = asyncio.run(export(token, query))
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        if status != 200:
+            print(f"❌ Export failed with status {status}")
+            return 1
+        peaks.append(peak)
+        print(f"{rows:>10} {size:>14} {elapsed:>8.2f} {peak / 1024:>10.0f}")
+
+    if peaks[-1] > peaks[0] * TOLERANCE:
+        print(f"❌ Peak memory grew {peaks[-1] / peaks[0]:.1f}x from {min(args.rows)} to {max(args.rows)} rows")
+        return 1
+    print(f"✅ Peak memory is flat ({peaks[-1] / peaks[0]:.2f}x from {min(args.rows)} to {max(args.rows)} rows)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main_())
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Index advisor: runs the API's routes against a synthetic dataset, captures
+every SELECT, UPDATE and DELETE they issue, replays each one through
+EXPLAIN QUERY PLAN and reports the plans that still scan a whole table.
+Exits with status 1 if any are found.
+
+Usage: python -m benchmarks.index_advisor [--agents 2000] [--verbose]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}/index_advisor.db"
+
+import sqlalchemy as sa
+from fastapi.testclient import TestClient
+
+import main
+from shared.auth.jwt import create_access_token, get_password_hash
+from shared.agent.card_table import rebuild as rebuild_agent_cards
+from shared.database import engine, read_engine, create_tables
+from shared.migrations import migrate
+from shared.user.models import User, Agent, AgentCategory, Booking, Category, Rating
+
+CENTER = (28.6139, 77.2090)
+CATEGORIES = 8
+# Lookup tables small enough that reading them whole is the right plan
+SMALL_TABLES = {"categories", "entity_versions", "schema_migrations"}
+# (scenario label, table) -> why scanning it whole is the intended plan
+ALLOWED_SCANS = {
+    ("app startup", "agents"): "ix_agents_present is partial: it only holds online or paused agents",
+    ("admin stats", "users"): "dashboard totals count every row; SQLite reads the narrowest index",
+    ("admin stats", "agents"): "dashboard totals count every row; SQLite reads the narrowest index",
+}
+
+def seed(agents):
+    create_tables()
+    migrate(engine)
+    now = datetime.utcnow().replace(microsecond=0)
+    password_hash = get_password_hash("x")  # one hash shared by every seeded user
+    users, agent_rows, links, bookings, ratings = [], [], [], [], []
+    for i in range(1, agents + 1):
+        lat = CENTER[0] + random.uniform(-0.3, 0.3)
+        lng = CENTER[1] + random.uniform(-0.3, 0.3)
+        users.append({"id": i, "name": f"Agent {i}", "email": f"agent{i}@example.com", "password_hash": password_hash,
+                      "location": f"{lat},{lng}", "is_agent": True, "is_admin": False})
+        agent_rows.append({"id": i, "user_id": i, "kyc_status": random.choice(("verified", "verified", "pending")),
+                           "is_online": i % 2 == 0, "rate_per_km": 20.0, "wallet_balance": 1000.0,
+                           "avg_rating": 4.0, "total_ratings": 10, "ranking_score": 3.75})
+        links.append({"agent_id": i, "category_id": 1 + i % CATEGORIES})
+    # Customers, each with a few bookings
+    customers = range(agents + 1, agents * 2 + 1)
+    for user_id in customers:
+        users.append({"id": user_id, "name": f"User {user_id}", "email": f"user{user_id}@example.com",
+                      "password_hash": password_hash, "location": f"{CENTER[0]},{CENTER[1]}", "is_agent": False, "is_admin": False})
+        for _ in range(3):
+            agent_id = random.randint(1, agents)
+            status = random.choice(("pending", "accepted", "completed", "completed", "cancelled"))
+            bookings.append({"id": len(bookings) + 1, "user_id": user_id, "agent_id": agent_id,
+                             "category_id": 1 + agent_id % CATEGORIES, "status": status,
+                             "scheduled_time": now + timedelta(minutes=30 * random.randrange(-48 * 30, 48 * 7)),
+                             "visit_charge": 100.0, "user_location": "0,0", "address": "x"})
+            if status == "completed":
+                ratings.append({"booking_id": len(bookings), "rating": random.randint(1, 5)})
+    users.append({"id": agents * 2 + 1, "name": "Admin", "email": "admin@example.com", "password_hash": password_hash,
+                  "location": None, "is_agent": False, "is_admin": True})
+    with engine.begin() as connection:
+        connection.execute(sa.insert(Category), [{"id": n, "name": f"Category {n}"} for n in range(1, CATEGORIES + 1)])
+        connection.execute(sa.insert(User), users)
+        connection.execute(sa.insert(Agent), agent_rows)
+        connection.execute(sa.insert(AgentCategory), links)
+        connection.execute(sa.insert(Booking), bookings)
+        connection.execute(sa.insert(Rating), ratings)
+        # Core inserts skip the ORM hooks that keep agent_cards current
+        rebuild_agent_cards(connection)
+    return customers[0], agents * 2 + 1
+
+def scenario(customer_id, admin_id):
+    """(label, method, path, request kwargs, who) covering the routes"""
+    booking = {"agent_id": 2, "category_id": 1 + 2 % CATEGORIES, "latitude": CENTER[0], "longitude": CENTER[1], "address": "x"}
+    near = {"latitude": CENTER[0], "longitude": CENTER[1]}
+    return [
+        ("login", "POST", "/api/auth/login", {"data": {"username": "agent2@example.com", "password": "x"}}, None),
+        ("password reset request", "POST", "/api/auth/request-password-reset", {"json": "agent2@example.com"}, None),
+        ("password reset", "POST", "/api/auth/reset-password", {"json": {"token": "nope", "new_password": "x"}}, None),
+        ("current user", "GET", "/api/users/me", {}, "customer"),
+        ("user profile", "GET", f"/api/users/{customer_id}", {}, "customer"),
+        ("categories", "GET", "/api/categories/", {}, None),
+        ("featured categories", "GET", "/api/categories/featured", {}, None),
+        ("category", "GET", "/api/categories/1", {}, None),
+        ("agents", "GET", "/api/agents/", {"params": {"category_id": 1}}, None),
+        ("agents near", "GET", "/api/agents/", {"params": near}, None),
+        ("nearby", "GET", "/api/agents/nearby", {"params": {**near, "category_id": 2}}, None),
+        ("search", "GET", "/api/agents/search", {"params": {"query": "agent 1", **near}}, None),
+        ("available", "GET", "/api/agents/available",
+         {"params": {**near, "start": (datetime.utcnow() + timedelta(days=1)).isoformat()}}, None),
+        ("map clusters", "GET", "/api/agents/map/clusters",
+         {"params": {"min_lat": 28.3, "min_lng": 76.9, "max_lat": 28.9, "max_lng": 77.5, "zoom": 10}}, None),
+        ("changes", "GET", "/api/agents/changes", {"params": {"since": 10}}, None),
+        ("agent", "GET", "/api/agents/3", {}, None),
+        ("agents batch", "GET", "/api/agents/batch", {"params": {"ids": "4,5,6"}}, None),
+        ("agent profile", "GET", "/api/agents/profile/2", {}, None),
+        ("agent stats", "GET", "/api/agents/stats", {}, "agent"),
+        ("agent status", "PUT", "/api/agents/status", {"json": {"is_online": True}}, "agent"),
+        ("agent location", "PUT", "/api/agents/location", {"json": {"latitude": CENTER[0], "longitude": CENTER[1]}}, "agent"),
+        ("heartbeat", "POST", "/api/agents/heartbeat", {}, "agent"),
+        ("create booking", "POST", "/api/bookings/", {"json": booking}, "customer"),
+        ("booking", "GET", "/api/bookings/1", {}, "customer"),
+        ("history", "GET", "/api/bookings/history", {}, "customer"),
+        ("history upcoming", "GET", "/api/bookings/history",
+         {"params": {"status": "upcoming", "cursor": f"{datetime.utcnow().isoformat()},1"}}, "customer"),
+        ("agent history", "GET", "/api/bookings/agent/history",
+         {"params": {"cursor": f"{datetime.utcnow().isoformat()},1"}}, "agent"),
+        ("agent history cancelled", "GET", "/api/bookings/agent/history", {"params": {"status": "cancelled"}}, "agent"),
+        ("accept booking", "PUT", "/api/bookings/{booking}/accept", {}, "agent"),
+        ("complete booking", "PUT", "/api/bookings/{booking}/status", {"json": {"status": "completed"}}, "agent"),
+        ("rate booking", "POST", "/api/bookings/{booking}/rating", {"json": {"rating": 5}}, "customer"),
+        ("suggest", "GET", "/api/search/suggest", {"params": {"q": "agen"}}, None),
+        ("admin kyc list", "GET", "/api/admin/agents-kyc", {"params": {"status": "pending"}}, "admin"),
+        ("admin kyc verify", "POST", "/api/admin/agent/kyc/verify", {"json": {"agent_id": 3, "status": "verified"}}, "admin"),
+        ("admin stats", "GET", "/api/admin/dashboard/stats", {}, "admin"),
+    ]
+
+class QueryLog:
+    """Statements by text, with the parameters and route of the first capture"""
+
+    def __init__(self):
+        self.statements = OrderedDict()
+        self.route = None
+        self.label = None
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        verb = statement.lstrip().split(None, 1)[0].upper()
+        if executemany or verb not in ("SELECT", "UPDATE", "DELETE") or statement in self.statements:
+            return
+        self.statements[statement] = (parameters, self.route, self.label)
+
+def full_scans(plan, label=None):
+    """
+    Plan rows that read a whole (non-small) table, directly or through one of
+    its indexes (SCAN ... USING [COVERING] INDEX walks every entry; only a
+    SEARCH is constrained), or that build a throwaway index on every run
+    because there is no real one
+    """
+    found = []
+    for row in plan:
+        detail = row[-1]
+        if " AUTOMATIC " in detail:
+            found.append(detail)
+            continue
+        if not detail.startswith("SCAN "):
+            continue
+        table = detail.split()[1]
+        if table not in SMALL_TABLES and (label, table) not in ALLOWED_SCANS:
+            found.append(detail)
+    return found
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--agents", type=int, default=2000)
+    parser.add_argument("--verbose", action="store_true", help="print every captured plan")
+    args = parser.parse_args()
+
+    random.seed(42)
+    customer_id, admin_id = seed(args.agents)
+    tokens = {
+        "customer": create_access_token({"sub": f"user{customer_id}@example.com"}),
+        "agent": create_access_token({"sub": "agent2@example.com"}),
+        "admin": create_access_token({"sub": "admin@example.com", "is_admin": True}),
+    }
+
+    log = QueryLog()
+    for bound in (engine, read_engine):
+        sa.event.listen(bound, "before_cursor_execute", log)
+    booking_id = None
+    log.route = log.label = "app startup"
+    with TestClient(main.app) as client:
+        for label, method, path, kwargs, who in scenario(customer_id, admin_id):
+            log.route = f"{method} {path.split('?')[0]} ({label})"
+            log.label = label
+            headers = {"Authorization": f"Bearer {tokens[who]}"} if who else {}
+            response = client.request(method, path.format(booking=booking_id), headers=headers, **kwargs)
+            if label == "create booking" and response.status_code == 200:
+                booking_id = response.json()["id"]
+            if response.status_code >= 500:
+                print(f"⚠️  {log.route} failed with {response.status_code}")
+    for bound in (engine, read_engine):
+        sa.event.remove(bound, "before_cursor_execute", log)
+
+    findings = []
+    with engine.connect() as connection:
+        for statement, (parameters, route, label) in log.statements.items():
+            plan = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+            scans = full_scans(plan, label)
+            if args.verbose:
+                print(f"{route}\n  {' '.join(statement.split())[:160]}")
+                for row in plan:
+                    print(f"    {row[-1]}")
+            if scans:
+                findings.append((route, statement, scans))
+
+    print(f"{len(log.statements)} distinct statements from {len(scenario(customer_id, admin_id))} requests "
+          f"over {args.agents} agents")
+    if not findings:
+        print("✅ No full table scans")
+        return 0
+    print(f"❌ {len(findings)} statements scan a whole table:")
+    for route, statement, scans in findings:
+        print(f"\n{route}\n  {' '.join(statement.split())[:300]}")
+        for detail in scans:
+            print(f"    {detail}")
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main_())
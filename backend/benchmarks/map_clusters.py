@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Map clustering at scale: viewport queries at several zoom levels against
+the hierarchical grid, compared with clustering the full agent list per
+request, plus the cost of an incremental location update.
+
+Usage: python -m benchmarks.map_clusters [--agents 100000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}/map_clusters.db"
+
+import sqlalchemy as sa
+
+from shared.agent.clusters import AgentGrid, CELL_SHIFT, INDIVIDUAL_ZOOM, cell_of
+from shared.agent.card_table import card_columns
+from shared.agent.geo import agent_position
+from shared.database import engine, ReadSessionLocal, create_tables
+from shared.user.models import User, Agent
+
+CENTER = (28.6139, 77.2090)
+
+def seed(agents):
+    create_tables()
+    users, agent_rows = [], []
+    for i in range(1, agents + 1):
+        # Denser towards the centre, like a real city
+        lat = CENTER[0] + random.gauss(0, 0.12)
+        lng = CENTER[1] + random.gauss(0, 0.12)
+        users.append({"id": i, "name": f"Agent {i}", "email": f"agent{i}@example.com", "password_hash": "x",
+                      "location": f"{lat},{lng}", "is_agent": True})
+        agent_rows.append({"id": i, "user_id": i, "kyc_status": "verified", "rate_per_km": 20.0,
+                           "wallet_balance": 1000.0, "avg_rating": 4.0, "total_ratings": 10})
+    with engine.begin() as connection:
+        connection.execute(sa.insert(User), users)
+        connection.execute(sa.insert(Agent), agent_rows)
+
+def viewport(zoom):
+    # A phone screen is about 2 x 3 tiles of 256 px
+    width = 360.0 / (1 << zoom) * 2
+    height = 180.0 / (1 << zoom) * 3
+    lat = CENTER[0] + random.uniform(-0.05, 0.05)
+    lng = CENTER[1] + random.uniform(-0.05, 0.05)
+    return lat - height / 2, lng - width / 2, lat + height / 2, lng + width / 2
+
+def naive_clusters(min_lat, min_lng, max_lat, max_lng, zoom):
+    """Load every agent and bucket the visible ones per request"""
+    level = zoom + CELL_SHIFT
+    db = ReadSessionLocal()
+    try:
+        rows = card_columns(db).all()
+    finally:
+        db.close()
+    buckets = {}
+    for row in rows:
+        lat, lng = agent_position(row[0], row[-1])
+        if min_lat <= lat <= max_lat and min_lng <= lng <= max_lng:
+            entry = buckets.setdefault(cell_of(lat, lng, level), [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += lat
+            entry[2] += lng
+    return buckets
+
+def view(grid, box, zoom):
+    """What the endpoint returns: agents from INDIVIDUAL_ZOOM on if few enough, else clusters"""
+    if zoom >= INDIVIDUAL_ZOOM:
+        found = grid.agents_in(*box)
+        if found is not None:
+            return found
+    return grid.clusters(*box, zoom)
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[len(times) // 2] * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--agents", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    random.seed(42)
+    seed(args.agents)
+    grid = AgentGrid()
+    start = time.perf_counter()
+    grid.load()
+    print(f"{args.agents} agents, grid built in {time.perf_counter() - start:.2f}s, {grid.stats()['cells']} cells")
+
+    for zoom in (8, 11, 13, 15):
+        boxes = [viewport(zoom) for _ in range(args.repeat)]
+        boxes_iter = iter(boxes)
+        grid_ms = timed(lambda: view(grid, next(boxes_iter), zoom), args.repeat)
+        markers = len(view(grid, boxes[0], zoom))
+        naive_ms = timed(lambda: naive_clusters(*boxes[0], zoom), 3)
+        print(f"zoom {zoom:2d}  grid p50 {grid_ms:7.3f} ms  full scan {naive_ms:8.1f} ms  ({markers} markers in view)")
+
+    moves = [(random.randint(1, args.agents), CENTER[0] + random.gauss(0, 0.12), CENTER[1] + random.gauss(0, 0.12))
+             for _ in range(10000)]
+    start = time.perf_counter()
+    for agent_id, lat, lng in moves:
+        grid.move(agent_id, lat, lng)
+    print(f"location update  {(time.perf_counter() - start) / len(moves) * 1e6:.1f} us per move")
+
+if __name__ == "__main__":
+    main()
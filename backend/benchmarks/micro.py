@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks of backend hot paths, with stored baselines.
+
+Every case runs a fixed, seeded workload (distances, agent rows, tokens,
+passwords, a seeded category table) enough times per sample to take about
+SAMPLE_SECONDS, and keeps the fastest of REPEAT samples, with the garbage
+collector off; a case over the threshold is timed again before it counts
+as a regression. Times are also divided by a fixed pure-Python calibration
+loop run the same way, so a baseline recorded on one machine remains
+comparable on a faster or slower one.
+
+  run      time the cases and print them (--save stores them as the baseline)
+  compare  time the cases and exit with status 1 if any is slower than its
+           baseline by more than --threshold (relative to calibration)
+
+Baselines are kept in benchmarks/baselines/micro.json; re-save them when a
+change makes a hot path intentionally slower or faster.
+
+Usage: python -m benchmarks.micro run [--filter auth] [--save]
+       python -m benchmarks.micro compare [--threshold 1.25] [--filter auth]
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import warnings
+from datetime import timedelta
+from typing import Callable, Dict
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}/micro.db"
+
+import sqlalchemy as sa
+from fastapi import HTTPException
+
+from shared.agent.routes import AgentResponse, calculate_distance, _candidates, _rank_agents, _agent_response, _by_distance
+from shared.auth.jwt import create_access_token, verify_token, get_password_hash, verify_password
+from shared.category.routes import _category_rows, _category_dict
+from shared.database import engine, ReadSessionLocal, create_tables
+from shared.user.models import User, Agent, Category, AgentCategory
+
+# The development SECRET_KEY is short; that doesn't matter for timing
+warnings.filterwarnings("ignore", message="The HMAC key")
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "micro.json")
+SAMPLE_SECONDS = 0.2
+REPEAT = 7
+THRESHOLD = 1.25
+RETRIES = 2  # extra timings of a case over the threshold before it counts as a regression
+
+CENTER = (28.6139, 77.2090)
+AGENTS = 1000
+CATEGORIES = ["Home Cleaning", "Plumbing", "Electrical", "Carpentry", "Painting", "Appliance Repair", "Pest Control", "Gardening"]
+SEEDED_AGENTS = 20000
+
+# name -> setup returning (workload callable, items per call)
+CASES: Dict[str, Callable] = {}
+
+def case(name: str):
+    def register(setup):
+        CASES[name] = setup
+        return setup
+    return register
+
+def calibration():
+    """Fixed pure-Python work (arithmetic, dicts, strings) used as the unit of time"""
+    total, table = 0, {}
+    for i in range(2000):
+        total += i * i % 7
+        table[i & 255] = str(i)
+    return total, len(table)
+
+def seed():
+    create_tables()
+    rnd = random.Random(1)
+    with engine.begin() as connection:
+        connection.execute(sa.insert(Category), [{"id": i, "name": name, "description": f"{name} services",
+                                                  "icon_url": f"/icons/{i}.png"} for i, name in enumerate(CATEGORIES, 1)])
+        connection.execute(sa.insert(User), [{"id": i, "name": f"Agent {i}", "email": f"agent{i}@example.com",
+                                              "password_hash": "x", "is_agent": True} for i in range(1, SEEDED_AGENTS + 1)])
+        connection.execute(sa.insert(Agent), [{"id": i, "user_id": i, "kyc_status": "verified"}
+                                              for i in range(1, SEEDED_AGENTS + 1)])
+        connection.execute(sa.insert(AgentCategory), [
+            {"agent_id": i, "category_id": category_id}
+            for i in range(1, SEEDED_AGENTS + 1)
+            for category_id in rnd.sample(range(1, len(CATEGORIES) + 1), rnd.randint(1, 3))
+        ])
+
+def agent_rows(count=AGENTS):
+    """Fixed card_columns rows"""
+    rnd = random.Random(2)
+    return [
+        (i, i, f"Agent {i}", rnd.choice((15.0, 20.0, 25.0)), rnd.random() < 0.5, round(rnd.uniform(3, 5), 2),
+         rnd.randint(0, 200), round(rnd.uniform(3, 5), 2), CENTER[0] + rnd.gauss(0, 0.1), CENTER[1] + rnd.gauss(0, 0.1),
+         "," + ",".join(str(c) for c in sorted(rnd.sample(range(1, len(CATEGORIES) + 1), rnd.randint(1, 3)))) + ",")
+        for i in range(1, count + 1)
+    ]
+
+def candidates():
+    db = ReadSessionLocal()
+    try:
+        return _candidates(db, agent_rows())
+    finally:
+        db.close()
+
+# Cases
+
+@case("geo.calculate_distance")
+def _distance():
+    rnd = random.Random(3)
+    points = [(CENTER[0] + rnd.gauss(0, 0.1), CENTER[1] + rnd.gauss(0, 0.1)) for _ in range(AGENTS)]
+    def run():
+        for lat, lng in points:
+            calculate_distance(CENTER[0], CENTER[1], lat, lng)
+    return run, len(points)
+
+@case("agents.candidates")
+def _agent_candidates():
+    rows = agent_rows()
+    def run():
+        db = ReadSessionLocal()
+        try:
+            _candidates(db, rows, CENTER[0], CENTER[1], 25.0)
+        finally:
+            db.close()
+    return run, len(rows)
+
+@case("agents.rank_nearby")
+def _rank_nearby():
+    agents = candidates()
+    return (lambda: _rank_agents(agents, CENTER[0], CENTER[1], 25.0, _by_distance)), len(agents)
+
+@case("agents.agent_response")
+def _agent_responses():
+    agents = candidates()
+    def run():
+        for card in agents:
+            _agent_response(card, CENTER[0], CENTER[1])
+    return run, len(agents)
+
+@case("agents.response_model")
+def _response_models():
+    ranked = _rank_agents(candidates(), CENTER[0], CENTER[1])
+    def run():
+        for agent in ranked:
+            AgentResponse(**agent)
+    return run, len(ranked)
+
+@case("auth.create_access_token")
+def _create_token():
+    return (lambda: create_access_token({"sub": "agent1@example.com"}, timedelta(minutes=30))), 1
+
+@case("auth.verify_token")
+def _verify_token():
+    token = create_access_token({"sub": "agent1@example.com"}, timedelta(days=365))
+    exception = HTTPException(status_code=401)
+    return (lambda: verify_token(token, exception)), 1
+
+@case("auth.get_password_hash")
+def _hash_password():
+    return (lambda: get_password_hash("correct horse battery staple")), 1
+
+@case("auth.verify_password")
+def _verify_password():
+    hashed = get_password_hash("correct horse battery staple")
+    return (lambda: verify_password("correct horse battery staple", hashed)), 1
+
+@case("categories.all")
+def _all_categories():
+    def run():
+        db = ReadSessionLocal()
+        try:
+            [_category_dict(row) for row in _category_rows(db).all()]
+        finally:
+            db.close()
+    return run, len(CATEGORIES)
+
+@case("categories.featured")
+def _featured_categories():
+    def run():
+        db = ReadSessionLocal()
+        try:
+            [_category_dict(row) for row in _category_rows(db).order_by(sa.desc("agent_count")).limit(5).all()]
+        finally:
+            db.close()
+    return run, 5
+
+# Timing
+
+def best_time(fn: Callable) -> float:
+    """Fastest seconds per call over REPEAT samples of about SAMPLE_SECONDS each"""
+    fn()  # warm up
+    started = time.perf_counter()
+    fn()
+    once = max(time.perf_counter() - started, 1e-7)
+    number = max(1, int(SAMPLE_SECONDS / once))
+    best = None
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(REPEAT):
+            started = time.perf_counter()
+            for _ in range(number):
+                fn()
+            elapsed = (time.perf_counter() - started) / number
+            best = elapsed if best is None else min(best, elapsed)
+    finally:
+        if enabled:
+            gc.enable()
+    return best
+
+def measure(pattern: str = None) -> dict:
+    """Results by case, plus the workloads so compare() can time suspects again"""
+    workloads, seconds = {}, {}
+    unit = best_time(calibration)
+    for name, setup in CASES.items():
+        if pattern and pattern not in name:
+            continue
+        workloads[name] = setup()
+        seconds[name] = best_time(workloads[name][0])
+    # Calibrate before and after, so a slow spell during either doesn't skew every case
+    unit = min(unit, best_time(calibration))
+    results = {}
+    for name, (_, items) in workloads.items():
+        results[name] = {"us": round(seconds[name] * 1e6, 3), "items": items, "relative": round(seconds[name] / unit, 4)}
+        print(f"{name:<28} {seconds[name] * 1e6:>12.1f} us/call {seconds[name] * 1e9 / items:>12.0f} ns/item "
+              f"{seconds[name] / unit:>10.3f} x cal")
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "calibration_us": round(unit * 1e6, 3),
+        "cases": results,
+        "workloads": workloads,
+    }
+
+def load_baseline() -> dict:
+    with open(BASELINE_PATH) as f:
+        return json.load(f)
+
+def save_baseline(measured: dict, pattern: str = None):
+    measured = {key: value for key, value in measured.items() if key != "workloads"}
+    if pattern and os.path.exists(BASELINE_PATH):
+        # Only replace the cases that were run
+        baseline = load_baseline()
+        baseline["cases"].update(measured["cases"])
+        measured = {**measured, "cases": baseline["cases"]}
+    os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+    with open(BASELINE_PATH, "w") as f:
+        json.dump(measured, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"Saved {len(measured['cases'])} baselines to {os.path.relpath(BASELINE_PATH)}")
+
+def compare(measured: dict, baseline: dict, threshold: float) -> int:
+    unit = measured["calibration_us"] / 1e6
+    regressions = 0
+    print(f"\n{'case':<28} {'baseline':>10} {'now':>10} {'change':>8}")
+    for name, result in measured["cases"].items():
+        before = baseline["cases"].get(name)
+        if before is None:
+            print(f"{name:<28} {'-':>10} {result['relative']:>10.3f}      new")
+            continue
+        relative = result["relative"]
+        for _ in range(RETRIES):
+            if relative / before["relative"] <= threshold:
+                break
+            # Time a suspect again before failing on what may be a noisy moment
+            relative = min(relative, best_time(measured["workloads"][name][0]) / unit)
+        ratio = relative / before["relative"]
+        flag = ""
+        if ratio > threshold:
+            flag = " ❌"
+            regressions += 1
+        print(f"{name:<28} {before['relative']:>10.3f} {relative:>10.3f} {ratio - 1:>+8.1%}{flag}")
+    if regressions:
+        print(f"\n❌ {regressions} hot path(s) regressed by more than {threshold - 1:.0%}")
+        return 1
+    print(f"\n✅ No hot path regressed by more than {threshold - 1:.0%}")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("command", choices=("run", "compare"))
+    parser.add_argument("--filter", help="only cases whose name contains this")
+    parser.add_argument("--save", action="store_true", help="run: store the results as the baseline")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="compare: allowed slowdown factor")
+    args = parser.parse_args()
+
+    if args.command == "compare" and not os.path.exists(BASELINE_PATH):
+        print(f"No baseline at {os.path.relpath(BASELINE_PATH)}; record one with: python -m benchmarks.micro run --save")
+        return 1
+    seed()
+    measured = measure(args.filter)
+    if args.command == "run":
+        if args.save:
+            save_baseline(measured, args.filter)
+        return 0
+    return compare(measured, load_baseline(), args.threshold)
+
+if __name__ == "__main__":
+    sys.exit(main())
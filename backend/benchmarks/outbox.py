@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Notification outbox throughput with the local stand-in provider: the cost
+a handler pays to queue a message (one outbox insert in its transaction)
+against calling a provider inline, and how fast the dispatcher drains a
+backlog in batches, including retries of simulated provider failures.
+Exits with status 1 if any message is left undelivered.
+
+Usage: python -m benchmarks.outbox [--messages 20000] [--latency-ms 20] [--failure-rate 0.05]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}/outbox.db"
+
+import sqlalchemy as sa
+
+from shared.database import engine, create_tables
+from shared.notify.dispatcher import OutboxDispatcher
+from shared.notify.outbox import OutboxMessage, notify, EMAIL, PUSH
+from shared.notify.providers import LocalProvider
+from shared.user.models import User
+from shared.writer import write_queue
+
+USERS = 1000
+HANDLER_SAMPLES = 200
+
+def seed():
+    create_tables()
+    with engine.begin() as connection:
+        connection.execute(sa.insert(User), [
+            {"id": i, "name": f"User {i}", "email": f"user{i}@example.com", "password_hash": "x",
+             "push_token": f"ExponentPushToken[{i}]"}
+            for i in range(1, USERS + 1)
+        ])
+
+def queue(count, offset=0):
+    """A transaction queuing count booking reminders"""
+    def run(db):
+        users = db.query(User).filter(User.id.in_([1 + (offset + n) % USERS for n in range(count)])).all()
+        by_id = {user.id: user for user in users}
+        for n in range(count):
+            notify(db, by_id[1 + (offset + n) % USERS], "booking.reminder", category="Plumbing", time="10:00")
+    return run
+
+async def handler_latency(provider):
+    """Median seconds of a one-message handler: queued in the outbox vs. sent inline"""
+    queued, inline = [], []
+    for n in range(HANDLER_SAMPLES):
+        started = time.perf_counter()
+        await write_queue.run(queue(1, n))
+        queued.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        await write_queue.run(lambda db: None)
+        await provider.send([OutboxMessage(id=n, address="x", subject="s", body="b")])
+        inline.append(time.perf_counter() - started)
+    with engine.begin() as connection:
+        connection.execute(sa.delete(OutboxMessage))
+    return statistics.median(queued), statistics.median(inline)
+
+def remaining():
+    with engine.connect() as connection:
+        return dict(connection.execute(
+            sa.select(OutboxMessage.status, sa.func.count()).group_by(OutboxMessage.status)
+        ).all())
+
+async def run(args):
+    write_queue.start()
+    latency, failure_rate = args.latency_ms / 1000, args.failure_rate
+
+    queued, inline = await handler_latency(LocalProvider(PUSH, latency, 0.0))
+    print(f"Handler with one notification: queued {queued * 1000:.2f} ms, inline provider call {inline * 1000:.2f} ms")
+
+    # The backlog is queued before the dispatcher starts, in transactions of 1000
+    for offset in range(0, args.messages, 1000):
+        await write_queue.run(queue(min(1000, args.messages - offset), offset))
+
+    providers = {PUSH: LocalProvider(PUSH, latency, failure_rate), EMAIL: LocalProvider(EMAIL, latency, failure_rate)}
+    dispatcher = OutboxDispatcher(providers=providers, retry_delay=0.05, max_retry_delay=0.5, poll_interval=0.05)
+    started = time.perf_counter()
+    await dispatcher.start()
+    while True:
+        await asyncio.sleep(0.1)
+        counts = remaining()
+        if not counts.get("pending") and not counts.get("sending"):
+            break
+    elapsed = time.perf_counter() - started
+    await dispatcher.stop()
+    write_queue.stop()
+
+    stats = dispatcher.stats()
+    print(f"Drained {args.messages} messages in {elapsed:.2f}s ({args.messages / elapsed:,.0f} msg/s) "
+          f"in {stats['batches']} provider batches; {stats['retried']} retries, {stats['failed']} failed")
+    if counts.get("sent", 0) != args.messages:
+        print(f"❌ Not all messages were delivered: {counts}")
+        return 1
+    print("✅ Every message was delivered")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="simulated provider round trip per batch")
+    parser.add_argument("--failure-rate", type=float, default=0.05, help="share of sends that fail (retryably)")
+    args = parser.parse_args()
+    seed()
+    return asyncio.run(run(args))
+
+if __name__ == "__main__":
+    sys.exit(main())
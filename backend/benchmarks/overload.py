@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Overload test: flood the API with agent listing scans and logins while an
+agent keeps sending status updates, with and without admission control.
+Reports status-update latency and how many flood requests were shed.
+
+Usage: python -m benchmarks.overload [--agents 2000] [--flood 400]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}/overload.db"
+
+import httpx
+
+import main
+from shared.admission import AdmissionControlMiddleware
+from shared.auth.jwt import create_access_token, get_password_hash
+from shared.database import SessionLocal, create_tables
+from shared.user.models import User, Agent
+from shared.writer import write_queue
+
+def seed(agents):
+    create_tables()
+    db = SessionLocal()
+    password_hash = get_password_hash("secret")
+    for i in range(agents):
+        user = User(name=f"Agent {i}", email=f"agent{i}@example.com", password_hash=password_hash)
+        db.add(user)
+        db.flush()
+        db.add(Agent(user_id=user.id, kyc_status="verified", is_online=i % 2 == 0))
+    db.commit()
+    db.close()
+
+def without_admission(app):
+    app.user_middleware = [m for m in app.user_middleware if m.cls is not AdmissionControlMiddleware]
+    app.middleware_stack = None  # rebuilt on the next request
+
+async def run(app, flood, updates):
+    transport = httpx.ASGITransport(app=app, client=("10.0.0.1", 1234))
+    token = create_access_token({"sub": "agent0@example.com"})
+    headers = {"Authorization": f"Bearer {token}"}
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        async def flood_request(i):
+            if i % 4 == 0:
+                response = await client.post("/api/auth/login", data={"username": f"agent{i}@example.com", "password": "secret"})
+            else:
+                response = await client.get("/api/agents/", params={"latitude": 28.7, "longitude": 77.1})
+            return response.status_code
+
+        async def status_update(i):
+            await asyncio.sleep(i * 0.01)
+            start = time.perf_counter()
+            response = await client.put("/api/agents/status", json={"is_online": i % 2 == 0}, headers=headers)
+            assert response.status_code == 200, response.text
+            return time.perf_counter() - start
+
+        flood_tasks = [asyncio.create_task(flood_request(i)) for i in range(flood)]
+        latencies = sorted(await asyncio.gather(*(status_update(i) for i in range(updates))))
+        codes = await asyncio.gather(*flood_tasks)
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+    shed = sum(1 for code in codes if code in (429, 503))
+    print(f"  status p50 {pct(0.5):8.1f} ms  p95 {pct(0.95):8.1f} ms  max {latencies[-1] * 1000:8.1f} ms  "
+          f"| flood: {len(codes) - shed} served, {shed} shed")
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--agents", type=int, default=2000)
+    parser.add_argument("--flood", type=int, default=400)
+    parser.add_argument("--updates", type=int, default=50)
+    args = parser.parse_args()
+
+    seed(args.agents)
+    write_queue.start()
+    print(f"{args.agents} agents, {args.flood} flood requests, {args.updates} status updates")
+    print("with admission control")
+    asyncio.run(run(main.app, args.flood, args.updates))
+    without_admission(main.app)
+    print("without admission control")
+    asyncio.run(run(main.app, args.flood, args.updates))
+    write_queue.stop()
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Nearby-search load from users clustered in a few neighbourhoods, with the
+quantized-location result cache and with it effectively disabled (TTL 0).
+Reports hit rate and request latency.
+
+Usage: python -m benchmarks.result_cache [--agents 5000] [--requests 2000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}/result_cache.db"
+
+import httpx
+
+import main
+from shared.admission import AdmissionControlMiddleware
+from shared.agent.result_cache import agent_results
+from shared.database import SessionLocal, create_tables
+from shared.user.models import User, Agent
+
+# Neighbourhood centres around Delhi
+NEIGHBOURHOODS = [(28.6139, 77.2090), (28.5355, 77.3910), (28.4595, 77.0266), (28.7041, 77.1025), (28.6692, 77.4538)]
+
+def jitter(center, km):
+    lat, lng = center
+    return lat + random.uniform(-km, km) / 111.0, lng + random.uniform(-km, km) / 98.0
+
+def seed(agents):
+    create_tables()
+    db = SessionLocal()
+    for i in range(agents):
+        lat, lng = jitter(NEIGHBOURHOODS[i % len(NEIGHBOURHOODS)], 15.0)
+        user = User(name=f"Agent {i}", email=f"agent{i}@example.com", password_hash="x", location=f"{lat},{lng}")
+        db.add(user)
+        db.flush()
+        db.add(Agent(user_id=user.id, kyc_status="verified", is_online=True))
+    db.commit()
+    db.close()
+
+async def run(app, requests, concurrency):
+    transport = httpx.ASGITransport(app=app)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        async def nearby():
+            # Users stay within a few hundred metres of their neighbourhood centre
+            lat, lng = jitter(random.choice(NEIGHBOURHOODS), 0.3)
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get("/api/agents/nearby", params={"latitude": lat, "longitude": lng, "radius": 5})
+                latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.text
+
+        await asyncio.gather(*(nearby() for _ in range(requests)))
+
+    latencies.sort()
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+    stats = agent_results.stats()
+    print(f"  p50 {pct(0.5):7.2f} ms  p95 {pct(0.95):7.2f} ms  max {latencies[-1] * 1000:7.2f} ms  "
+          f"| hit rate {stats['hit_rate']:.1%} ({stats['hits']} hits, {stats['coalesced']} coalesced, {stats['misses']} misses)")
+
+def reset(ttl):
+    agent_results.clear()
+    agent_results.ttl = ttl
+    agent_results.hits = agent_results.misses = agent_results.coalesced = 0
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--agents", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    random.seed(42)
+    seed(args.agents)
+    # Measure the cache, not load shedding
+    main.app.user_middleware = [m for m in main.app.user_middleware if m.cls is not AdmissionControlMiddleware]
+    print(f"{args.agents} agents, {args.requests} nearby requests from {len(NEIGHBOURHOODS)} neighbourhoods, "
+          f"concurrency {args.concurrency}")
+    ttl = agent_results.ttl
+    print("without result cache")
+    reset(0)
+    asyncio.run(run(main.app, args.requests, args.concurrency))
+    print(f"with result cache (ttl {ttl:g}s)")
+    reset(ttl)
+    asyncio.run(run(main.app, args.requests, args.concurrency))
+
+if __name__ == "__main__":
+    main_()
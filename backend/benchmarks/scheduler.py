@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Job scheduler at scale: seed a large number of pending jobs spread over the
+coming week plus a batch that is already due, then measure the refill query
+and how fast the due batch drains.
+
+Usage: python -m benchmarks.scheduler [--pending 300000] [--due 5000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}/scheduler.db"
+
+import sqlalchemy as sa
+
+from shared.database import engine, create_tables
+from shared.scheduler import JobScheduler
+from shared.user.models import Job
+from shared.writer import write_queue
+
+def seed(pending, due):
+    create_tables()
+    now = datetime.utcnow()
+    rows = [
+        {"kind": "bench.noop", "payload": {"n": i}, "status": "pending", "attempts": 0, "max_attempts": 5,
+         "run_at": now + timedelta(seconds=random.uniform(120, 7 * 86400))}
+        for i in range(pending)
+    ] + [
+        {"kind": "bench.noop", "payload": {"n": i}, "status": "pending", "attempts": 0, "max_attempts": 5,
+         "run_at": now - timedelta(seconds=random.uniform(0, 60))}
+        for i in range(due)
+    ]
+    with engine.begin() as connection:
+        connection.execute(sa.insert(Job), rows)
+
+def refill_query(batch_size):
+    """Plan and timing of the scheduler's due-jobs query"""
+    horizon = datetime.utcnow() + timedelta(seconds=60)
+    query = sa.select(Job.run_at, Job.id).where(
+        Job.status == "pending", Job.run_at <= horizon
+    ).order_by(Job.run_at).limit(batch_size)
+    compiled = query.compile(engine, compile_kwargs={"literal_binds": True})
+    with engine.connect() as connection:
+        plan = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}").all()
+        start = time.perf_counter()
+        connection.execute(query).all()
+        elapsed = time.perf_counter() - start
+    return "; ".join(row[-1] for row in plan), elapsed * 1000
+
+async def drain(scheduler, due):
+    runs = 0
+
+    @scheduler.handler("bench.noop")
+    def noop(db, n):
+        nonlocal runs
+        runs += 1
+
+    start = time.perf_counter()
+    await scheduler.start()
+    while runs < due:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    await scheduler.stop()
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pending", type=int, default=300000)
+    parser.add_argument("--due", type=int, default=5000)
+    args = parser.parse_args()
+
+    random.seed(42)
+    seed(args.pending, args.due)
+    write_queue.start()
+    scheduler = JobScheduler()
+    print(f"{args.pending} future jobs, {args.due} due")
+    plan, refill_ms = refill_query(scheduler.batch_size)
+    print(f"refill query: {refill_ms:.1f} ms for {scheduler.batch_size} jobs, plan: {plan}")
+    elapsed = asyncio.run(drain(scheduler, args.due))
+    write_queue.stop()
+    print(f"drained {args.due} due jobs in {elapsed:.2f}s ({args.due / elapsed:,.0f} jobs/s)")
+
+if __name__ == "__main__":
+    main()
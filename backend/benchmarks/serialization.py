@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Per-item serialization cost of agent list responses: the previous path
+(AgentResponse per row, re-validated and encoded by FastAPI's response_model
+handling) vs. plain dicts rendered by FastJSONResponse.
+
+Usage: python -m benchmarks.serialization [--items 1000] [--repeat 20]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+
+from shared.agent.routes import AgentResponse
+from shared.responses import FastJSONResponse, orjson
+
+def make_rows(count):
+    return [
+        (i, i + 1000, f"Agent {i}", 20.0 + i % 30, i % 2 == 0, 4.0 + (i % 10) / 10, i % 300, round(i % 250 / 10, 2),
+         ["Home Cleaning", "Electrical"] if i % 3 else ["Plumbing"])
+        for i in range(count)
+    ]
+
+def pydantic_path(rows):
+    result = [
+        AgentResponse(
+            id=agent_id,
+            user_id=user_id,
+            name=name,
+            rate_per_km=rate,
+            is_online=online,
+            avg_rating=rating,
+            total_ratings=total,
+            distance_km=distance,
+            categories=categories
+        )
+        for agent_id, user_id, name, rate, online, rating, total, distance, categories in rows
+    ]
+    result.sort(key=lambda x: x.distance_km)
+    # What response_model does with the returned objects: validate, encode, dump
+    validated = [AgentResponse.model_validate(item.model_dump()) for item in result]
+    return json.dumps(jsonable_encoder(validated)).encode("utf-8")
+
+def fast_path(rows):
+    result = [
+        {
+            "id": agent_id,
+            "user_id": user_id,
+            "name": name,
+            "rate_per_km": rate,
+            "is_online": online,
+            "avg_rating": rating,
+            "total_ratings": total,
+            "distance_km": distance,
+            "categories": categories
+        }
+        for agent_id, user_id, name, rate, online, rating, total, distance, categories in rows
+    ]
+    result.sort(key=lambda x: x["distance_km"])
+    return FastJSONResponse(result).body
+
+def per_item_us(fn, rows, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(rows)
+        best = min(best, time.perf_counter() - start)
+    return best / len(rows) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rows = make_rows(args.items)
+    assert json.loads(pydantic_path(rows)) == json.loads(fast_path(rows)), "payloads differ"
+
+    slow = per_item_us(pydantic_path, rows, args.repeat)
+    fast = per_item_us(fast_path, rows, args.repeat)
+    encoder = "orjson" if orjson is not None else "json (orjson not installed)"
+    print(f"{args.items} agents, best of {args.repeat}, encoder: {encoder}")
+    print(f"pydantic + response_model  {slow:8.2f} us/item")
+    print(f"dicts + FastJSONResponse   {fast:8.2f} us/item  ({slow / fast:.1f}x faster)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Autocomplete latency on a large index: synthetic agent names plus the
+seed categories, queried with prefixes, multi-word input and typos.
+
+Usage: python -m benchmarks.suggest [--agents 100000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.search.index import SuggestIndex, AGENT_DOC, CATEGORY_DOC
+
+FIRST = ["Rajesh", "Priya", "Amit", "Sunita", "Vikram", "Anjali", "Rahul", "Neha", "Suresh", "Kavita",
+         "Manoj", "Pooja", "Arjun", "Deepa", "Sanjay", "Meera", "Ravi", "Shalini", "Karan", "Nisha"]
+LAST = ["Kumar", "Sharma", "Singh", "Patel", "Gupta", "Verma", "Reddy", "Nair", "Iyer", "Joshi",
+        "Mehta", "Chopra", "Malhotra", "Bose", "Das", "Rao", "Pillai", "Kapoor", "Saxena", "Agarwal"]
+CATEGORIES = [
+    ("Home Cleaning", "Professional home cleaning services"),
+    ("Plumbing", "Plumbing repairs and maintenance"),
+    ("Electrical", "Electrical repairs and installations"),
+    ("Carpentry", "Furniture repair and woodwork"),
+    ("Painting", "Interior and exterior painting"),
+    ("AC Service", "Air conditioner repair and servicing"),
+]
+QUERIES = ["p", "pl", "plu", "plumbr", "elec", "electrcal", "raj", "rajsh", "priya sh", "amit si",
+           "home cl", "clening", "kumr", "sharm", "vikram r", "ac ser", "paintng", "z", "xyzzy"]
+
+def build(agents):
+    index = SuggestIndex()
+    for category_id, (name, description) in enumerate(CATEGORIES, 1):
+        index.put(CATEGORY_DOC, category_id, name, 0.1, description)
+    for agent_id in range(1, agents + 1):
+        # A numeric-free but varied name: some agents have a middle initial or business name
+        name = f"{random.choice(FIRST)} {random.choice(LAST)}"
+        if agent_id % 7 == 0:
+            name += f" {random.choice(['Services', 'Repairs', 'Works', 'Solutions'])}"
+        index.put(AGENT_DOC, agent_id, name, 0.01 * random.uniform(3, 5) * random.random())
+    return index
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--agents", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    random.seed(42)
+    start = time.perf_counter()
+    index = build(args.agents)
+    print(f"{args.agents} agents indexed in {time.perf_counter() - start:.2f}s: {index.stats()}")
+    for query in QUERIES:
+        index.suggest(query)  # warm the per-token ranking cache
+
+    all_times = []
+    for query in QUERIES:
+        times = []
+        for _ in range(args.repeat):
+            begin = time.perf_counter()
+            results = index.suggest(query, 10)
+            times.append(time.perf_counter() - begin)
+        times.sort()
+        all_times += times
+        top = results[0]["text"] if results else "-"
+        print(f"  {query!r:14} p50 {times[len(times) // 2] * 1e6:7.1f} us  top: {top}")
+    all_times.sort()
+    print(f"all queries: p50 {all_times[len(all_times) // 2] * 1e6:.1f} us, "
+          f"p99 {all_times[int(len(all_times) * 0.99)] * 1e6:.1f} us")
+
+    # Incremental update: rename an agent
+    begin = time.perf_counter()
+    for agent_id in range(1, 1001):
+        index.put(AGENT_DOC, agent_id, f"{random.choice(FIRST)} {random.choice(LAST)}", 0.02)
+    print(f"update: {(time.perf_counter() - begin) * 1000:.1f} us per document")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Write contention benchmark: concurrent agent status updates committed on
+per-request sessions (the old handler pattern) vs. funnelled through the
+single-writer queue with group commit.
+
+Usage: python -m benchmarks.write_contention [--threads 32] [--writes 50]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from shared.database import Base, sqlite_connect_args
+from shared.user.models import User, Agent
+from shared.writer import WriteQueue
+
+def make_session_factory(path):
+    engine = create_engine(f"sqlite:///{path}", connect_args=sqlite_connect_args)
+
+    @event.listens_for(engine, "connect")
+    def _wal(dbapi_connection, connection_record):
+        dbapi_connection.execute("PRAGMA journal_mode=WAL")
+        dbapi_connection.execute("PRAGMA synchronous=NORMAL")
+
+    Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+def seed(session_factory, agents):
+    db = session_factory()
+    for i in range(agents):
+        user = User(name=f"Agent {i}", email=f"agent{i}@example.com", password_hash="x")
+        db.add(user)
+        db.flush()
+        db.add(Agent(user_id=user.id, kyc_status="verified"))
+    db.commit()
+    db.close()
+
+def set_status(db, agent_id, online):
+    agent = db.query(Agent).filter(Agent.id == agent_id).first()
+    agent.is_online = online
+
+def run_direct(session_factory, writes, agent_id, latencies):
+    for i in range(writes):
+        start = time.perf_counter()
+        db = session_factory()
+        try:
+            set_status(db, agent_id, i % 2 == 0)
+            db.commit()
+        finally:
+            db.close()
+        latencies.append(time.perf_counter() - start)
+
+def run_queued(writer, writes, agent_id, latencies):
+    for i in range(writes):
+        start = time.perf_counter()
+        writer.submit(lambda db, online=i % 2 == 0: set_status(db, agent_id, online)).result()
+        latencies.append(time.perf_counter() - start)
+
+def measure(label, target, threads):
+    latencies = []
+    workers = [
+        threading.Thread(target=target, args=(agent_id, latencies))
+        for agent_id in range(1, threads + 1)
+    ]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+    print(
+        f"{label:<8} {len(latencies) / elapsed:>9.0f} writes/s  "
+        f"p50 {statistics.median(latencies) * 1000:7.2f} ms  "
+        f"p95 {pct(0.95):7.2f} ms  p99 {pct(0.99):7.2f} ms  max {latencies[-1] * 1000:7.2f} ms"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--writes", type=int, default=50, help="writes per thread")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, session_factory = make_session_factory(os.path.join(tmp, "contention.db"))
+        seed(session_factory, args.threads)
+
+        print(f"{args.threads} threads x {args.writes} status updates")
+        measure("direct", lambda *a: run_direct(session_factory, args.writes, *a), args.threads)
+
+        writer = WriteQueue(session_factory=session_factory)
+        writer.start()
+        measure("queued", lambda *a: run_queued(writer, args.writes, *a), args.threads)
+        writer.stop()
+        print(f"queued writes committed in {writer.batches} transactions")
+        engine.dispose()
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,30 @@ from shared.auth.routes import router as auth_router
 from shared.admin.routes import router as admin_router
 from shared.category.routes import router as category_router
 from shared.agent.routes import router as agent_router
-from shared.database import engine, Base
+from shared.booking.routes import router as booking_router
+from shared.search.routes import router as search_router
+from shared.batch import router as batch_router
+from shared.database import engine, read_engine, Base, create_tables
+from shared.migrations import migrate
+from shared.writer import write_queue
+from shared.admission import AdmissionControlMiddleware
+from shared.events import change_bus
+from shared.agent.presence import presence
+from shared.scheduler import scheduler
+from shared.agent.availability import availability
+from shared.agent.clusters import agent_grid
+from shared.search.index import suggest_index
+from shared.changefeed import backfill as backfill_agent_changes
+from shared.booking.jobs import schedule_archival
+from shared.auth.jobs import schedule_token_sweep
+from shared.auth.revocation import revocations
+from shared.agent.snapshot import agent_snapshot
+from shared.notify.dispatcher import dispatcher
+from shared.notify.jobs import schedule_outbox_sweep
+from shared.notify.routes import router as notify_router
+from fastapi.concurrency import run_in_threadpool
+import os
+import tempfile
 import time
 import logging
 
@@ -20,6 +43,9 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Bound concurrency per route class; added before CORS so rejections still carry CORS headers
+app.add_middleware(AdmissionControlMiddleware)
+
 # Configure CORS with optimized settings
 app.add_middleware(
     CORSMiddleware,
@@ -40,17 +66,69 @@ async def startup_event():
         connection = engine.connect()
         connection.close()
         logger.info("✅ Database connection verified")
+        
+        # Create any tables added since the database was initialized
+        create_tables()
+        # and bring existing tables up to date
+        applied = migrate(engine)
+        if applied:
+            logger.info(f"✅ Applied schema migrations {applied}")
     except Exception as e:
         logger.error(f"❌ Database connection failed: {e}")
         raise e
     
+    # Start the single database writer
+    write_queue.start()
+    logger.info("✅ Database writer started")
+    
+    # Put agents that predate the change feed into it
+    added = await write_queue.run(backfill_agent_changes)
+    if added:
+        logger.info(f"✅ Added {added} agents to the change feed")
+    
+    # Load revoked access tokens for the per-request check
+    await revocations.start()
+    
+    # Track agent heartbeats and offline_until windows
+    await presence.start()
+    logger.info("✅ Presence tracker started")
+    
+    # Build the agent calendar index from upcoming bookings
+    await run_in_threadpool(availability.load)
+    # and the map clustering grid from agent positions
+    await run_in_threadpool(agent_grid.load)
+    # and the search autocomplete index
+    await run_in_threadpool(suggest_index.load)
+    
+    # Share one agent snapshot between workers (when AGENT_SNAPSHOT_PATH is set)
+    await agent_snapshot.start()
+    
+    # Run due jobs (booking expiry, reminders, agent cooldowns, archival, token and outbox sweeps)
+    await write_queue.run(schedule_archival)
+    await write_queue.run(schedule_token_sweep)
+    await write_queue.run(schedule_outbox_sweep)
+    await scheduler.start()
+    logger.info("✅ Job scheduler started")
+    
+    # Deliver queued push and email notifications
+    await dispatcher.start()
+    logger.info("✅ Notification dispatcher started")
+    
     logger.info("✅ ClickO API startup complete")
 
 # Shutdown event
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("🛑 Shutting down ClickO API...")
+    await dispatcher.stop()
+    await scheduler.stop()
+    await presence.stop()
+    await agent_snapshot.stop()
+    await revocations.stop()
+    write_queue.stop()
+    change_bus.stop()
     engine.dispose()
+    read_engine.dispose()
     logger.info("✅ ClickO API shutdown complete")
 
 # Include routers
@@ -59,6 +137,10 @@ app.include_router(user_router, prefix="/api")
 app.include_router(admin_router, prefix="/api")
 app.include_router(category_router, prefix="/api")
 app.include_router(agent_router, prefix="/api")
+app.include_router(booking_router, prefix="/api")
+app.include_router(search_router, prefix="/api")
+app.include_router(batch_router, prefix="/api")
+app.include_router(notify_router, prefix="/api")
 
 @app.get("/")
 async def root():
@@ -91,10 +173,21 @@ async def api_status():
         "endpoints": {
             "auth": "/api/auth/*",
             "users": "/api/users/*",
-            "admin": "/api/admin/*"
+            "admin": "/api/admin/*",
+            "bookings": "/api/bookings/*",
+            "search": "/api/search/*",
+            "notifications": "/api/notifications/*",
+            "batch": "/api/batch"
         }
     }
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    workers = int(os.getenv("WORKERS", "1"))
+    if workers > 1:
+        # Workers share change events and the agent snapshot through files
+        os.environ.setdefault("CHANGE_EVENTS_LOG", os.path.join(tempfile.gettempdir(), "clicko-changes.log"))
+        os.environ.setdefault("AGENT_SNAPSHOT_PATH", os.path.join(tempfile.gettempdir(), "clicko-agents.snapshot"))
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=workers)
+    else:
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
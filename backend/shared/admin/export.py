@@ -0,0 +1,120 @@
+"""
+Streaming exports of whole tables for admins.
+
+Rows are read from a dedicated read connection in yield_per batches (the
+driver cursor is consumed as the response is written, never fetched in
+full), each batch is encoded as CSV or NDJSON and sent as one chunk, and
+the batch is dropped before the next one is read. Memory use therefore
+depends on BATCH_SIZE, not on the size of the table. With gzip the chunks
+go through one streaming compressor.
+
+Starlette iterates a sync generator in the threadpool, so the blocking
+reads stay off the event loop, and the connection is closed when the
+generator finishes or the client goes away.
+"""
+import csv
+import io
+import zlib
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, Sequence
+
+from sqlalchemy import false, literal_column, select, true
+from sqlalchemy.sql import Select
+
+from ..database import read_engine
+from ..responses import dumps
+from ..user.models import User, Agent, Booking
+from ..booking.archive import BookingArchive
+
+BATCH_SIZE = 1000
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+}
+
+def _users() -> Select:
+    # No password hashes or reset tokens
+    return select(
+        User.id, User.name, User.email, User.phone, User.address, User.location,
+        User.is_agent, User.is_admin, User.created_at, User.updated_at
+    ).order_by(User.id)
+
+def _agents() -> Select:
+    return select(
+        Agent.id, Agent.user_id, User.name, User.email, Agent.rate_per_km, Agent.wallet_balance,
+        Agent.is_online, Agent.last_online, Agent.avg_rating, Agent.total_ratings, Agent.ranking_score,
+        Agent.kyc_status, Agent.created_at, Agent.updated_at
+    ).join(User, Agent.user_id == User.id).order_by(Agent.id)
+
+def _kyc() -> Select:
+    return select(
+        Agent.id.label("agent_id"), Agent.user_id, User.name, User.email, Agent.kyc_status,
+        Agent.kyc_document_type, Agent.kyc_document_path, Agent.updated_at
+    ).join(User, Agent.user_id == User.id).order_by(Agent.id)
+
+def _bookings():
+    """
+    Hot and archived bookings (shared.booking.archive) in id order; a row
+    keeps its id when it is archived, and SQLite merges the two branches as
+    it reads them off their primary keys instead of sorting
+    """
+    def columns(model, archived):
+        return select(
+            model.id, model.user_id, model.agent_id, model.category_id, model.status, model.scheduled_time,
+            model.visit_charge, model.address, model.notes, model.created_at, model.updated_at,
+            archived.label("archived")
+        )
+    return columns(Booking, false()).union_all(columns(BookingArchive, true())).order_by(literal_column("id"))
+
+# dataset -> statement factory
+DATASETS: Dict[str, Callable] = {
+    "users": _users,
+    "agents": _agents,
+    "kyc": _kyc,
+    "bookings": _bookings,
+}
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def _batches(statement, batch_size: int) -> Iterator[Sequence]:
+    with read_engine.connect() as connection:
+        result = connection.execution_options(yield_per=batch_size).execute(statement)
+        yield result.keys()
+        for partition in result.partitions():
+            yield partition
+
+def _csv(batches: Iterator[Sequence]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(next(batches))
+    for partition in batches:
+        writer.writerows([_value(value) for value in row] for row in partition)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():  # an empty table: just the header
+        yield buffer.getvalue().encode("utf-8")
+
+def _ndjson(batches: Iterator[Sequence]) -> Iterator[bytes]:
+    keys = list(next(batches))
+    for partition in batches:
+        yield b"".join(dumps({key: _value(value) for key, value in zip(keys, row)}) + b"\n" for row in partition)
+
+def _gzip(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def export(dataset: str, format: str, gzip: bool = False, batch_size: int = BATCH_SIZE) -> Iterator[bytes]:
+    """Response body chunks for the dataset"""
+    batches = _batches(DATASETS[dataset](), batch_size)
+    chunks = _csv(batches) if format == "csv" else _ndjson(batches)
+    return _gzip(chunks) if gzip else chunks
+
+def filename(dataset: str, format: str, gzip: bool) -> str:
+    return f"{dataset}.{FORMATS[format][1]}{'.gz' if gzip else ''}"
@@ -1,10 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Body
+from fastapi import APIRouter, Depends, HTTPException, status, Body, Query
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from typing import List, Optional
 from sqlalchemy.orm import Session
 from ..user.models import User, Agent
 from ..auth.jwt import create_access_token, get_current_user, verify_password, get_password_hash
-from ..database import get_db
+from ..database import get_read_db
+from ..writer import write_queue
+from .export import DATASETS, FORMATS, export, filename
 from datetime import datetime, timedelta
 import sqlalchemy as sa
 
@@ -13,7 +16,7 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="admin/login")
 
 # Admin authentication
 @router.post("/login")
-async def admin_login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def admin_login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_read_db)):
     # In production, use a separate admin table instead of checking is_admin flag
     user = db.query(User).filter(User.email == form_data.username, User.is_admin == True).first()
     
@@ -53,7 +56,7 @@ async def verify_token(current_user: User = Depends(get_current_user)):
 @router.get("/agents-kyc")
 async def get_agents_with_kyc(
     status: Optional[str] = None, 
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     if not current_user.is_admin:
@@ -74,7 +77,6 @@ async def get_agents_with_kyc(
 @router.post("/agent/kyc/verify")
 async def verify_agent_kyc(
     data: dict = Body(...),
-    db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     if not current_user.is_admin:
@@ -92,17 +94,19 @@ async def verify_agent_kyc(
             detail="Invalid request data",
         )
     
-    agent = db.query(Agent).filter(Agent.id == agent_id).first()
-    
-    if not agent:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Agent with id {agent_id} not found",
-        )
-    
-    agent.kyc_status = status_value
-    agent.updated_at = datetime.now()
-    db.commit()
+    def update(db: Session):
+        agent = db.query(Agent).filter(Agent.id == agent_id).first()
+
+        if not agent:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Agent with id {agent_id} not found",
+            )
+
+        agent.kyc_status = status_value
+        agent.updated_at = datetime.now()
+
+    await write_queue.run(update)
     
     # Could also trigger notifications here to inform the agent
     
@@ -111,7 +115,7 @@ async def verify_agent_kyc(
 # Dashboard statistics endpoints
 @router.get("/dashboard/stats")
 async def get_dashboard_stats(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     if not current_user.is_admin:
@@ -149,7 +153,7 @@ async def get_dashboard_stats(
 @router.get("/dashboard/bookings-by-date")
 async def get_bookings_by_date(
     days: int = 30,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     if not current_user.is_admin:
@@ -172,3 +176,34 @@ async def get_bookings_by_date(
         })
     
     return booking_stats
+
+# Exports
+@router.get("/export/{dataset}")
+async def export_dataset(
+    dataset: str,
+    format: str = Query("csv", description="csv or ndjson"),
+    gzip: bool = Query(False, description="gzip-compress the file"),
+    current_user: User = Depends(get_current_user)
+):
+    """Stream a full dump of users, agents, kyc or bookings"""
+    if not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admin users can access this endpoint",
+        )
+    if dataset not in DATASETS:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Unknown dataset. Must be one of: {', '.join(DATASETS)}",
+        )
+    if format not in FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid format. Must be one of: {', '.join(FORMATS)}",
+        )
+
+    return StreamingResponse(
+        export(dataset, format, gzip),
+        media_type="application/gzip" if gzip else FORMATS[format][0],
+        headers={"Content-Disposition": f'attachment; filename="{filename(dataset, format, gzip)}"'}
+    )
@@ -0,0 +1,202 @@
+"""
+Admission control and load shedding.
+
+Each request is classified into a route class. A class admits a bounded
+number of concurrent requests and queues a bounded number more. Requests
+beyond that, or that wait longer than the class allows, fast-fail with 503
+and Retry-After instead of piling up behind slow work. Login and search
+are also rate limited per client with a token bucket (429 when empty).
+
+Agent status/location writes have their own class, so bcrypt-heavy logins
+or scan-heavy searches can't take their slots.
+"""
+import asyncio
+import json
+import math
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+@dataclass
+class RouteClass:
+    max_concurrency: int
+    max_queue: int
+    max_wait: float  # seconds a queued request may wait for a slot
+    retry_after: int = 1
+
+@dataclass
+class RateLimit:
+    rate: float  # tokens per second
+    burst: int
+
+DEFAULT_ROUTE_CLASSES = {
+    "agent_writes": RouteClass(max_concurrency=64, max_queue=256, max_wait=2.0),
+    "auth": RouteClass(max_concurrency=4, max_queue=16, max_wait=1.0, retry_after=2),
+    "search": RouteClass(max_concurrency=8, max_queue=32, max_wait=0.5),
+    # Held for the whole (streamed) response
+    "exports": RouteClass(max_concurrency=2, max_queue=4, max_wait=1.0, retry_after=10),
+    "default": RouteClass(max_concurrency=64, max_queue=256, max_wait=2.0),
+}
+
+# (method, path) -> route class; paths are matched without a trailing slash
+ROUTE_RULES = {
+    ("PUT", "/api/agents/status"): "agent_writes",
+    ("PUT", "/api/agents/location"): "agent_writes",
+    ("POST", "/api/agents/heartbeat"): "agent_writes",
+    ("POST", "/api/auth/login"): "auth",
+    ("POST", "/api/auth/register"): "auth",
+    ("POST", "/api/auth/reset-password"): "auth",
+    ("POST", "/api/admin/login"): "auth",
+    ("GET", "/api/agents"): "search",
+    ("GET", "/api/agents/nearby"): "search",
+    ("GET", "/api/agents/search"): "search",
+    ("GET", "/api/agents/available"): "search",
+    ("GET", "/api/admin/export/users"): "exports",
+    ("GET", "/api/admin/export/agents"): "exports",
+    ("GET", "/api/admin/export/kyc"): "exports",
+    ("GET", "/api/admin/export/bookings"): "exports",
+}
+
+# Per-client token buckets, keyed by the same (method, path) pairs
+DEFAULT_RATE_LIMITS = {
+    ("POST", "/api/auth/login"): RateLimit(rate=0.5, burst=10),
+    ("POST", "/api/admin/login"): RateLimit(rate=0.5, burst=10),
+    ("GET", "/api/agents/search"): RateLimit(rate=5.0, burst=20),
+}
+
+class _Gate:
+    """Concurrency limit with a bounded FIFO wait queue"""
+
+    def __init__(self, route_class: RouteClass):
+        self.route_class = route_class
+        self.active = 0
+        self.waiters = deque()
+        self.admitted = 0
+        self.rejected = 0
+
+    async def acquire(self) -> bool:
+        if self.active < self.route_class.max_concurrency and not self.waiters:
+            self.active += 1
+            self.admitted += 1
+            return True
+        if len(self.waiters) >= self.route_class.max_queue:
+            self.rejected += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            # release() hands its slot straight to the waiter, so active stays put
+            await asyncio.wait_for(waiter, self.route_class.max_wait)
+        except asyncio.TimeoutError:
+            try:
+                self.waiters.remove(waiter)
+            except ValueError:
+                pass
+            self.rejected += 1
+            return False
+        self.admitted += 1
+        return True
+
+    def release(self):
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self.active -= 1
+
+class _TokenBuckets:
+    """Token bucket per client, with LRU eviction of idle clients"""
+
+    def __init__(self, limit: RateLimit, max_clients: int = 10000):
+        self.limit = limit
+        self.max_clients = max_clients
+        self.buckets = OrderedDict()  # client -> (tokens, last refill)
+
+    def take(self, client: str) -> Optional[float]:
+        """Consume a token; returns None if allowed, else seconds until one is available"""
+        now = time.monotonic()
+        tokens, last = self.buckets.pop(client, (float(self.limit.burst), now))
+        tokens = min(float(self.limit.burst), tokens + (now - last) * self.limit.rate)
+        wait = None
+        if tokens >= 1.0:
+            tokens -= 1.0
+        else:
+            wait = (1.0 - tokens) / self.limit.rate
+        self.buckets[client] = (tokens, now)
+        if len(self.buckets) > self.max_clients:
+            self.buckets.popitem(last=False)
+        return wait
+
+class AdmissionControlMiddleware:
+    def __init__(
+        self,
+        app,
+        route_classes: Optional[Dict[str, RouteClass]] = None,
+        route_rules: Optional[dict] = None,
+        rate_limits: Optional[dict] = None,
+    ):
+        self.app = app
+        self.route_rules = ROUTE_RULES if route_rules is None else route_rules
+        self.gates = {
+            name: _Gate(route_class)
+            for name, route_class in (route_classes or DEFAULT_ROUTE_CLASSES).items()
+        }
+        self.rate_limits = {
+            key: _TokenBuckets(limit)
+            for key, limit in (DEFAULT_RATE_LIMITS if rate_limits is None else rate_limits).items()
+        }
+
+    def classify(self, method: str, path: str):
+        key = (method, path.rstrip("/") or "/")
+        return key, self.route_rules.get(key, "default")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        key, name = self.classify(scope["method"], scope["path"])
+
+        buckets = self.rate_limits.get(key)
+        if buckets is not None:
+            client = scope["client"][0] if scope.get("client") else "unknown"
+            wait = buckets.take(client)
+            if wait is not None:
+                await _reject(send, 429, math.ceil(wait), "Too many requests")
+                return
+
+        gate = self.gates.get(name) or self.gates["default"]
+        if not await gate.acquire():
+            await _reject(send, 503, gate.route_class.retry_after, "Server busy, please retry")
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release()
+
+    def stats(self) -> dict:
+        return {
+            name: {
+                "active": gate.active,
+                "queued": len(gate.waiters),
+                "admitted": gate.admitted,
+                "rejected": gate.rejected,
+            }
+            for name, gate in self.gates.items()
+        }
+
+async def _reject(send, status_code: int, retry_after: int, detail: str):
+    body = json.dumps({"detail": detail}).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("latin-1")),
+            (b"retry-after", str(max(1, retry_after)).encode("latin-1")),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,181 @@
+"""
+Agent calendar availability.
+
+Time is cut into 30 minute slots. For each agent the index keeps one
+bitmap per UTC day (48 bits, bit i = slot i) with the slots taken by its
+pending and accepted bookings. Checking whether an agent is free for a
+window is a couple of AND operations, however many bookings it has.
+
+The index is built from the bookings table once, then updated from
+committed booking change events: the changed bookings are re-read and
+their slots moved. Each booking's own masks are kept so the day bitmap
+can be rebuilt when it is cancelled or rescheduled (two bookings may
+overlap, so bits can't just be cleared).
+"""
+import logging
+import threading
+from datetime import datetime, timedelta, date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ..database import ReadSessionLocal
+from ..events import change_bus, BOOKING
+from ..user.models import Booking
+
+logger = logging.getLogger(__name__)
+
+SLOT = timedelta(minutes=30)
+SLOTS_PER_DAY = 48
+# How long a booking occupies the agent from its scheduled time
+BOOKING_DURATION = timedelta(hours=2)
+# Booking statuses that take up the agent's time
+BUSY_STATUSES = ("pending", "accepted")
+
+def slot_masks(start: datetime, end: datetime) -> List[Tuple[int, int]]:
+    """(day ordinal, slot bitmask) pairs covering [start, end)"""
+    index = _slot_index(start)
+    last = _slot_index(end - timedelta(microseconds=1))  # end is exclusive
+    masks = []
+    while index <= last:
+        day, slot = divmod(index, SLOTS_PER_DAY)
+        count = min(last - index + 1, SLOTS_PER_DAY - slot)
+        masks.append((day, ((1 << count) - 1) << slot))
+        index += count
+    return masks
+
+def _slot_index(moment: datetime) -> int:
+    since_midnight = moment - datetime.combine(moment.date(), datetime.min.time())
+    return moment.toordinal() * SLOTS_PER_DAY + since_midnight // SLOT
+
+class AvailabilityIndex:
+    def __init__(self, booking_duration: timedelta = BOOKING_DURATION):
+        self.booking_duration = booking_duration
+        self._days: Dict[int, Dict[int, int]] = {}  # agent_id -> day -> busy bitmap
+        self._bookings: Dict[int, Tuple[int, List[Tuple[int, int]]]] = {}  # booking_id -> (agent_id, masks)
+        self._by_agent: Dict[int, set] = {}  # agent_id -> busy booking ids
+        self._lock = threading.Lock()
+        self._pruned_on = None
+        self.loaded = False
+
+    def is_free(self, agent_id: int, start: datetime, end: datetime) -> bool:
+        days = self._days.get(agent_id)
+        if not days:
+            return True
+        return not any(days.get(day, 0) & mask for day, mask in slot_masks(start, end))
+
+    def free_agents(self, agent_ids: Iterable[int], start: datetime, end: datetime) -> List[int]:
+        masks = slot_masks(start, end)
+        free = []
+        days_by_agent = self._days
+        for agent_id in agent_ids:
+            days = days_by_agent.get(agent_id)
+            if not days or not any(days.get(day, 0) & mask for day, mask in masks):
+                free.append(agent_id)
+        return free
+
+    def load(self):
+        """Build the index from bookings that still occupy time"""
+        since = datetime.utcnow() - self.booking_duration
+        db = ReadSessionLocal()
+        try:
+            rows = db.query(Booking.id, Booking.agent_id, Booking.status, Booking.scheduled_time).filter(
+                Booking.status.in_(BUSY_STATUSES),
+                Booking.scheduled_time >= since
+            ).all()
+        finally:
+            db.close()
+        with self._lock:
+            self._days.clear()
+            self._bookings.clear()
+            self._by_agent.clear()
+            for row in rows:
+                self._apply(*row)
+            self.loaded = True
+            self._pruned_on = datetime.utcnow().date()
+        logger.info(f"Availability index loaded {len(rows)} bookings")
+
+    def refresh(self, booking_ids: List[int]):
+        """Re-read the given bookings and move their slots"""
+        db = ReadSessionLocal()
+        try:
+            rows = db.query(Booking.id, Booking.agent_id, Booking.status, Booking.scheduled_time).filter(
+                Booking.id.in_(booking_ids)
+            ).all()
+        finally:
+            db.close()
+        found = {row[0] for row in rows}
+        with self._lock:
+            for row in rows:
+                self._apply(*row)
+            for booking_id in booking_ids:
+                if booking_id not in found:
+                    self._remove(booking_id)  # deleted (or archived)
+        if self._pruned_on != datetime.utcnow().date():
+            self.prune()
+
+    def _apply(self, booking_id, agent_id, status, scheduled_time):
+        self._remove(booking_id)
+        if status not in BUSY_STATUSES:
+            return
+        masks = slot_masks(scheduled_time, scheduled_time + self.booking_duration)
+        self._bookings[booking_id] = (agent_id, masks)
+        self._by_agent.setdefault(agent_id, set()).add(booking_id)
+        days = self._days.setdefault(agent_id, {})
+        for day, mask in masks:
+            days[day] = days.get(day, 0) | mask
+
+    def _remove(self, booking_id):
+        entry = self._bookings.pop(booking_id, None)
+        if entry is None:
+            return
+        agent_id, masks = entry
+        remaining = self._by_agent[agent_id]
+        remaining.discard(booking_id)
+        days = self._days[agent_id]
+        for day, _ in masks:
+            # Rebuild the day from the agent's other bookings
+            bitmap = 0
+            for other in remaining:
+                for other_day, mask in self._bookings[other][1]:
+                    if other_day == day:
+                        bitmap |= mask
+            if bitmap:
+                days[day] = bitmap
+            else:
+                days.pop(day, None)
+        if not remaining:
+            del self._by_agent[agent_id]
+            del self._days[agent_id]
+
+    def prune(self, before: Optional[date] = None):
+        """Forget bookings that ended before the given day (default: today)"""
+        today = datetime.utcnow().date()
+        cutoff = (before or today).toordinal()
+        with self._lock:
+            self._pruned_on = today
+            stale = [
+                booking_id for booking_id, (_, masks) in self._bookings.items()
+                if masks[-1][0] < cutoff
+            ]
+            for booking_id in stale:
+                self._remove(booking_id)
+        return len(stale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "loaded": self.loaded,
+                "agents": len(self._days),
+                "bookings": len(self._bookings),
+            }
+
+# Process-wide availability index, loaded at startup
+availability = AvailabilityIndex()
+
+def _refresh_on_change(events):
+    if not availability.loaded:
+        return
+    booking_ids = [event.id for event in events if event.entity == BOOKING]
+    if booking_ids:
+        availability.refresh(booking_ids)
+
+change_bus.subscribe(_refresh_on_change)
@@ -0,0 +1,109 @@
+"""
+Read-through cache of rendered agent cards.
+
+A card holds everything get_agent_by_id and get_agent_profile render
+(except the per-request distance), keyed by agent id with a secondary
+user id index. Entries expire after a TTL and the least recently used
+entry is evicted beyond max_size. Entries are invalidated from committed
+change events (shared.events), including those from other workers.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from ..events import change_bus, USER, AGENT, CATEGORY, AGENT_CATEGORY
+
+class AgentCardCache:
+    def __init__(self, max_size: int = 10000, ttl: float = 300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._cards = OrderedDict()  # agent_id -> (expires_at, card)
+        self._by_user = {}  # user_id -> agent_id
+        self._lock = threading.Lock()
+        # Bumped on every invalidation; loads that started before one are not cached
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def generation(self) -> int:
+        """Take before loading a card from the database and pass to put()"""
+        return self._generation
+
+    def get(self, agent_id: Optional[int] = None, user_id: Optional[int] = None) -> Optional[dict]:
+        with self._lock:
+            if agent_id is None:
+                agent_id = self._by_user.get(user_id)
+            entry = self._cards.get(agent_id) if agent_id is not None else None
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, card = entry
+            if expires_at < time.monotonic():
+                self._remove(agent_id)
+                self.misses += 1
+                return None
+            self._cards.move_to_end(agent_id)
+            self.hits += 1
+            return card
+
+    def put(self, card: dict, generation: int):
+        with self._lock:
+            if generation != self._generation:
+                return  # an invalidation raced with this load
+            agent_id = card["id"]
+            self._cards[agent_id] = (time.monotonic() + self.ttl, card)
+            self._cards.move_to_end(agent_id)
+            self._by_user[card["user_id"]] = agent_id
+            while len(self._cards) > self.max_size:
+                oldest, _ = next(iter(self._cards.items()))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, agent_id: Optional[int] = None, user_id: Optional[int] = None):
+        with self._lock:
+            self._generation += 1
+            if agent_id is None:
+                agent_id = self._by_user.get(user_id)
+            if agent_id is not None:
+                self._remove(agent_id)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._cards.clear()
+            self._by_user.clear()
+
+    def _remove(self, agent_id: int):
+        entry = self._cards.pop(agent_id, None)
+        if entry is not None:
+            self._by_user.pop(entry[1]["user_id"], None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._cards),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+# Process-wide card cache used by the agent routes
+agent_cards = AgentCardCache()
+
+def _invalidate_on_change(events):
+    for event in events:
+        if event.entity == AGENT:
+            agent_cards.invalidate(agent_id=event.id)
+        elif event.entity == USER:
+            agent_cards.invalidate(user_id=event.id)
+        elif event.entity == AGENT_CATEGORY:
+            agent_cards.invalidate(agent_id=event.id[0])
+        elif event.entity == CATEGORY:
+            agent_cards.clear()  # category names are embedded in every card
+
+change_bus.subscribe(_invalidate_on_change, inline=True)
@@ -0,0 +1,202 @@
+"""
+Materialized agent listing table.
+
+agent_cards holds one row per listed (verified) agent with everything the
+list and search endpoints render: name, rate, online flag, rating, ranking
+score, coordinates and the agent's category ids packed as ",1,3,". List and
+search queries read this one table in ranking_score order, narrowed by
+category (through agent_category) or by the bounding box of a location
+query, instead of joining agents, users, agent_category and categories.
+
+Rows are rewritten from the base tables in the flush that changes them (the
+same change set the change feed records), so they commit or roll back with
+the write. check() compares the table against the base tables and rebuild()
+recomputes it; both are available from agent_cards.py.
+"""
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+from sqlalchemy import Column, Integer, String, Boolean, Float, DateTime, Index, delete, insert, select, event
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from ..database import Base
+from ..changefeed import changed_agents
+from ..user.models import User, Agent, AgentCategory
+from .geo import agent_position, bounding_reach
+
+# Agents read from the base tables per statement by check() and rebuild()
+BATCH_SIZE = 5000
+
+class AgentCard(Base):
+    __tablename__ = "agent_cards"
+    __table_args__ = (
+        # Listing order, read backwards (best first) without a sort step
+        Index("ix_agent_cards_ranking_score", "ranking_score"),
+        # Latitude band of a location query's bounding box
+        Index("ix_agent_cards_latitude", "latitude"),
+    )
+
+    agent_id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    name = Column(String, nullable=False)
+    rate_per_km = Column(Float, nullable=False)
+    is_online = Column(Boolean, nullable=False)
+    avg_rating = Column(Float, nullable=False)
+    total_ratings = Column(Integer, nullable=False)
+    ranking_score = Column(Float, nullable=False)
+    latitude = Column(Float, nullable=False)
+    longitude = Column(Float, nullable=False)
+    category_ids = Column(String, nullable=False)  # packed, see pack_categories
+    updated_at = Column(DateTime, nullable=False)
+
+_COMPARED = ("user_id", "name", "rate_per_km", "is_online", "avg_rating", "total_ratings",
+             "ranking_score", "latitude", "longitude", "category_ids")
+
+def pack_categories(category_ids: Iterable[int]) -> str:
+    """",1,3,", unpacked again for the category names"""
+    return "," + "".join(f"{category_id}," for category_id in sorted(category_ids))
+
+def unpack_categories(packed: str) -> List[int]:
+    return [int(part) for part in packed.strip(",").split(",") if part]
+
+def card_columns(db: Session):
+    """Query listed agents from the agent_cards table as plain rows, best ranked first"""
+    return db.query(
+        AgentCard.agent_id,
+        AgentCard.user_id,
+        AgentCard.name,
+        AgentCard.rate_per_km,
+        AgentCard.is_online,
+        AgentCard.avg_rating,
+        AgentCard.total_ratings,
+        AgentCard.ranking_score,
+        AgentCard.latitude,
+        AgentCard.longitude,
+        AgentCard.category_ids
+    ).order_by(
+        AgentCard.ranking_score.desc(), AgentCard.agent_id.desc()  # both read backwards off the index
+    )
+
+def category_filter(*category_ids: int):
+    """Cards of agents in any of the categories, looked up through ix_agent_category_category_id_agent_id"""
+    return AgentCard.agent_id.in_(
+        select(AgentCategory.agent_id).where(AgentCategory.category_id.in_(category_ids))
+    )
+
+def location_filter(latitude: float, longitude: float, within_km: float):
+    """Cards inside the bounding box of the within_km circle; exact distance is checked by the caller"""
+    lat_reach, lng_reach = bounding_reach(latitude, within_km)
+    return (
+        AgentCard.latitude.between(latitude - lat_reach, latitude + lat_reach),
+        AgentCard.longitude.between(longitude - lng_reach, longitude + lng_reach),
+    )
+
+def _expected(connection: Connection, *criterion) -> List[dict]:
+    """Card rows for the verified agents matching criterion, from the base tables"""
+    rows = connection.execute(
+        select(
+            Agent.id, Agent.user_id, User.name, Agent.rate_per_km, Agent.is_online,
+            Agent.avg_rating, Agent.total_ratings, Agent.ranking_score, User.location
+        ).join(User, Agent.user_id == User.id).where(
+            Agent.kyc_status == "verified", *criterion
+        ).order_by(Agent.id)
+    ).all()
+    if not rows:
+        return []
+    categories = {row[0]: [] for row in rows}
+    for agent_id, category_id in connection.execute(
+        select(AgentCategory.agent_id, AgentCategory.category_id).where(AgentCategory.agent_id.in_(list(categories)))
+    ):
+        categories[agent_id].append(category_id)
+
+    now = datetime.utcnow()
+    cards = []
+    for agent_id, user_id, name, rate_per_km, is_online, avg_rating, total_ratings, ranking_score, location in rows:
+        latitude, longitude = agent_position(agent_id, location)
+        cards.append({
+            "agent_id": agent_id,
+            "user_id": user_id,
+            "name": name,
+            "rate_per_km": rate_per_km,
+            "is_online": bool(is_online),
+            "avg_rating": avg_rating or 0.0,
+            "total_ratings": total_ratings or 0,
+            "ranking_score": ranking_score,
+            "latitude": latitude,
+            "longitude": longitude,
+            "category_ids": pack_categories(categories[agent_id]),
+            "updated_at": now,
+        })
+    return cards
+
+def write_cards(connection: Connection, agent_ids: Iterable[int]):
+    """Recompute the cards of the given agents (removing ones no longer listed)"""
+    agent_ids = list(agent_ids)
+    for start in range(0, len(agent_ids), BATCH_SIZE):
+        batch = agent_ids[start:start + BATCH_SIZE]
+        connection.execute(delete(AgentCard).where(AgentCard.agent_id.in_(batch)))
+        cards = _expected(connection, Agent.id.in_(batch))
+        if cards:
+            connection.execute(insert(AgentCard), cards)
+
+def _agent_id_batches(connection: Connection, size: int = BATCH_SIZE):
+    """All agent ids (listed or not), in ascending batches"""
+    last = 0
+    while True:
+        batch = connection.execute(
+            select(Agent.id).where(Agent.id > last).order_by(Agent.id).limit(size)
+        ).scalars().all()
+        if not batch:
+            return
+        yield batch
+        last = batch[-1]
+
+def rebuild(connection: Connection) -> int:
+    """Recompute the whole table; returns the number of cards"""
+    connection.execute(delete(AgentCard))
+    count = 0
+    for batch in _agent_id_batches(connection):
+        cards = _expected(connection, Agent.id.in_(batch))
+        if cards:
+            connection.execute(insert(AgentCard), cards)
+        count += len(cards)
+    return count
+
+def check(connection: Connection, limit: Optional[int] = 100) -> dict:
+    """
+    Compare the table with the base tables: agent ids missing from it, ids
+    that shouldn't be in it, and ids whose card differs (at most limit each)
+    """
+    missing, extra, stale = [], [], []
+    for batch in _agent_id_batches(connection):
+        expected = {card["agent_id"]: card for card in _expected(connection, Agent.id.in_(batch))}
+        actual = {
+            row.agent_id: row for row in connection.execute(
+                select(AgentCard).where(AgentCard.agent_id.in_(batch))
+            )
+        }
+        for agent_id, card in expected.items():
+            row = actual.get(agent_id)
+            if row is None:
+                missing.append(agent_id)
+            elif any(getattr(row, field) != card[field] for field in _COMPARED):
+                stale.append(agent_id)
+        extra.extend(agent_id for agent_id in actual if agent_id not in expected)
+    # Cards of agents that no longer exist at all
+    extra.extend(connection.execute(
+        select(AgentCard.agent_id).where(AgentCard.agent_id.not_in(select(Agent.id)))
+    ).scalars())
+    return {
+        "ok": not (missing or extra or stale),
+        "missing": missing[:limit],
+        "extra": extra[:limit],
+        "stale": stale[:limit],
+        "counts": {"missing": len(missing), "extra": len(extra), "stale": len(stale)},
+    }
+
+@event.listens_for(Session, "after_flush")
+def _write_agent_cards(session, flush_context):
+    upserts, deletes = changed_agents(session, flush_context)
+    if upserts or deletes:
+        write_cards(session.connection(), sorted(upserts | deletes))
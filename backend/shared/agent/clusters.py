@@ -0,0 +1,191 @@
+"""
+Hierarchical grid of agent positions for map clustering.
+
+Level L cuts the world into 2^L x 2^L cells of equal degrees. Every level
+from 0 to MAX_LEVEL keeps, per occupied cell, the number of agents and
+the sums of their coordinates, so a cluster's count and centroid are
+read directly. The finest level also keeps the agent ids, for individual
+markers at high zoom. Moving an agent updates one cell per level.
+
+A map request for zoom z reads level z + CELL_SHIFT, about 8 x 8 clusters
+per 256 px tile. It touches only the cells inside the bounding box, so
+pans cost the same with 1k or 1M agents.
+"""
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from ..database import ReadSessionLocal
+from ..events import change_bus, USER, AGENT
+from ..user.models import User, Agent
+from .geo import agent_position
+
+logger = logging.getLogger(__name__)
+
+MAX_LEVEL = 16  # cells of about 600 m x 300 m
+CELL_SHIFT = 3
+# From this zoom on, individual agents are returned instead of clusters
+INDIVIDUAL_ZOOM = 15
+MAX_INDIVIDUAL = 1000
+
+def cell_of(latitude: float, longitude: float, level: int) -> Tuple[int, int]:
+    size = 1 << level
+    x = min(size - 1, max(0, int((longitude + 180.0) / 360.0 * size)))
+    y = min(size - 1, max(0, int((latitude + 90.0) / 180.0 * size)))
+    return x, y
+
+class AgentGrid:
+    def __init__(self, max_level: int = MAX_LEVEL):
+        self.max_level = max_level
+        self._levels: List[Dict[Tuple[int, int], list]] = [{} for _ in range(max_level + 1)]  # cell -> [count, sum_lat, sum_lng]
+        self._members: Dict[Tuple[int, int], set] = {}  # finest cell -> agent ids
+        self._positions: Dict[int, Tuple[float, float]] = {}  # agent_id -> (lat, lng)
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._positions)
+
+    def _add(self, agent_id: int, latitude: float, longitude: float):
+        self._positions[agent_id] = (latitude, longitude)
+        for level, cells in enumerate(self._levels):
+            cell = cell_of(latitude, longitude, level)
+            entry = cells.get(cell)
+            if entry is None:
+                cells[cell] = [1, latitude, longitude]
+            else:
+                entry[0] += 1
+                entry[1] += latitude
+                entry[2] += longitude
+        self._members.setdefault(cell, set()).add(agent_id)
+
+    def _remove(self, agent_id: int):
+        position = self._positions.pop(agent_id, None)
+        if position is None:
+            return
+        latitude, longitude = position
+        for level, cells in enumerate(self._levels):
+            cell = cell_of(latitude, longitude, level)
+            entry = cells[cell]
+            if entry[0] == 1:
+                del cells[cell]
+            else:
+                entry[0] -= 1
+                entry[1] -= latitude
+                entry[2] -= longitude
+        members = self._members[cell]
+        members.discard(agent_id)
+        if not members:
+            del self._members[cell]
+
+    def move(self, agent_id: int, latitude: Optional[float], longitude: Optional[float] = None):
+        """Place (or with latitude None, remove) an agent"""
+        with self._lock:
+            if self._positions.get(agent_id) == (latitude, longitude):
+                return
+            self._remove(agent_id)
+            if latitude is not None:
+                self._add(agent_id, latitude, longitude)
+
+    def _cells_in(self, level: int, min_lat, min_lng, max_lat, max_lng):
+        cells = self._levels[level]
+        x0, y0 = cell_of(min_lat, min_lng, level)
+        x1, y1 = cell_of(max_lat, max_lng, level)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(cells):
+            # Box spans more cells than are occupied; walk the occupied ones
+            return [(cell, entry) for cell, entry in cells.items() if x0 <= cell[0] <= x1 and y0 <= cell[1] <= y1]
+        found = []
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                entry = cells.get((x, y))
+                if entry is not None:
+                    found.append(((x, y), entry))
+        return found
+
+    def clusters(self, min_lat, min_lng, max_lat, max_lng, zoom: int) -> List[dict]:
+        level = min(self.max_level, max(0, zoom + CELL_SHIFT))
+        with self._lock:
+            found = self._cells_in(level, min_lat, min_lng, max_lat, max_lng)
+            return [
+                {
+                    "latitude": round(sum_lat / count, 6),
+                    "longitude": round(sum_lng / count, 6),
+                    "count": count
+                }
+                for _, (count, sum_lat, sum_lng) in found
+            ]
+
+    def agents_in(self, min_lat, min_lng, max_lat, max_lng, limit: int = MAX_INDIVIDUAL) -> Optional[List[tuple]]:
+        """(agent_id, lat, lng) inside the box, or None if there are more than limit"""
+        with self._lock:
+            found = self._cells_in(self.max_level, min_lat, min_lng, max_lat, max_lng)
+            if sum(entry[0] for _, entry in found) > limit:
+                return None
+            result = []
+            for cell, _ in found:
+                for agent_id in self._members[cell]:
+                    latitude, longitude = self._positions[agent_id]
+                    if min_lat <= latitude <= max_lat and min_lng <= longitude <= max_lng:
+                        result.append((agent_id, latitude, longitude))
+            return result
+
+    def load(self):
+        """Build the grid from all verified agents"""
+        db = ReadSessionLocal()
+        try:
+            rows = db.query(Agent.id, User.location).join(
+                User, Agent.user_id == User.id
+            ).filter(Agent.kyc_status == "verified").all()
+        finally:
+            db.close()
+        with self._lock:
+            self._levels = [{} for _ in range(self.max_level + 1)]
+            self._members.clear()
+            self._positions.clear()
+            for agent_id, location in rows:
+                self._add(agent_id, *agent_position(agent_id, location))
+            self.loaded = True
+        logger.info(f"Agent map grid loaded {len(rows)} agents")
+
+    def refresh(self, agent_ids=(), user_ids=()):
+        """Re-read the given agents (or agents of the given users) and move them"""
+        db = ReadSessionLocal()
+        try:
+            query = db.query(Agent.id, Agent.kyc_status, User.location).join(User, Agent.user_id == User.id)
+            rows = []
+            if agent_ids:
+                rows += query.filter(Agent.id.in_(agent_ids)).all()
+            if user_ids:
+                rows += query.filter(User.id.in_(user_ids)).all()
+        finally:
+            db.close()
+        seen = set()
+        for agent_id, kyc_status, location in rows:
+            seen.add(agent_id)
+            if kyc_status == "verified":
+                self.move(agent_id, *agent_position(agent_id, location))
+            else:
+                self.move(agent_id, None)
+        for agent_id in set(agent_ids) - seen:
+            self.move(agent_id, None)  # deleted
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "loaded": self.loaded,
+                "agents": len(self._positions),
+                "cells": sum(len(cells) for cells in self._levels),
+            }
+
+# Process-wide grid, loaded at startup
+agent_grid = AgentGrid()
+
+def _refresh_on_change(events):
+    if not agent_grid.loaded:
+        return
+    agent_ids = [event.id for event in events if event.entity == AGENT]
+    user_ids = [event.id for event in events if event.entity == USER]
+    if agent_ids or user_ids:
+        agent_grid.refresh(agent_ids, user_ids)
+
+change_bus.subscribe(_refresh_on_change)
@@ -0,0 +1,43 @@
+"""
+Agent coordinates and distances, shared by the routes, the agent_cards
+table, the in-memory records and the map grid.
+"""
+import math
+from typing import Optional
+
+def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Calculate the great circle distance between two points 
+    on the earth (specified in decimal degrees)
+    Returns distance in kilometers
+    """
+    # Convert decimal degrees to radians
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    
+    # Haversine formula
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
+    c = 2 * math.asin(math.sqrt(a))
+    
+    # Radius of earth in kilometers
+    r = 6371
+    
+    return c * r
+
+def bounding_reach(latitude: float, within_km: float):
+    """(degrees of latitude, degrees of longitude) spanned by within_km around latitude"""
+    lat_reach = within_km / 110.574
+    lng_reach = within_km / max(1e-6, 111.320 * math.cos(math.radians(min(89.9, abs(latitude)))))
+    return lat_reach, lng_reach
+
+def agent_position(agent_id: int, location: Optional[str] = None):
+    """Agent coordinates from the user's "lat,lng" location string"""
+    if location:
+        try:
+            lat, lng = location.split(",")
+            return float(lat), float(lng)
+        except ValueError:
+            pass
+    # Agents that never shared a location get a dummy spot (Delhi area)
+    return 28.7041 + (agent_id % 100) * 0.001, 77.1025 + (agent_id % 100) * 0.001
@@ -0,0 +1,355 @@
+"""
+Agent presence.
+
+An agent counts as online when it chose to be online (PUT /agents/status)
+and isn't inside an offline_until window (the automatic break after
+accepting a booking). An app may also send POST /agents/heartbeat every
+HEARTBEAT_INTERVAL seconds; once an agent has sent one, it goes offline
+when HEARTBEAT_TIMEOUT passes without another. Agents that have never sent
+a heartbeat (apps without the loop, and agents loaded at startup) are not
+expired.
+
+Heartbeat expiry and offline_until windows are timers on a hashed timer
+wheel: scheduling, rescheduling and cancelling are O(1), and each tick only
+looks at one slot. Presence changes are written back to agents.is_online,
+last_online and offline_until in batches through the write queue, so the
+change events (and cache invalidation) still fire.
+
+With several workers, each runs a tracker. Heartbeats, status toggles and
+breaks are broadcast on the change bus once per tick and applied by every
+other tracker, so all of them answer is_online() alike and expire agents
+at the same time. Only the worker that builds the agent snapshot (the
+holder of its lock) writes presence changes to the database; the others
+keep their pending writes until they take over.
+
+All tracker state lives on the event loop; there is no locking.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, Hashable, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from ..database import ReadSessionLocal
+from ..events import ChangeEvent, PRESENCE, change_bus
+from ..user.models import Agent
+from ..writer import write_queue
+from .snapshot import agent_snapshot
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_INTERVAL = int(os.getenv("PRESENCE_HEARTBEAT_INTERVAL", "30"))
+HEARTBEAT_TIMEOUT = int(os.getenv("PRESENCE_HEARTBEAT_TIMEOUT", "90"))
+
+# Timer kinds
+_EXPIRE = "expire"  # no heartbeat within HEARTBEAT_TIMEOUT
+_LIFT = "lift"  # offline_until reached
+
+# Presence event ops; a pause event's id is (agent_id, offline_until isoformat)
+_HEARTBEAT = "heartbeat"
+_ONLINE = "online"
+_OFFLINE = "offline"
+_PAUSE = "pause"
+
+class TimerWheel:
+    """
+    Hashed timer wheel: a timer due in n ticks goes into slot
+    (cursor + n) % slots with n // slots remaining rounds.
+    """
+
+    def __init__(self, slots: int = 4096, tick: float = 1.0):
+        self.tick = tick
+        self._slots: List[Dict[Hashable, int]] = [{} for _ in range(slots)]  # key -> remaining rounds
+        self._where: Dict[Hashable, int] = {}  # key -> slot index
+        self._cursor = 0
+
+    def __len__(self):
+        return len(self._where)
+
+    def schedule(self, key: Hashable, delay: float):
+        """(Re)schedule key to fire after delay seconds; replaces any pending timer for key"""
+        self.cancel(key)
+        ticks = max(1, int(-(-delay // self.tick)))  # round up, at least one tick
+        slot = (self._cursor + ticks) % len(self._slots)
+        self._slots[slot][key] = (ticks - 1) // len(self._slots)
+        self._where[key] = slot
+
+    def cancel(self, key: Hashable):
+        slot = self._where.pop(key, None)
+        if slot is not None:
+            del self._slots[slot][key]
+
+    def advance(self) -> List[Hashable]:
+        """Move one tick forward and return the keys that fired"""
+        self._cursor = (self._cursor + 1) % len(self._slots)
+        bucket = self._slots[self._cursor]
+        fired = []
+        for key, rounds in list(bucket.items()):
+            if rounds:
+                bucket[key] = rounds - 1
+            else:
+                del bucket[key]
+                del self._where[key]
+                fired.append(key)
+        return fired
+
+class PresenceTracker:
+    def __init__(self, heartbeat_timeout: float = HEARTBEAT_TIMEOUT, wheel: Optional[TimerWheel] = None):
+        self.heartbeat_timeout = heartbeat_timeout
+        self.wheel = wheel or TimerWheel()
+        self._wanted = set()  # agents that chose to be online
+        self._beating = set()  # sent a heartbeat, so they are expected to keep sending them
+        self._alive = set()  # no heartbeat missed
+        self._online = set()  # wanted, alive and not on a break
+        self._last_seen: Dict[int, float] = {}  # agent_id -> time.time() of last heartbeat
+        self._paused: Dict[int, datetime] = {}  # agent_id -> offline_until (UTC)
+        self._pending: Dict[int, dict] = {}  # agent_id -> agent columns to write
+        self._outgoing: List[ChangeEvent] = []  # inputs to broadcast to the other workers
+        self._loop = None
+        self._unsubscribe = None
+        self._task = None
+        self.heartbeats = 0
+        self.expired = 0
+        self.synced = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    # Queries
+
+    def is_online(self, agent_id: int) -> bool:
+        return agent_id in self._online
+
+    def offline_until(self, agent_id: int) -> Optional[datetime]:
+        return self._paused.get(agent_id)
+
+    # Inputs
+
+    def heartbeat(self, agent_id: int):
+        self.heartbeats += 1
+        self._heartbeat(agent_id)
+        self._broadcast(agent_id, _HEARTBEAT)
+
+    def set_online(self, agent_id: int, is_online: bool):
+        """
+        The agent toggled its status. The caller writes the agent row itself,
+        so pending writes for the agent are dropped; going online also ends a
+        break early (manual override).
+        """
+        self._set_online(agent_id, is_online)
+        self._broadcast(agent_id, _ONLINE if is_online else _OFFLINE)
+
+    def pause(self, agent_id: int, until: datetime):
+        """Keep the agent offline until the given UTC time"""
+        self._pause(agent_id, until)
+        self._broadcast((agent_id, until.isoformat()), _PAUSE)
+
+    # Internals
+
+    def _heartbeat(self, agent_id: int):
+        self._beating.add(agent_id)
+        self._touch(agent_id)
+        self._refresh(agent_id)
+
+    def _set_online(self, agent_id: int, is_online: bool):
+        self._pending.pop(agent_id, None)
+        self._touch(agent_id)
+        if is_online:
+            self._wanted.add(agent_id)
+            self._paused.pop(agent_id, None)
+            self.wheel.cancel((_LIFT, agent_id))
+            self._online.add(agent_id)
+        else:
+            self._wanted.discard(agent_id)
+            self._online.discard(agent_id)
+
+    def _pause(self, agent_id: int, until: datetime):
+        self._paused[agent_id] = until
+        self.wheel.schedule((_LIFT, agent_id), (until - datetime.utcnow()).total_seconds())
+        self._mark(agent_id, offline_until=until)
+        self._refresh(agent_id)
+
+    def _touch(self, agent_id: int):
+        self._last_seen[agent_id] = time.time()
+        self._alive.add(agent_id)
+        if agent_id in self._beating:
+            self.wheel.schedule((_EXPIRE, agent_id), self.heartbeat_timeout)
+
+    def _refresh(self, agent_id: int):
+        online = (
+            agent_id in self._wanted
+            and agent_id in self._alive
+            and agent_id not in self._paused
+        )
+        if online == (agent_id in self._online):
+            return
+        if online:
+            self._online.add(agent_id)
+            self._mark(agent_id, is_online=True)
+        else:
+            self._online.discard(agent_id)
+            last_seen = self._last_seen.get(agent_id)
+            self._mark(
+                agent_id,
+                is_online=False,
+                last_online=datetime.utcfromtimestamp(last_seen) if last_seen else datetime.utcnow()
+            )
+
+    def _mark(self, agent_id: int, **columns):
+        self._pending.setdefault(agent_id, {}).update(columns)
+
+    def _fire(self, key):
+        kind, agent_id = key
+        if kind == _EXPIRE:
+            if agent_id in self._online:
+                self.expired += 1
+            self._beating.discard(agent_id)
+            self._alive.discard(agent_id)
+            self._refresh(agent_id)
+            self._last_seen.pop(agent_id, None)
+        elif kind == _LIFT:
+            self._paused.pop(agent_id, None)
+            self._mark(agent_id, offline_until=None)
+            self._refresh(agent_id)
+
+    def tick(self):
+        for key in self.wheel.advance():
+            self._fire(key)
+
+    # Other workers
+
+    def _broadcast(self, entity_id, op: str):
+        if self._unsubscribe is not None:
+            self._outgoing.append(ChangeEvent(PRESENCE, entity_id, op))
+
+    def publish(self):
+        """Send this tick's inputs to the other workers' trackers"""
+        if self._outgoing:
+            outgoing, self._outgoing = self._outgoing, []
+            change_bus.publish(outgoing, local=False)
+
+    def _receive(self, events):
+        # Called on the transport thread; the tracker state belongs to the loop
+        inputs = [event for event in events if event.entity == PRESENCE]
+        if inputs and self._loop is not None:
+            self._loop.call_soon_threadsafe(self.apply, inputs)
+
+    def apply(self, events):
+        """Apply presence inputs broadcast by another worker"""
+        for event in events:
+            if event.op == _HEARTBEAT:
+                self._heartbeat(event.id)
+            elif event.op in (_ONLINE, _OFFLINE):
+                self._set_online(event.id, event.op == _ONLINE)
+            elif event.op == _PAUSE:
+                agent_id, until = event.id
+                self._pause(agent_id, datetime.fromisoformat(until))
+
+    @property
+    def writer(self) -> bool:
+        """Whether this worker writes presence changes to the database"""
+        return not agent_snapshot.enabled or agent_snapshot.builder
+
+    async def flush(self):
+        """Write pending presence changes in one batch"""
+        if not self._pending or not self.writer:
+            return
+        pending, self._pending = self._pending, {}
+
+        def write(db):
+            for agent in db.query(Agent).filter(Agent.id.in_(pending)).all():
+                for column, value in pending[agent.id].items():
+                    setattr(agent, column, value)
+
+        try:
+            await write_queue.run(write)
+            self.synced += len(pending)
+        except Exception as e:
+            logger.error(f"Presence sync failed: {e}")
+            for agent_id, columns in pending.items():
+                # Keep newer changes made while the batch was in flight
+                self._pending[agent_id] = {**columns, **self._pending.get(agent_id, {})}
+
+    def load(self, agents):
+        """Seed from (agent_id, is_online, offline_until) rows"""
+        now = datetime.utcnow()
+        for agent_id, is_online, offline_until in agents:
+            if is_online:
+                # Expired again only once they heartbeat to this tracker
+                self._wanted.add(agent_id)
+                self._online.add(agent_id)
+                self._touch(agent_id)
+            if offline_until is not None:
+                if offline_until > now:
+                    self._paused[agent_id] = offline_until
+                    self.wheel.schedule((_LIFT, agent_id), (offline_until - now).total_seconds())
+                    self._refresh(agent_id)
+                else:
+                    self._mark(agent_id, offline_until=None)
+
+    async def start(self):
+        if self._task is not None:
+            return
+
+        def read():
+            db = ReadSessionLocal()
+            try:
+                return db.query(Agent.id, Agent.is_online, Agent.offline_until).filter(
+                    (Agent.is_online == True) | (Agent.offline_until != None)
+                ).all()
+            finally:
+                db.close()
+
+        self._loop = asyncio.get_running_loop()
+        self._unsubscribe = change_bus.subscribe(self._receive)
+        self.load(await run_in_threadpool(read))
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        self._unsubscribe()
+        self._unsubscribe = None
+        self._loop = None
+        self.publish()
+        await self.flush()
+
+    async def _run(self):
+        next_tick = time.monotonic()
+        while True:
+            next_tick += self.wheel.tick
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+            try:
+                self.publish()
+                self.tick()
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Presence tick failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "online": len(self._online),
+            "alive": len(self._alive),
+            "heartbeating": len(self._beating),
+            "wanted": len(self._wanted),
+            "paused": len(self._paused),
+            "timers": len(self.wheel),
+            "pending_writes": len(self._pending),
+            "writer": self.writer,
+            "heartbeats": self.heartbeats,
+            "expired": self.expired,
+            "synced": self.synced,
+        }
+
+# Process-wide tracker, started with the app
+presence = PresenceTracker()
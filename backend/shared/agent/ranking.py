@@ -0,0 +1,46 @@
+"""
+Agent rating aggregates and ranking score.
+
+avg_rating and total_ratings are updated incrementally as ratings come in,
+in the transaction that stores the rating. ranking_score is the Bayesian
+average of the agent's ratings: as if every agent started with
+PRIOR_WEIGHT ratings of PRIOR_MEAN stars. A 5.0 from two ratings then
+ranks below a 4.8 from two hundred, and new agents start at the prior.
+
+The prior is fixed (not the live mean of all ratings), so a rating only
+changes its own agent's score and the score can be kept in an indexed
+column that list and search queries order by.
+"""
+import os
+
+from sqlalchemy import event, inspect
+
+from ..user.models import Agent
+
+PRIOR_MEAN = float(os.getenv("RANKING_PRIOR_MEAN", "3.5"))
+PRIOR_WEIGHT = float(os.getenv("RANKING_PRIOR_WEIGHT", "10"))
+
+def ranking_score(avg_rating, total_ratings) -> float:
+    total = total_ratings or 0
+    return (PRIOR_WEIGHT * PRIOR_MEAN + (avg_rating or 0.0) * total) / (PRIOR_WEIGHT + total)
+
+def ranking_score_sql(avg_rating, total_ratings):
+    """ranking_score as a SQL expression over the given columns"""
+    return (PRIOR_WEIGHT * PRIOR_MEAN + avg_rating * total_ratings) / (PRIOR_WEIGHT + total_ratings)
+
+def add_rating(agent: Agent, stars: int):
+    """Fold one new rating into the agent's aggregates"""
+    total = agent.total_ratings or 0
+    agent.avg_rating = ((agent.avg_rating or 0.0) * total + stars) / (total + 1)
+    agent.total_ratings = total + 1
+
+# Covers add_rating and any other write of the aggregates (seeding, admin fixes)
+@event.listens_for(Agent, "before_insert")
+def _set_ranking_score(mapper, connection, agent):
+    agent.ranking_score = ranking_score(agent.avg_rating, agent.total_ratings)
+
+@event.listens_for(Agent, "before_update")
+def _update_ranking_score(mapper, connection, agent):
+    state = inspect(agent)
+    if state.attrs.avg_rating.history.has_changes() or state.attrs.total_ratings.history.has_changes():
+        agent.ranking_score = ranking_score(agent.avg_rating, agent.total_ratings)
@@ -0,0 +1,300 @@
+"""
+Compact in-memory agent records.
+
+An ORM Agent with its User and categories, or an AgentResponse, costs a few
+kilobytes per agent, which rules them out for caches and indexes that hold
+every agent. AgentRecords keeps the same listing fields as typed parallel
+columns (array.array): int32 ids, float32 coordinates, rate, rating and
+ranking score, status bits, a category bitmask per agent, and an index into
+a table of interned names held as one UTF-8 blob. After compact() that is
+about 50 bytes per agent plus the distinct names' bytes, and filters scan
+the columns without touching any object.
+
+The columns are plain buffers, so they can also live outside the process:
+the shared agent snapshot (shared.agent.snapshot) writes columns() to a
+file and every worker reads it back through view() over its mapping.
+
+float32 keeps about 7 significant digits: coordinates to roughly a metre,
+and rates and ratings to well below the 2 decimals they are shown with.
+Values are rounded accordingly when read back. Rows are addressed by
+position; find() maps an agent id to its row.
+"""
+import math
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+from ..user.models import Category
+from .card_table import card_columns, unpack_categories
+from .geo import bounding_reach, calculate_distance
+from .schemas import AgentResponse
+
+# Status bits
+ONLINE = 1
+VERIFIED = 2
+
+# (column, typecode): one entry per row, then the distinct names' tables
+ROW_COLUMNS = (
+    ("agent_id", "i"), ("user_id", "i"), ("latitude", "f"), ("longitude", "f"), ("rate_per_km", "f"),
+    ("avg_rating", "f"), ("ranking_score", "f"), ("total_ratings", "I"), ("flags", "B"),
+    ("category_bits", "Q"), ("name_index", "I"),
+)
+NAME_COLUMNS = (("name_offsets", "I"), ("lower_offsets", "I"), ("names", "B"), ("lower_names", "B"))
+
+class AgentRecord:
+    """Read-only view of one row"""
+    __slots__ = ("_records", "row")
+
+    def __init__(self, records: "AgentRecords", row: int):
+        self._records = records
+        self.row = row
+
+    id = property(lambda self: self._records.agent_id[self.row])
+    user_id = property(lambda self: self._records.user_id[self.row])
+    name = property(lambda self: self._records.name(self.row))
+    latitude = property(lambda self: round(self._records.latitude[self.row], 5))
+    longitude = property(lambda self: round(self._records.longitude[self.row], 5))
+    rate_per_km = property(lambda self: round(self._records.rate_per_km[self.row], 4))
+    avg_rating = property(lambda self: round(self._records.avg_rating[self.row], 4))
+    ranking_score = property(lambda self: round(self._records.ranking_score[self.row], 4))
+    total_ratings = property(lambda self: self._records.total_ratings[self.row])
+    is_online = property(lambda self: bool(self._records.flags[self.row] & ONLINE))
+    is_verified = property(lambda self: bool(self._records.flags[self.row] & VERIFIED))
+    category_ids = property(lambda self: self._records.category_ids(self.row))
+
+    def __repr__(self):
+        return f"AgentRecord(id={self.id}, name={self.name!r})"
+
+class AgentRecords:
+    def __init__(self, categories: Sequence = ()):
+        """categories: (id, name) pairs; each gets one bit of the mask"""
+        self.agent_id = array("i")
+        self.user_id = array("i")
+        self.latitude = array("f")
+        self.longitude = array("f")
+        self.rate_per_km = array("f")
+        self.avg_rating = array("f")
+        self.ranking_score = array("f")
+        self.total_ratings = array("I")
+        self.flags = array("B")
+        self.category_bits = array("Q")  # self.words per row
+        self.name_index = array("I")
+        self.names = bytearray()  # distinct names, UTF-8
+        self.name_offsets = array("I", [0])  # distinct name i is names[offsets[i]:offsets[i + 1]]
+        self.lower_names = bytearray()  # the distinct names lowercased, for text search; see lowercase()
+        self.lower_offsets = array("I", [0])
+        self._interned: Optional[Dict[str, int]] = {}  # name -> distinct name index, until compact()
+        self._category_ids = [category_id for category_id, _ in categories]
+        self._category_names = [name for _, name in categories]
+        self._category_bit = {category_id: bit for bit, category_id in enumerate(self._category_ids)}
+        self.words = max(1, math.ceil(len(self._category_ids) / 64))
+        self._order: Optional[array] = None  # rows sorted by agent id, built by find()
+
+    def __len__(self):
+        return len(self.agent_id)
+
+    def __getitem__(self, row: int) -> AgentRecord:
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        return AgentRecord(self, row)
+
+    def __iter__(self) -> Iterator[AgentRecord]:
+        return (AgentRecord(self, row) for row in range(len(self)))
+
+    # Building
+
+    def append(self, agent_id: int, user_id: int, name: str, latitude: float, longitude: float,
+               rate_per_km: float, avg_rating: float, total_ratings: int, ranking_score: float = 0.0,
+               is_online: bool = False, is_verified: bool = True, category_ids: Iterable[int] = ()) -> int:
+        """Add an agent; returns its row"""
+        self.agent_id.append(agent_id)
+        self.user_id.append(user_id)
+        self.latitude.append(latitude)
+        self.longitude.append(longitude)
+        self.rate_per_km.append(rate_per_km)
+        self.avg_rating.append(avg_rating or 0.0)
+        self.ranking_score.append(ranking_score or 0.0)
+        self.total_ratings.append(total_ratings or 0)
+        self.flags.append((ONLINE if is_online else 0) | (VERIFIED if is_verified else 0))
+        bits = [0] * self.words
+        for category_id in category_ids:
+            bit = self._category_bit.get(category_id)
+            if bit is not None:
+                bits[bit // 64] |= 1 << (bit % 64)
+        self.category_bits.extend(bits)
+        if self._interned is None:
+            self._interned = {self._name(index): index for index in range(len(self.name_offsets) - 1)}
+        index = self._interned.get(name)
+        if index is None:
+            index = self._interned[name] = len(self.name_offsets) - 1
+            self.names += name.encode("utf-8")
+            self.name_offsets.append(len(self.names))
+        self.name_index.append(index)
+        self._order = None
+        return len(self.agent_id) - 1
+
+    def compact(self):
+        """Drop the name interning map (rebuilt on the next append) once loading is done"""
+        self._interned = None
+
+    def lowercase(self):
+        """Fill lower_names for the distinct names that don't have one yet"""
+        for index in range(len(self.lower_offsets) - 1, len(self.name_offsets) - 1):
+            self.lower_names += self._name(index).lower().encode("utf-8")
+            self.lower_offsets.append(len(self.lower_names))
+
+    @property
+    def categories(self) -> List[tuple]:
+        """(id, name) pairs, in bit order"""
+        return list(zip(self._category_ids, self._category_names))
+
+    def columns(self) -> Dict[str, object]:
+        """column -> buffer, for ROW_COLUMNS and NAME_COLUMNS"""
+        self.lowercase()
+        return {name: getattr(self, name) for name, _ in ROW_COLUMNS + NAME_COLUMNS}
+
+    @classmethod
+    def view(cls, columns: Dict[str, Sequence], categories: Sequence) -> "AgentRecords":
+        """Read-only records over existing buffers (typed memoryviews), as written by columns()"""
+        records = cls(categories)
+        for name, _ in ROW_COLUMNS + NAME_COLUMNS:
+            setattr(records, name, columns[name])
+        records.compact()
+        return records
+
+    @classmethod
+    def from_cards(cls, rows: Iterable, categories: Sequence) -> "AgentRecords":
+        """Records from card_columns rows (agent_cards), in row order"""
+        records = cls(categories)
+        for (agent_id, user_id, name, rate_per_km, is_online, avg_rating, total_ratings, ranking_score,
+             latitude, longitude, category_ids) in rows:
+            records.append(agent_id, user_id, name, latitude, longitude, rate_per_km, avg_rating, total_ratings,
+                           ranking_score, is_online, True, unpack_categories(category_ids))
+        records.compact()
+        return records
+
+    @classmethod
+    def load(cls, db) -> "AgentRecords":
+        """Records of the listed agents, best ranked first"""
+        categories = db.query(Category.id, Category.name).order_by(Category.id).all()
+        return cls.from_cards(card_columns(db).yield_per(10000), categories)
+
+    # Access
+
+    def _name(self, index: int) -> str:
+        return str(self.names[self.name_offsets[index]:self.name_offsets[index + 1]], "utf-8")
+
+    def name(self, row: int) -> str:
+        return self._name(self.name_index[row])
+
+    def category_ids(self, row: int) -> List[int]:
+        result, base = [], row * self.words
+        for word in range(self.words):
+            bits = self.category_bits[base + word]
+            while bits:
+                low = bits & -bits
+                result.append(self._category_ids[word * 64 + low.bit_length() - 1])
+                bits ^= low
+        return result
+
+    def category_names(self, row: int) -> List[str]:
+        return [self._category_names[self._category_bit[category_id]] for category_id in self.category_ids(row)]
+
+    def find(self, agent_id: int) -> Optional[int]:
+        """Row of the agent, or None"""
+        if self._order is None:
+            self._order = array("I", sorted(range(len(self)), key=self.agent_id.__getitem__))
+        order = self._order
+        position = bisect_left(order, agent_id, key=self.agent_id.__getitem__)
+        if position < len(order) and self.agent_id[order[position]] == agent_id:
+            return order[position]
+        return None
+
+    def _matching_names(self, text: str) -> set:
+        """Distinct name indexes whose name contains text, ignoring case"""
+        self.lowercase()
+        needle, lower, offsets = text.lower().encode("utf-8"), self.lower_names, self.lower_offsets
+        return {index for index in range(len(offsets) - 1) if needle in bytes(lower[offsets[index]:offsets[index + 1]])}
+
+    def scan(self, category_id: Optional[int] = None, is_online: Optional[bool] = None,
+             latitude: Optional[float] = None, longitude: Optional[float] = None,
+             within_km: Optional[float] = None, category_ids: Optional[Iterable[int]] = None,
+             text: Optional[str] = None) -> Iterator[int]:
+        """
+        Rows, in order, with the online flag and within within_km of
+        (latitude, longitude), and in the category (or any of category_ids).
+        With text, a row whose name contains it qualifies as well as one in
+        the categories.
+        """
+        masks = None
+        if category_id is not None:
+            category_ids = [category_id]
+        if category_ids is not None:
+            masks = [(bit // 64, 1 << (bit % 64)) for bit in
+                     (self._category_bit[c] for c in category_ids if c in self._category_bit)]
+            if not masks and text is None:
+                return
+        names = self._matching_names(text) if text is not None else None
+        if within_km is not None:
+            # Cheap bounding box before the exact distance
+            lat_reach, lng_reach = bounding_reach(latitude, within_km)
+        online = None if is_online is None else (ONLINE if is_online else 0)
+        words, bits, flags, name_index = self.words, self.category_bits, self.flags, self.name_index
+        latitudes, longitudes = self.latitude, self.longitude
+        for row in range(len(self.agent_id)):
+            if online is not None and flags[row] & ONLINE != online:
+                continue
+            if within_km is not None:
+                agent_lat, agent_lng = latitudes[row], longitudes[row]
+                if abs(agent_lat - latitude) > lat_reach or abs(agent_lng - longitude) > lng_reach:
+                    continue
+                if calculate_distance(latitude, longitude, agent_lat, agent_lng) > within_km:
+                    continue
+            if names is not None:
+                if name_index[row] not in names and not (
+                        masks and any(bits[row * words + word] & mask for word, mask in masks)):
+                    continue
+            elif masks is not None and not any(bits[row * words + word] & mask for word, mask in masks):
+                continue
+            yield row
+
+    # Converters
+
+    def to_dict(self, row: int) -> dict:
+        """Same shape as routes._candidates entries"""
+        record = AgentRecord(self, row)
+        return {
+            "id": record.id,
+            "user_id": record.user_id,
+            "name": record.name,
+            "rate_per_km": record.rate_per_km,
+            "is_online": record.is_online,
+            "avg_rating": record.avg_rating,
+            "total_ratings": record.total_ratings,
+            "ranking_score": record.ranking_score,
+            "categories": self.category_names(row),
+            "latitude": record.latitude,
+            "longitude": record.longitude,
+        }
+
+    def to_response(self, row: int, distance_km: Optional[float] = None):
+        """The row as an AgentResponse"""
+        record = AgentRecord(self, row)
+        return AgentResponse(
+            id=record.id,
+            user_id=record.user_id,
+            name=record.name,
+            rate_per_km=record.rate_per_km,
+            is_online=record.is_online,
+            avg_rating=record.avg_rating,
+            total_ratings=record.total_ratings,
+            distance_km=distance_km,
+            categories=self.category_names(row),
+        )
+
+    def nbytes(self) -> int:
+        """Bytes held by the columns and names (not the interning map)"""
+        columns = (self.agent_id, self.user_id, self.latitude, self.longitude, self.rate_per_km, self.avg_rating,
+                   self.ranking_score, self.total_ratings, self.flags, self.category_bits, self.name_index,
+                   self.name_offsets, self.names)
+        return sum(memoryview(column).nbytes for column in columns)
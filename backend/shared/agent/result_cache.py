@@ -0,0 +1,215 @@
+"""
+Short-TTL cache of nearby/search candidate sets.
+
+Users in the same neighbourhood issue near-identical queries, so results
+are keyed by a quantized location: the geohash cell of the caller and the
+search radius rounded up to a bucket. The cached value is the candidate
+set for the whole cell: every agent within (radius bucket + cell
+half-diagonal) of the cell centre. Each caller then computes exact
+distances from its own position, filters and sorts.
+
+Concurrent misses for the same key share one load (single flight). The
+load runs in the threadpool so it doesn't block the event loop. An entry
+is dropped as soon as a committed change touches one of its agents. Agents
+that newly match a query show up once the entry's TTL expires.
+
+With the shared agent snapshot, loads read the snapshot, which trails the
+change events by up to its poll interval: a load right after an
+invalidation can still see the old data. Keys therefore include the
+snapshot generation, so such an entry is not served past the next swap.
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Hashable, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from ..database import session_shared
+from ..events import change_bus, USER, AGENT, CATEGORY, AGENT_CATEGORY
+from .snapshot import agent_snapshot
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Radius buckets in km; a radius is rounded up to the next bucket
+RADIUS_BUCKETS = (1, 2, 5, 10, 15, 25, 50, 100, 250)
+
+def geohash(latitude: float, longitude: float, precision: int = 6) -> str:
+    """Standard base32 geohash; precision 6 cells are about 1.2 km x 0.6 km"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        value_range, value = (lng_range, longitude) if even else (lat_range, latitude)
+        mid = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            value_range[0] = mid
+        else:
+            value_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+def geohash_bounds(cell: str):
+    """(min_lat, min_lng, max_lat, max_lng) of a geohash cell"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    even = True
+    for char in cell:
+        bits = _BASE32.index(char)
+        for shift in range(4, -1, -1):
+            value_range = lng_range if even else lat_range
+            mid = (value_range[0] + value_range[1]) / 2
+            if bits >> shift & 1:
+                value_range[0] = mid
+            else:
+                value_range[1] = mid
+            even = not even
+    return lat_range[0], lng_range[0], lat_range[1], lng_range[1]
+
+def radius_bucket(radius: Optional[float]) -> Optional[float]:
+    if radius is None:
+        return None
+    for bucket in RADIUS_BUCKETS:
+        if radius <= bucket:
+            return bucket
+    return radius
+
+def _refs(candidates):
+    for agent in candidates:
+        yield AGENT, agent["id"]
+        yield USER, agent["user_id"]
+
+class ResultCache:
+    def __init__(self, ttl: float = 10.0, max_entries: int = 5000, version: Callable[[], Hashable] = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version = version  # version of the data loaders read, made part of every key
+        self._entries = OrderedDict()  # key -> (expires_at, candidates)
+        self._keys_by_ref = {}  # (AGENT, agent_id) / (USER, user_id) -> keys whose candidates include it
+        self._inflight = {}  # key -> asyncio.Future of the running load
+        self._lock = threading.Lock()
+        self._generation = 0
+        # (generation, ref) of recent invalidations; ref None means everything
+        self._invalidations = deque(maxlen=4096)
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], list]) -> list:
+        """Cached candidates for key, running loader() once per miss"""
+        if self.version is not None:
+            key = (self.version(), key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        generation = self._generation
+        try:
+            if session_shared.get():
+                candidates = loader()
+            else:
+                candidates = await run_in_threadpool(loader)
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else is waiting
+            raise
+        finally:
+            del self._inflight[key]
+
+        self._store(key, candidates, generation)
+        future.set_result(candidates)
+        return candidates
+
+    def _changed_since(self, generation, candidates) -> bool:
+        if self._generation - generation > len(self._invalidations):
+            return True  # the log no longer covers the load; assume the worst
+        changed = {ref for gen, ref in self._invalidations if gen > generation}
+        return None in changed or any(ref in changed for ref in _refs(candidates))
+
+    def _store(self, key, candidates, generation):
+        with self._lock:
+            if self._changed_since(generation, candidates):
+                return  # one of its agents changed while loading; don't cache
+            self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, candidates)
+            for ref in _refs(candidates):
+                self._keys_by_ref.setdefault(ref, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for ref in _refs(entry[1]):
+            keys = self._keys_by_ref.get(ref)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_ref[ref]
+
+    def invalidate(self, entity: str, entity_id: int):
+        """Drop entries containing the given agent (AGENT) or agent's user (USER)"""
+        with self._lock:
+            self._generation += 1
+            self._invalidations.append((self._generation, (entity, entity_id)))
+            for key in list(self._keys_by_ref.get((entity, entity_id), ())):
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._invalidations.append((self._generation, None))
+            self._entries.clear()
+            self._keys_by_ref.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            }
+
+def _snapshot_generation() -> Optional[int]:
+    snapshot = agent_snapshot.current()
+    return snapshot.generation if snapshot is not None else None
+
+# Process-wide nearby/search result cache
+agent_results = ResultCache(version=_snapshot_generation)
+
+def _invalidate_on_change(events):
+    for event in events:
+        if event.entity in (AGENT, USER):
+            agent_results.invalidate(event.entity, event.id)
+        elif event.entity == AGENT_CATEGORY:
+            agent_results.invalidate(AGENT, event.id[0])
+        elif event.entity == CATEGORY:
+            agent_results.clear()  # category names are embedded in candidates
+
+change_bus.subscribe(_invalidate_on_change, inline=True)
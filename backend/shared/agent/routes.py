@@ -1,39 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, Request, status, Query
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from ..database import get_db
+from ..database import get_read_db
+from ..writer import write_queue
 from ..auth.jwt import get_current_user
 from ..user.models import User, Agent, Category, AgentCategory
+from ..responses import FastJSONResponse
+from ..conditional import is_conditional, make_etag, not_modified, set_validators
+from ..changefeed import changes_since, UPSERT
+from .cache import agent_cards
+from .result_cache import agent_results, geohash, geohash_bounds, radius_bucket
+from .presence import presence, HEARTBEAT_INTERVAL
+from .availability import availability
+from .clusters import agent_grid, INDIVIDUAL_ZOOM
+from .card_table import AgentCard, card_columns, category_filter, location_filter, unpack_categories
+from .geo import agent_position, calculate_distance
+from .schemas import AgentResponse, AgentProfileResponse
+from .snapshot import agent_snapshot
 from pydantic import BaseModel
 import sqlalchemy as sa
 from sqlalchemy.sql.expression import func
-import math
+from datetime import datetime, timedelta
+from fastapi.concurrency import run_in_threadpool
 
 router = APIRouter(prefix="/agents", tags=["agents"])
 
-class AgentResponse(BaseModel):
-    id: int
-    user_id: int
-    name: str
-    rate_per_km: float
-    is_online: bool
-    avg_rating: float
-    total_ratings: int
-    distance_km: Optional[float] = None
-    categories: List[str] = []
-
-class AgentProfileResponse(BaseModel):
-    id: int
-    user_id: int
-    name: str
-    rate_per_km: float
-    wallet_balance: float
-    is_online: bool
-    avg_rating: float
-    total_ratings: int
-    kyc_status: str
-    categories: List[str] = []
-
 class CreateAgentRequest(BaseModel):
     name: str
     phone: str
@@ -47,25 +38,169 @@ class LocationRequest(BaseModel):
     latitude: float
     longitude: float
 
-def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+def _category_names(db: Session, agent_ids) -> dict:
+    """Map agent id -> category names with one query for the whole page"""
+    names = {agent_id: [] for agent_id in agent_ids}
+    if not names:
+        return names
+    rows = db.query(AgentCategory.agent_id, Category.name).join(
+        Category, Category.id == AgentCategory.category_id
+    ).filter(
+        AgentCategory.agent_id.in_(list(names))
+    ).order_by(
+        AgentCategory.agent_id, AgentCategory.category_id
+    ).all()
+    for agent_id, name in rows:
+        names[agent_id].append(name)
+    return names
+
+def _candidates(db: Session, rows, latitude=None, longitude=None, within_km=None) -> list:
     """
-    Calculate the great circle distance between two points 
-    on the earth (specified in decimal degrees)
-    Returns distance in kilometers
+    Agent dicts (with coordinates, without distance) from card_columns rows,
+    in row order, keeping only agents within within_km of (latitude,
+    longitude) when given
     """
-    # Convert decimal degrees to radians
-    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-    
-    # Haversine formula
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-    c = 2 * math.asin(math.sqrt(a))
-    
-    # Radius of earth in kilometers
-    r = 6371
-    
-    return c * r
+    category_names = dict(db.query(Category.id, Category.name).all())
+    result = []
+    for (agent_id, user_id, name, rate_per_km, is_online, avg_rating, total_ratings, ranking_score,
+         agent_lat, agent_lng, category_ids) in rows:
+        if within_km is not None and calculate_distance(latitude, longitude, agent_lat, agent_lng) > within_km:
+            continue
+        result.append({
+            "id": agent_id,
+            "user_id": user_id,
+            "name": name,
+            "rate_per_km": rate_per_km,
+            "is_online": is_online,
+            "avg_rating": avg_rating,
+            "total_ratings": total_ratings,
+            "ranking_score": ranking_score,
+            "categories": [
+                category_names[category_id] for category_id in unpack_categories(category_ids)
+                if category_id in category_names
+            ],
+            "latitude": agent_lat,
+            "longitude": agent_lng
+        })
+    return result
+
+def _agent_candidates(db: Session, category_id=None, is_online=None, latitude=None, longitude=None, within_km=None) -> list:
+    # In multi-worker mode, scan the shared snapshot instead of querying
+    snapshot = agent_snapshot.current()
+    if snapshot is not None:
+        return snapshot.candidates([category_id] if category_id else None, is_online, latitude, longitude, within_km)
+
+    query = card_columns(db)
+
+    # Filter by category if specified
+    if category_id:
+        query = query.filter(category_filter(category_id))
+
+    # Filter by online status if specified
+    if is_online is not None:
+        query = query.filter(AgentCard.is_online == is_online)
+
+    if within_km is not None:
+        query = query.filter(*location_filter(latitude, longitude, within_km))
+
+    return _candidates(db, query.all(), latitude, longitude, within_km)
+
+def _search_candidates(db: Session, text: str, is_online=None, latitude=None, longitude=None, within_km=None) -> list:
+    snapshot = agent_snapshot.current()
+    if snapshot is not None:
+        return snapshot.search(text, is_online, latitude, longitude, within_km)
+
+    # Search in multiple fields: agent names, category names
+    search_term = f"%{text.lower()}%"
+
+    # Base query over the listing table
+    base_query = card_columns(db)
+
+    # Filter by online status if specified
+    if is_online is not None:
+        base_query = base_query.filter(AgentCard.is_online == is_online)
+
+    if within_km is not None:
+        base_query = base_query.filter(*location_filter(latitude, longitude, within_km))
+
+    # Match by agent name or by category name, in one ranked query
+    matching_categories = [category_id for category_id, in db.query(Category.id).filter(
+        sa.func.lower(Category.name).like(search_term)
+    )]
+    name_matches = sa.func.lower(AgentCard.name).like(search_term)
+    rows = base_query.filter(
+        sa.or_(name_matches, category_filter(*matching_categories)) if matching_categories else name_matches
+    ).all()
+
+    return _candidates(db, rows, latitude, longitude, within_km)
+
+def _rank_agents(candidates, latitude=None, longitude=None, max_distance=None, sort_key=None) -> list:
+    """
+    AgentResponse-shaped dicts for one caller: exact distance from the
+    caller's position, max_distance filter, then sort. Candidates come best
+    ranked first and the sort is stable, so ranking breaks sort_key ties.
+    """
+    with_distance = latitude is not None and longitude is not None
+    result = []
+    for agent in candidates:
+        distance_km = None
+        if with_distance:
+            distance = calculate_distance(latitude, longitude, agent["latitude"], agent["longitude"])
+            if max_distance is not None and distance > max_distance:
+                continue
+            distance_km = round(distance, 2)
+        result.append({
+            "id": agent["id"],
+            "user_id": agent["user_id"],
+            "name": agent["name"],
+            "rate_per_km": agent["rate_per_km"],
+            "is_online": agent["is_online"],
+            "avg_rating": agent["avg_rating"],
+            "total_ratings": agent["total_ratings"],
+            "distance_km": distance_km,
+            "categories": agent["categories"]
+        })
+    if sort_key is not None:
+        result.sort(key=sort_key)
+    return result
+
+def _cell_query(latitude: float, longitude: float, radius: Optional[float]):
+    """
+    Quantize a caller's position and radius: (cell, radius bucket, cell
+    centre lat, lng, reach in km covering any caller in the cell)
+    """
+    cell = geohash(latitude, longitude)
+    bucket = radius_bucket(radius)
+    min_lat, min_lng, max_lat, max_lng = geohash_bounds(cell)
+    center_lat, center_lng = (min_lat + max_lat) / 2, (min_lng + max_lng) / 2
+    half_diagonal = calculate_distance(center_lat, center_lng, max_lat, max_lng)
+    reach = None if bucket is None else bucket + half_diagonal
+    return cell, bucket, center_lat, center_lng, reach
+
+def _by_distance(agent):
+    return agent["distance_km"]
+
+def _list_agents(db, category_id=None, latitude=None, longitude=None, max_distance=25.0, is_online=None) -> list:
+    with_distance = latitude is not None and longitude is not None
+    # Only read the cards around the caller when the distance is capped
+    near = {}
+    if with_distance and max_distance is not None:
+        near = {"latitude": latitude, "longitude": longitude, "within_km": max_distance}
+    if presence.running:
+        # Availability comes from live presence rather than the last synced column
+        candidates = _agent_candidates(db, category_id=category_id, **near)
+        for agent in candidates:
+            agent["is_online"] = presence.is_online(agent["id"])
+        if is_online is not None:
+            candidates = [agent for agent in candidates if agent["is_online"] == is_online]
+    else:
+        candidates = _agent_candidates(db, category_id=category_id, is_online=is_online, **near)
+
+    # Sort by distance if location provided, otherwise keep the ranking order
+    return _rank_agents(
+        candidates, latitude, longitude, max_distance,
+        _by_distance if with_distance else None
+    )
 
 @router.get("/", response_model=List[AgentResponse])
 async def get_agents(
@@ -74,79 +209,19 @@ async def get_agents(
     longitude: Optional[float] = Query(None, description="User longitude for distance calculation"),
     max_distance: Optional[float] = Query(25.0, description="Maximum distance in km (default: 25km)"),
     is_online: Optional[bool] = Query(None, description="Filter by online status"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     Get agents with optional location-based filtering and sorting
     """
-    # Base query with user information
-    query = db.query(
-        Agent,
-        User.name.label('user_name')
-    ).join(
-        User, Agent.user_id == User.id
-    ).filter(
-        Agent.kyc_status == 'verified'  # Only show verified agents
-    )
-    
-    # Filter by category if specified
-    if category_id:
-        query = query.join(
-            AgentCategory, Agent.id == AgentCategory.agent_id
-        ).filter(
-            AgentCategory.category_id == category_id
-        )
-    
-    # Filter by online status if specified
-    if is_online is not None:
-        query = query.filter(Agent.is_online == is_online)
-    
-    agents_data = query.all()
-    
-    # Process results and calculate distances
-    result = []
-    for agent, user_name in agents_data:
-        # Get agent categories
-        categories = db.query(Category.name).join(
-            AgentCategory, Category.id == AgentCategory.category_id
-        ).filter(
-            AgentCategory.agent_id == agent.id
-        ).all()
-        
-        agent_response = AgentResponse(
-            id=agent.id,
-            user_id=agent.user_id,
-            name=user_name,
-            rate_per_km=agent.rate_per_km,
-            is_online=agent.is_online,
-            avg_rating=agent.avg_rating,
-            total_ratings=agent.total_ratings,
-            categories=[cat.name for cat in categories]
-        )
-        
-        # Calculate distance if user location provided
-        if latitude is not None and longitude is not None:
-            # For now, using dummy location for agents (Delhi area)
-            # In production, agents would have their current/preferred location
-            agent_lat = 28.7041 + (agent.id % 100) * 0.001  # Spread agents around Delhi
-            agent_lng = 77.1025 + (agent.id % 100) * 0.001
-            
-            distance = calculate_distance(latitude, longitude, agent_lat, agent_lng)
-            agent_response.distance_km = round(distance, 2)
-            
-            # Filter by max distance
-            if distance > max_distance:
-                continue
-        
-        result.append(agent_response)
-    
-    # Sort by distance if location provided, otherwise by rating
-    if latitude is not None and longitude is not None:
-        result.sort(key=lambda x: x.distance_km or float('inf'))
-    else:
-        result.sort(key=lambda x: x.avg_rating, reverse=True)
-    
-    return result
+    return FastJSONResponse(_list_agents(
+        db,
+        category_id=category_id,
+        latitude=latitude,
+        longitude=longitude,
+        max_distance=max_distance,
+        is_online=is_online
+    ))
 
 @router.get("/nearby", response_model=List[AgentResponse])
 async def get_nearby_agents(
@@ -155,21 +230,26 @@ async def get_nearby_agents(
     radius: float = Query(10.0, description="Search radius in km"),
     category_id: Optional[int] = Query(None, description="Filter by category"),
     limit: int = Query(20, description="Maximum number of agents to return"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     Get agents within a specific radius of user location
     """
-    agents = await get_agents(
-        category_id=category_id,
-        latitude=latitude,
-        longitude=longitude,
-        max_distance=radius,
-        is_online=True,  # Only online agents for nearby search
-        db=db
+    cell, bucket, center_lat, center_lng, reach = _cell_query(latitude, longitude, radius)
+    candidates = await agent_results.get_or_load(
+        ("nearby", category_id, cell, bucket),
+        lambda: _agent_candidates(
+            db,
+            category_id=category_id,
+            is_online=True,  # Only online agents for nearby search
+            latitude=center_lat,
+            longitude=center_lng,
+            within_km=reach
+        )
     )
+    agents = _rank_agents(candidates, latitude, longitude, radius, _by_distance)
     
-    return agents[:limit]
+    return FastJSONResponse(agents[:limit])
 
 @router.get("/search", response_model=List[AgentResponse])
 async def search_agents(
@@ -179,96 +259,28 @@ async def search_agents(
     max_distance: Optional[float] = Query(25.0, description="Maximum distance in km"),
     is_online: Optional[bool] = Query(True, description="Filter by online status (default: true)"),
     limit: int = Query(20, description="Maximum number of results"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     Search agents by name, category, or service with location-based prioritization
     """
-    # Search in multiple fields: agent names, category names
-    search_term = f"%{query.lower()}%"
-    
-    # Base query with user information
-    base_query = db.query(
-        Agent,
-        User.name.label('user_name')
-    ).join(
-        User, Agent.user_id == User.id
-    ).filter(
-        Agent.kyc_status == 'verified'
-    )
-    
-    # Filter by online status if specified
-    if is_online is not None:
-        base_query = base_query.filter(Agent.is_online == is_online)
-    
-    # Search by agent name
-    name_results = base_query.filter(
-        sa.func.lower(User.name).like(search_term)
-    ).all()
-    
-    # Search by category name
-    category_results = base_query.join(
-        AgentCategory, Agent.id == AgentCategory.agent_id
-    ).join(
-        Category, AgentCategory.category_id == Category.id
-    ).filter(
-        sa.func.lower(Category.name).like(search_term)
-    ).all()
-    
-    # Combine results and remove duplicates
-    all_results = {}
-    for agent, user_name in name_results + category_results:
-        if agent.id not in all_results:
-            all_results[agent.id] = (agent, user_name)
-    
-    # Process results and calculate distances
-    result = []
-    for agent, user_name in all_results.values():
-        # Get agent categories
-        categories = db.query(Category.name).join(
-            AgentCategory, Category.id == AgentCategory.category_id
-        ).filter(
-            AgentCategory.agent_id == agent.id
-        ).all()
-        
-        agent_response = AgentResponse(
-            id=agent.id,
-            user_id=agent.user_id,
-            name=user_name,
-            rate_per_km=agent.rate_per_km,
-            is_online=agent.is_online,
-            avg_rating=agent.avg_rating,
-            total_ratings=agent.total_ratings,
-            categories=[cat.name for cat in categories]
-        )
-        
-        # Calculate distance if user location provided
-        if latitude is not None and longitude is not None:
-            agent_lat = 28.7041 + (agent.id % 100) * 0.001
-            agent_lng = 77.1025 + (agent.id % 100) * 0.001
-            
-            distance = calculate_distance(latitude, longitude, agent_lat, agent_lng)
-            agent_response.distance_km = round(distance, 2)
-            
-            # Filter by max distance
-            if distance > max_distance:
-                continue
-        
-        result.append(agent_response)
-    
-    # Sort by relevance and location
     if latitude is not None and longitude is not None:
+        cell, bucket, center_lat, center_lng, reach = _cell_query(latitude, longitude, max_distance)
+        candidates = await agent_results.get_or_load(
+            ("search", query.lower(), cell, bucket, is_online),
+            lambda: _search_candidates(db, query, is_online, center_lat, center_lng, reach)
+        )
         # Prioritize by distance for location-based searches
-        result.sort(key=lambda x: (
-            x.distance_km or float('inf'),  # Primary: distance
-            -x.avg_rating,  # Secondary: rating (negative for descending)
-            -x.total_ratings  # Tertiary: number of ratings
-        ))
+        result = _rank_agents(candidates, latitude, longitude, max_distance, _by_distance)
     else:
-        # Sort by relevance (rating and reviews) without location
-        result.sort(key=lambda x: (-x.avg_rating, -x.total_ratings))
+        candidates = await agent_results.get_or_load(
+            ("search", query.lower(), None, None, is_online),
+            lambda: _search_candidates(db, query, is_online)
+        )
+        # Without location, candidates are already in ranking order
+        result = _rank_agents(candidates[:limit])
     
-    return result[:limit]
+    return FastJSONResponse(result[:limit])
 
 class AgentStatsResponse(BaseModel):
     today_earnings: float
@@ -281,7 +293,7 @@ class AgentStatsResponse(BaseModel):
 @router.get("/stats")
 async def get_agent_stats(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get agent statistics for today and overall"""
     # Find agent by user_id
@@ -305,167 +317,415 @@ async def get_agent_stats(
         avg_rating=agent.avg_rating
     )
 
+def _load_agent_cards(db: Session, *criterion) -> list:
+    """Everything the detail and profile endpoints render, except distance"""
+    rows = db.query(
+        Agent.id,
+        Agent.user_id,
+        User.name,
+        Agent.rate_per_km,
+        Agent.wallet_balance,
+        Agent.is_online,
+        Agent.avg_rating,
+        Agent.total_ratings,
+        Agent.kyc_status,
+        User.location,
+        Agent.updated_at,
+        User.updated_at
+    ).join(
+        User, Agent.user_id == User.id
+    ).filter(*criterion).all()
+    if not rows:
+        return []
+
+    categories = _category_names(db, [row[0] for row in rows])
+    cards = []
+    for (agent_id, user_id, name, rate_per_km, wallet_balance, is_online, avg_rating,
+         total_ratings, kyc_status, location, agent_updated_at, user_updated_at) in rows:
+        latitude, longitude = agent_position(agent_id, location)
+        cards.append({
+            "id": agent_id,
+            "user_id": user_id,
+            "name": name,
+            "rate_per_km": rate_per_km,
+            "wallet_balance": wallet_balance,
+            "is_online": is_online,
+            "avg_rating": avg_rating,
+            "total_ratings": total_ratings,
+            "kyc_status": kyc_status,
+            "categories": categories[agent_id],
+            "latitude": latitude,
+            "longitude": longitude,
+            "last_modified": _last_modified(agent_updated_at, user_updated_at)
+        })
+    return cards
+
+def _last_modified(agent_updated_at, user_updated_at) -> Optional[datetime]:
+    # Agent categories are only written when the agent is created
+    return max((value for value in (agent_updated_at, user_updated_at) if value is not None), default=None)
+
+def _card_last_modified(db: Session, criterion):
+    """(found, last_modified) of one card from its two timestamps, without loading the card"""
+    row = db.query(Agent.updated_at, User.updated_at).join(
+        User, Agent.user_id == User.id
+    ).filter(criterion).first()
+    return (False, None) if row is None else (True, _last_modified(*row))
+
+def _load_agent_card(db: Session, criterion) -> Optional[dict]:
+    """Load one card from the database and cache it"""
+    generation = agent_cards.generation()
+    cards = _load_agent_cards(db, criterion)
+    if not cards:
+        return None
+    agent_cards.put(cards[0], generation)
+    return cards[0]
+
+def _agent_card(db: Session, agent_id: Optional[int] = None, user_id: Optional[int] = None) -> Optional[dict]:
+    """Cached card lookup, loading and caching it on a miss"""
+    card = agent_cards.get(agent_id=agent_id, user_id=user_id)
+    if card is None:
+        card = _load_agent_card(db, Agent.id == agent_id if agent_id is not None else Agent.user_id == user_id)
+    return card
+
+def _agent_cards(db: Session, agent_ids: List[int]) -> dict:
+    """Cached cards by agent id; all misses are loaded with one query"""
+    cards = {}
+    missing = []
+    for agent_id in agent_ids:
+        card = agent_cards.get(agent_id=agent_id)
+        if card is None:
+            missing.append(agent_id)
+        else:
+            cards[agent_id] = card
+    if missing:
+        generation = agent_cards.generation()
+        for card in _load_agent_cards(db, Agent.id.in_(missing)):
+            cards[card["id"]] = card
+            agent_cards.put(card, generation)
+    return cards
+
+def _agent_response(card: dict, latitude: Optional[float] = None, longitude: Optional[float] = None) -> dict:
+    """AgentResponse for a card, with the distance from the given point if any"""
+    agent_response = {
+        "id": card["id"],
+        "user_id": card["user_id"],
+        "name": card["name"],
+        "rate_per_km": card["rate_per_km"],
+        "is_online": card["is_online"],
+        "avg_rating": card["avg_rating"],
+        "total_ratings": card["total_ratings"],
+        "distance_km": None,
+        "categories": card["categories"]
+    }
+    if latitude is not None and longitude is not None:
+        distance = calculate_distance(latitude, longitude, card["latitude"], card["longitude"])
+        agent_response["distance_km"] = round(distance, 2)
+    return agent_response
+
+@router.get("/cache/stats")
+async def get_agent_cache_stats():
+    """Hit/miss counters of the agent card and nearby/search result caches"""
+    return {"cards": agent_cards.stats(), "results": agent_results.stats()}
+
+@router.get("/available", response_model=List[AgentResponse])
+async def get_available_agents(
+    latitude: float = Query(..., description="User latitude"),
+    longitude: float = Query(..., description="User longitude"),
+    start: datetime = Query(..., description="Start of the requested slot (UTC)"),
+    duration_minutes: int = Query(120, ge=30, le=1440, description="Length of the requested slot"),
+    radius: float = Query(10.0, description="Search radius in km"),
+    category_id: Optional[int] = Query(None, description="Filter by category"),
+    limit: int = Query(20, description="Maximum number of agents to return"),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Get agents near a location with no pending or accepted booking in the
+    requested slot, for scheduling a booking ahead of time
+    """
+    if start.tzinfo is not None:
+        start = start.replace(tzinfo=None) - start.utcoffset()
+    if not availability.loaded:
+        await run_in_threadpool(availability.load)
+
+    # Geo candidates are cached per cell; the calendar check is always live
+    cell, bucket, center_lat, center_lng, reach = _cell_query(latitude, longitude, radius)
+    candidates = await agent_results.get_or_load(
+        ("available", category_id, cell, bucket),
+        lambda: _agent_candidates(
+            db,
+            category_id=category_id,
+            latitude=center_lat,
+            longitude=center_lng,
+            within_km=reach
+        )
+    )
+    free = set(availability.free_agents(
+        (agent["id"] for agent in candidates),
+        start,
+        start + timedelta(minutes=duration_minutes)
+    ))
+    agents = _rank_agents(
+        [agent for agent in candidates if agent["id"] in free],
+        latitude, longitude, radius, _by_distance
+    )
+
+    return FastJSONResponse(agents[:limit])
+
+@router.get("/map/clusters")
+async def get_agent_map_clusters(
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lng: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lng: float = Query(..., ge=-180, le=180),
+    zoom: int = Query(..., ge=0, le=22, description="Map zoom level"),
+):
+    """
+    Agent markers for a map viewport: clusters with counts and centroids,
+    or individual agents from INDIVIDUAL_ZOOM on (if not too many)
+    """
+    if min_lat > max_lat or min_lng > max_lng:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="min_lat/min_lng must not exceed max_lat/max_lng"
+        )
+    if not agent_grid.loaded:
+        await run_in_threadpool(agent_grid.load)
+
+    if zoom >= INDIVIDUAL_ZOOM:
+        found = agent_grid.agents_in(min_lat, min_lng, max_lat, max_lng)
+        if found is not None:
+            return FastJSONResponse({
+                "zoom": zoom,
+                "clusters": [],
+                "agents": [
+                    {
+                        "id": agent_id,
+                        "latitude": latitude,
+                        "longitude": longitude,
+                        "is_online": presence.is_online(agent_id)
+                    }
+                    for agent_id, latitude, longitude in found
+                ]
+            })
+
+    return FastJSONResponse({
+        "zoom": zoom,
+        "clusters": agent_grid.clusters(min_lat, min_lng, max_lat, max_lng, zoom),
+        "agents": []
+    })
+
+@router.get("/changes")
+async def get_agent_changes(
+    since: int = Query(0, ge=0, description="Cursor from the previous response; 0 for a full sync"),
+    limit: int = Query(500, ge=1, le=2000, description="Maximum number of changed agents to return"),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Agents changed since the cursor, for keeping a local replica. Upserts
+    carry the agent as listed (with coordinates, without distance); deleted
+    holds agents that were removed or are no longer listed. Poll again with
+    the returned cursor, immediately while has_more is true.
+    """
+    rows = changes_since(db, since, limit + 1)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    upsert_ids = [agent_id for _, agent_id, op in rows if op == UPSERT]
+    upserts = _candidates(
+        db, card_columns(db).filter(AgentCard.agent_id.in_(upsert_ids)).all()
+    ) if upsert_ids else []
+    # Unverified agents aren't listed anywhere, so they are tombstones too
+    listed = {agent["id"] for agent in upserts}
+    deleted = [agent_id for _, agent_id, _ in rows if agent_id not in listed]
+
+    return FastJSONResponse({
+        "cursor": rows[-1][0] if rows else since,
+        "has_more": has_more,
+        "upserts": upserts,
+        "deleted": deleted
+    })
+
+# Most agents /agents/batch returns in one call
+MAX_BATCH_IDS = 100
+
+@router.get("/batch", response_model=List[AgentResponse])
+async def get_agents_batch(
+    ids: str = Query(..., description="Comma-separated agent ids"),
+    latitude: Optional[float] = Query(None),
+    longitude: Optional[float] = Query(None),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Get several agents by ID in one call, in the order asked for; ids that
+    don't exist are left out. Cached agents are served from the card cache
+    and the rest are loaded with one query.
+    """
+    try:
+        agent_ids = list(dict.fromkeys(int(part) for part in ids.split(",") if part.strip()))
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="ids must be a comma-separated list of integers"
+        )
+    if len(agent_ids) > MAX_BATCH_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_BATCH_IDS} ids can be fetched at once"
+        )
+
+    cards = _agent_cards(db, agent_ids)
+    return FastJSONResponse([
+        _agent_response(cards[agent_id], latitude, longitude)
+        for agent_id in agent_ids if agent_id in cards
+    ])
+
 @router.get("/{agent_id}", response_model=AgentResponse)
 async def get_agent_by_id(
     agent_id: int,
+    request: Request,
     latitude: Optional[float] = Query(None),
     longitude: Optional[float] = Query(None),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     Get specific agent details by ID
     """
-    agent_data = db.query(
-        Agent,
-        User.name.label('user_name')
-    ).join(
-        User, Agent.user_id == User.id
-    ).filter(
-        Agent.id == agent_id
-    ).first()
-    
-    if not agent_data:
+    card = agent_cards.get(agent_id=agent_id)
+    if card is None and is_conditional(request):
+        # Revalidate from the timestamps before loading the card
+        found, last_modified = _card_last_modified(db, Agent.id == agent_id)
+        if found:
+            cached = not_modified(request, make_etag("agent", agent_id, last_modified, latitude, longitude),
+                                  last_modified)
+            if cached:
+                return cached
+    if card is None:
+        card = _load_agent_card(db, Agent.id == agent_id)
+    
+    if not card:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Agent with id {agent_id} not found"
         )
     
-    agent, user_name = agent_data
-    
-    # Get agent categories
-    categories = db.query(Category.name).join(
-        AgentCategory, Category.id == AgentCategory.category_id
-    ).filter(
-        AgentCategory.agent_id == agent.id
-    ).all()
-    
-    agent_response = AgentResponse(
-        id=agent.id,
-        user_id=agent.user_id,
-        name=user_name,
-        rate_per_km=agent.rate_per_km,
-        is_online=agent.is_online,
-        avg_rating=agent.avg_rating,
-        total_ratings=agent.total_ratings,
-        categories=[cat.name for cat in categories]
-    )
+    etag = make_etag("agent", agent_id, card["last_modified"], latitude, longitude)
+    cached = not_modified(request, etag, card["last_modified"])
+    if cached:
+        return cached
     
-    # Calculate distance if user location provided
-    if latitude is not None and longitude is not None:
-        agent_lat = 28.7041 + (agent.id % 100) * 0.001
-        agent_lng = 77.1025 + (agent.id % 100) * 0.001
-        
-        distance = calculate_distance(latitude, longitude, agent_lat, agent_lng)
-        agent_response.distance_km = round(distance, 2)
-    
-    return agent_response
+    # Distance is included if the user location is provided
+    agent_response = _agent_response(card, latitude, longitude)
+    return set_validators(FastJSONResponse(agent_response), etag, card["last_modified"])
 
 @router.get("/profile/{user_id}", response_model=AgentProfileResponse)
 async def get_agent_profile(
     user_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    db: Session = Depends(get_read_db)
 ):
     """
     Get agent profile details by user ID including wallet balance
     """
-    agent_data = db.query(
-        Agent,
-        User.name.label('user_name')
-    ).join(
-        User, Agent.user_id == User.id
-    ).filter(
-        Agent.user_id == user_id
-    ).first()
-    
-    if not agent_data:
+    card = agent_cards.get(user_id=user_id)
+    if card is None and is_conditional(request):
+        # Revalidate from the timestamps before loading the card
+        found, last_modified = _card_last_modified(db, Agent.user_id == user_id)
+        if found:
+            cached = not_modified(request, make_etag("agent-profile", user_id, last_modified), last_modified)
+            if cached:
+                return cached
+    if card is None:
+        card = _load_agent_card(db, Agent.user_id == user_id)
+    
+    if not card:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Agent profile not found for user {user_id}"
         )
     
-    agent, user_name = agent_data
-    
-    # Get agent categories
-    categories = db.query(Category.name).join(
-        AgentCategory, Category.id == AgentCategory.category_id
-    ).filter(
-        AgentCategory.agent_id == agent.id
-    ).all()
-    
-    return AgentProfileResponse(
-        id=agent.id,
-        user_id=agent.user_id,
-        name=user_name,
-        rate_per_km=agent.rate_per_km,
-        wallet_balance=agent.wallet_balance,
-        is_online=agent.is_online,
-        avg_rating=agent.avg_rating,
-        total_ratings=agent.total_ratings,
-        kyc_status=agent.kyc_status,
-        categories=[cat.name for cat in categories]
-    )
+    etag = make_etag("agent-profile", user_id, card["last_modified"])
+    cached = not_modified(request, etag, card["last_modified"])
+    if cached:
+        return cached
+    
+    profile = {
+        "id": card["id"],
+        "user_id": card["user_id"],
+        "name": card["name"],
+        "rate_per_km": card["rate_per_km"],
+        "wallet_balance": card["wallet_balance"],
+        "is_online": card["is_online"],
+        "avg_rating": card["avg_rating"],
+        "total_ratings": card["total_ratings"],
+        "kyc_status": card["kyc_status"],
+        "categories": card["categories"]
+    }
+    return set_validators(FastJSONResponse(profile), etag, card["last_modified"])
 
 @router.post("/create", response_model=AgentProfileResponse)
 async def create_agent(
     agent_data: CreateAgentRequest,
-    db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Create a new agent profile for the current user
     """
-    # Check if user already has an agent profile
-    existing_agent = db.query(Agent).filter(Agent.user_id == current_user.id).first()
-    if existing_agent:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="User already has an agent profile"
+    user_id = current_user.id
+
+    def create(db: Session):
+        # Check if user already has an agent profile
+        existing_agent = db.query(Agent).filter(Agent.user_id == user_id).first()
+        if existing_agent:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="User already has an agent profile"
+            )
+
+        # Create new agent
+        new_agent = Agent(
+            user_id=user_id,
+            rate_per_km=agent_data.rate_per_km,
+            wallet_balance=1000.0,  # Welcome bonus
+            is_online=False,
+            avg_rating=0.0,
+            total_ratings=0,
+            kyc_status='verified'  # Auto-approve for MVP
         )
-    
-    # Create new agent
-    new_agent = Agent(
-        user_id=current_user.id,
-        rate_per_km=agent_data.rate_per_km,
-        wallet_balance=1000.0,  # Welcome bonus
-        is_online=False,
-        avg_rating=0.0,
-        total_ratings=0,
-        kyc_status='verified'  # Auto-approve for MVP
-    )
-    
-    db.add(new_agent)
-    db.commit()
-    db.refresh(new_agent)
-    
-    # Add agent categories
-    for category_id in agent_data.selectedCategories:
-        agent_category = AgentCategory(
-            agent_id=new_agent.id,
-            category_id=category_id
+
+        db.add(new_agent)
+        db.flush()
+
+        # Add agent categories
+        for category_id in agent_data.selectedCategories:
+            agent_category = AgentCategory(
+                agent_id=new_agent.id,
+                category_id=category_id
+            )
+            db.add(agent_category)
+
+        db.flush()
+
+        # Get categories for response
+        categories = db.query(Category.name).join(
+            AgentCategory, Category.id == AgentCategory.category_id
+        ).filter(
+            AgentCategory.agent_id == new_agent.id
+        ).all()
+
+        return AgentProfileResponse(
+            id=new_agent.id,
+            user_id=new_agent.user_id,
+            name=current_user.name,
+            rate_per_km=new_agent.rate_per_km,
+            wallet_balance=new_agent.wallet_balance,
+            is_online=new_agent.is_online,
+            avg_rating=new_agent.avg_rating,
+            total_ratings=new_agent.total_ratings,
+            kyc_status=new_agent.kyc_status,
+            categories=[cat.name for cat in categories]
         )
-        db.add(agent_category)
-    
-    db.commit()
-    
-    # Get categories for response
-    categories = db.query(Category.name).join(
-        AgentCategory, Category.id == AgentCategory.category_id
-    ).filter(
-        AgentCategory.agent_id == new_agent.id
-    ).all()
-    
-    return AgentProfileResponse(
-        id=new_agent.id,
-        user_id=new_agent.user_id,
-        name=current_user.name,
-        rate_per_km=new_agent.rate_per_km,
-        wallet_balance=new_agent.wallet_balance,
-        is_online=new_agent.is_online,
-        avg_rating=new_agent.avg_rating,
-        total_ratings=new_agent.total_ratings,
-        kyc_status=new_agent.kyc_status,
-        categories=[cat.name for cat in categories]
-    )
+
+    return await write_queue.run(create)
 
 class UpdateStatusRequest(BaseModel):
     is_online: bool
@@ -473,30 +733,64 @@ class UpdateStatusRequest(BaseModel):
 @router.put("/status")
 async def update_agent_status(
     status_data: UpdateStatusRequest,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user)
 ):
     """Update agent online/offline status"""
-    # Find agent by user_id
-    agent = db.query(Agent).filter(Agent.user_id == current_user.id).first()
-    
-    if not agent:
+    user_id = current_user.id
+
+    def update(db: Session):
+        # Find agent by user_id
+        agent = db.query(Agent).filter(Agent.user_id == user_id).first()
+
+        if not agent:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Agent profile not found"
+            )
+
+        # Update status; going online manually also ends an automatic break
+        agent.is_online = status_data.is_online
+        if status_data.is_online:
+            agent.offline_until = None
+        else:
+            agent.last_online = datetime.utcnow()
+        return agent.id, agent.is_online
+
+    agent_id, is_online = await write_queue.run(update)
+    presence.set_online(agent_id, is_online)
+
+    return {
+        "success": True,
+        "message": f"Agent status updated to {'online' if status_data.is_online else 'offline'}",
+        "is_online": is_online
+    }
+
+@router.post("/heartbeat")
+async def agent_heartbeat(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """Keep the agent's presence alive; the app calls this every heartbeat_interval seconds"""
+    card = _agent_card(db, user_id=current_user.id)
+    if card is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Agent profile not found"
         )
-    
-    # Update status
-    agent.is_online = status_data.is_online
-    db.commit()
-    db.refresh(agent)
-    
+
+    presence.heartbeat(card["id"])
+    offline_until = presence.offline_until(card["id"])
     return {
-        "success": True,
-        "message": f"Agent status updated to {'online' if status_data.is_online else 'offline'}",
-        "is_online": agent.is_online
+        "is_online": presence.is_online(card["id"]),
+        "offline_until": offline_until.isoformat() if offline_until else None,
+        "heartbeat_interval": HEARTBEAT_INTERVAL
     }
 
+@router.get("/presence/stats")
+async def get_presence_stats():
+    """Counters of the presence tracker"""
+    return presence.stats()
+
 class UpdateLocationRequest(BaseModel):
     latitude: float
     longitude: float
@@ -505,29 +799,31 @@ class UpdateLocationRequest(BaseModel):
 @router.put("/location")
 async def update_agent_location(
     location_data: UpdateLocationRequest,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user)
 ):
     """Update agent current location"""
-    # Find agent by user_id
-    agent = db.query(Agent).filter(Agent.user_id == current_user.id).first()
-    
-    if not agent:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Agent profile not found"
-        )
-    
-    # Update user location (stored as "lat,lng")
-    location_string = f"{location_data.latitude},{location_data.longitude}"
-    current_user.location = location_string
-    
-    # Update timestamp
-    from datetime import datetime
-    agent.updated_at = datetime.utcnow()
-    
-    db.commit()
-    
+    user_id = current_user.id
+
+    def update(db: Session):
+        # Find agent by user_id
+        agent = db.query(Agent).filter(Agent.user_id == user_id).first()
+
+        if not agent:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Agent profile not found"
+            )
+
+        # Update user location (stored as "lat,lng")
+        location_string = f"{location_data.latitude},{location_data.longitude}"
+        user = db.query(User).filter(User.id == user_id).first()
+        user.location = location_string
+
+        # Update timestamp
+        agent.updated_at = datetime.utcnow()
+
+    await write_queue.run(update)
+
     return {
         "success": True,
         "message": "Location updated successfully",
@@ -536,4 +832,4 @@ async def update_agent_location(
             "longitude": location_data.longitude,
             "area": location_data.area
         }
-    }
\ No newline at end of file
+    }
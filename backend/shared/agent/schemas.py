@@ -0,0 +1,27 @@
+"""Response models of the agent endpoints"""
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+class AgentResponse(BaseModel):
+    id: int
+    user_id: int
+    name: str
+    rate_per_km: float
+    is_online: bool
+    avg_rating: float
+    total_ratings: int
+    distance_km: Optional[float] = None
+    categories: List[str] = []
+
+class AgentProfileResponse(BaseModel):
+    id: int
+    user_id: int
+    name: str
+    rate_per_km: float
+    wallet_balance: float
+    is_online: bool
+    avg_rating: float
+    total_ratings: int
+    kyc_status: str
+    categories: List[str] = []
@@ -0,0 +1,296 @@
+"""
+Shared agent snapshot for multi-worker serving.
+
+With several worker processes, each would otherwise build its own listing
+candidates from SQLite. Instead one worker (the holder of an flock on
+<path>.lock) writes the AgentRecords (shared.agent.records) of every listed
+agent into a file, column by column, plus the category names. All workers
+mmap the file read-only and wrap the mapped columns in an AgentRecords
+view, so nearby, list and search candidates come from the same scan and
+converters as in-process records, and the snapshot exists once in the page
+cache however many workers read it.
+
+Rows are stored best ranked first (the listing order), so a scan yields
+candidates in the same order as the agent_cards queries it replaces.
+
+Publishing is an atomic swap: the builder writes a new file, renames it
+over the old one and then bumps the generation counter in <path>.gen.
+Readers compare that counter (one read from a mapped page) with the
+generation they hold and remap when it moved; a reader still using the old
+mapping keeps a consistent view of the old file. The builder rebuilds when
+the agent change feed or the category version moves, and at least every
+MAX_AGE. If it exits, another worker takes the lock over.
+
+Enabled by setting AGENT_SNAPSHOT_PATH (python main.py does this when
+WORKERS > 1).
+"""
+import asyncio
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import time
+from array import array
+from typing import Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, select
+
+from ..database import ReadSessionLocal
+from ..changefeed import AgentChange
+from ..versions import current_version
+from .records import AgentRecords, ROW_COLUMNS, NAME_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PATH = os.getenv("AGENT_SNAPSHOT_PATH")
+POLL_INTERVAL = 0.5  # seconds between change checks (builder) and lock attempts (others)
+MAX_AGE = float(os.getenv("AGENT_SNAPSHOT_MAX_AGE", "30"))  # seconds; rebuild at least this often
+
+MAGIC = b"CKAS"
+FORMAT = 2
+# magic, format, generation, built_at, agents, bitset words per agent, distinct
+# names, categories, then byte lengths of the name, lowercase name and
+# category name blobs
+_HEADER = struct.Struct("<4sIQdIIIIQQQ")
+_GENERATION = struct.Struct("<Q")
+
+def _layout(count: int, words: int, distinct: int, categories: int, names: int, lowered: int, category_names: int):
+    """(column, typecode, length) in file order: the AgentRecords columns, then the categories"""
+    lengths = {
+        "category_bits": count * words,
+        "name_offsets": distinct + 1,
+        "lower_offsets": distinct + 1,
+        "names": names,
+        "lower_names": lowered,
+    }
+    return [(name, typecode, lengths.get(name, count)) for name, typecode in ROW_COLUMNS + NAME_COLUMNS] + [
+        ("category_ids", "i", categories),
+        ("category_offsets", "I", categories + 1),
+        ("category_names", "B", category_names),
+    ]
+
+def _offsets(layout):
+    """Byte offset of each column, each aligned to 8"""
+    offsets, position = {}, _HEADER.size
+    for name, typecode, length in layout:
+        position = (position + 7) & ~7
+        offsets[name] = position
+        position += length * array(typecode).itemsize
+    return offsets, position
+
+def _strings(values: List[str]):
+    offsets, blob = array("I", [0]), bytearray()
+    for value in values:
+        blob += value.encode("utf-8")
+        offsets.append(len(blob))
+    return offsets, bytes(blob)
+
+def build(db, generation: int) -> bytes:
+    """The snapshot file contents for the listed agents"""
+    records = AgentRecords.load(db)
+    categories = records.categories
+    columns = records.columns()
+    columns["category_ids"] = array("i", [category_id for category_id, _ in categories])
+    columns["category_offsets"], columns["category_names"] = _strings([name for _, name in categories])
+
+    layout = _layout(len(records), records.words, len(records.name_offsets) - 1, len(categories),
+                     len(records.names), len(records.lower_names), len(columns["category_names"]))
+    offsets, size = _offsets(layout)
+    data = bytearray(size)
+    _HEADER.pack_into(data, 0, MAGIC, FORMAT, generation, time.time(), len(records), records.words,
+                      len(records.name_offsets) - 1, len(categories), len(records.names), len(records.lower_names),
+                      len(columns["category_names"]))
+    for name, _, _ in layout:
+        raw = memoryview(columns[name]).cast("B")
+        data[offsets[name]:offsets[name] + len(raw)] = raw
+    return bytes(data)
+
+class Snapshot:
+    """One mapped snapshot file, read through AgentRecords over memoryviews into the mapping"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, file_format, self.generation, self.built_at, self.count, words, distinct, categories, \
+            names, lowered, category_names = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or file_format != FORMAT:
+            raise ValueError(f"{path} is not an agent snapshot (format {FORMAT})")
+        layout = _layout(self.count, words, distinct, categories, names, lowered, category_names)
+        offsets, _ = _offsets(layout)
+        view = memoryview(self._mmap)
+        columns = {}
+        for name, typecode, length in layout:
+            size = length * array(typecode).itemsize
+            columns[name] = view[offsets[name]:offsets[name] + size].cast(typecode)
+        category_offsets, blob = columns["category_offsets"], columns["category_names"]
+        self.categories = [
+            (category_id, bytes(blob[category_offsets[i]:category_offsets[i + 1]]).decode("utf-8"))
+            for i, category_id in enumerate(columns["category_ids"])
+        ]
+        self.records = AgentRecords.view(columns, self.categories)
+
+    def candidates(self, category_ids=None, is_online=None, latitude=None, longitude=None,
+                   within_km=None, text: Optional[str] = None) -> list:
+        """
+        Listed agents in ranking order: in any of category_ids (None for
+        all), with the online flag, within within_km of (latitude,
+        longitude), and, if text is given, whose name contains it or who
+        are in one of category_ids
+        """
+        records = self.records
+        return [
+            records.to_dict(row)
+            for row in records.scan(is_online=is_online, latitude=latitude, longitude=longitude,
+                                    within_km=within_km, category_ids=category_ids, text=text)
+        ]
+
+    def search(self, text: str, is_online=None, latitude=None, longitude=None, within_km=None) -> list:
+        """Listed agents whose name or one of whose category names contains text"""
+        needle = text.lower()
+        matching = [category_id for category_id, name in self.categories if needle in name.lower()]
+        return self.candidates(matching, is_online, latitude, longitude, within_km, text=text)
+
+class AgentSnapshot:
+    """This worker's view of the shared snapshot, and the builder when it holds the lock"""
+
+    def __init__(self, path: Optional[str] = SNAPSHOT_PATH):
+        self.path = path
+        self._current: Optional[Snapshot] = None
+        self._control = None  # mapped <path>.gen
+        self._lock_file = None
+        self._task = None
+        self._built_signal = None
+        self._built_at = 0.0
+        self.builds = 0
+        self.swaps = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    @property
+    def builder(self) -> bool:
+        return self._lock_file is not None
+
+    # Reading
+
+    def _published_generation(self) -> int:
+        if self._control is None:
+            try:
+                with open(f"{self.path}.gen", "rb") as f:
+                    self._control = mmap.mmap(f.fileno(), _GENERATION.size, access=mmap.ACCESS_READ)
+            except (FileNotFoundError, ValueError):
+                return 0
+        return _GENERATION.unpack_from(self._control, 0)[0]
+
+    def current(self) -> Optional[Snapshot]:
+        """The latest published snapshot, or None if there is none yet"""
+        if not self.enabled:
+            return None
+        generation = self._published_generation()
+        current = self._current
+        if generation and (current is None or current.generation < generation):
+            try:
+                current = Snapshot(self.path)
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not map agent snapshot {self.path}: {e}")
+                return self._current
+            self._current = current
+            self.swaps += 1
+        return current
+
+    # Building
+
+    def _try_lock(self) -> bool:
+        lock_file = open(f"{self.path}.lock", "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        logger.info(f"This worker (pid {os.getpid()}) now builds the agent snapshot")
+        return True
+
+    def _signal(self, db):
+        return (
+            db.execute(select(func.max(AgentChange.seq))).scalar() or 0,
+            current_version(db, "categories"),
+        )
+
+    def refresh(self, force: bool = False) -> bool:
+        """Builder only: publish a new snapshot if the data changed; returns True if it did"""
+        db = ReadSessionLocal()
+        try:
+            signal = self._signal(db)
+            stale = time.monotonic() - self._built_at > MAX_AGE
+            if not force and not stale and signal == self._built_signal:
+                return False
+            generation = self._published_generation() + 1
+            data = build(db, generation)
+        finally:
+            db.close()
+
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(data)
+        os.replace(temporary, self.path)
+        # Bump the counter last, so readers never see a generation whose file isn't in place
+        control_path = f"{self.path}.gen"
+        if not os.path.exists(control_path):
+            with open(control_path, "wb") as f:
+                f.write(_GENERATION.pack(0))
+        with open(control_path, "r+b") as f:
+            with mmap.mmap(f.fileno(), _GENERATION.size) as control:
+                _GENERATION.pack_into(control, 0, generation)
+
+        self._built_signal = signal
+        self._built_at = time.monotonic()
+        self.builds += 1
+        return True
+
+    # Lifecycle
+
+    async def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        if self._try_lock():
+            await run_in_threadpool(self.refresh, True)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if self._lock_file is not None:
+            self._lock_file.close()  # releases the lock for another worker
+            self._lock_file = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(POLL_INTERVAL)
+            try:
+                if self.builder or self._try_lock():
+                    await run_in_threadpool(self.refresh)
+            except Exception as e:
+                logger.error(f"Agent snapshot refresh failed: {e}")
+
+    def stats(self) -> Dict:
+        current = self._current
+        return {
+            "enabled": self.enabled,
+            "builder": self.builder,
+            "generation": current.generation if current else None,
+            "agents": current.count if current else None,
+            "builds": self.builds,
+            "swaps": self.swaps,
+        }
+
+# Process-wide snapshot (inactive unless AGENT_SNAPSHOT_PATH is set)
+agent_snapshot = AgentSnapshot()
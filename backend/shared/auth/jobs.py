@@ -0,0 +1,28 @@
+"""
+Token store upkeep run by the job scheduler: expired reset tokens and
+revocations are deleted in batches, one batch per job.
+"""
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import Session
+
+from ..scheduler import scheduler
+from .tokens import SWEEP_BATCH_SIZE, sweep_expired
+
+logger = logging.getLogger(__name__)
+
+# How often the sweep looks for expired tokens once it has caught up
+SWEEP_INTERVAL = timedelta(minutes=10)
+
+def schedule_token_sweep(db: Session, run_at: datetime = None):
+    """Queue the next sweep unless one is already queued (called at startup)"""
+    scheduler.schedule_once(db, "auth.sweep_tokens", run_at or datetime.utcnow())
+
+@scheduler.handler("auth.sweep_tokens")
+def sweep_tokens(db: Session):
+    deleted = sweep_expired(db.connection())
+    if deleted:
+        logger.info(f"Deleted {deleted} expired tokens")
+    backlog = deleted >= SWEEP_BATCH_SIZE
+    schedule_token_sweep(db, datetime.utcnow() if backlog else datetime.utcnow() + SWEEP_INTERVAL)
@@ -1,10 +1,12 @@
 from datetime import datetime, timedelta
 from typing import Optional
+import uuid
 import jwt
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from ..database import get_db
+from ..database import get_read_db
+from .revocation import revocations
 from passlib.context import CryptContext
 import os
 
@@ -35,26 +37,40 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    # jti and iat let a single token, or all of a user's older ones, be revoked
+    to_encode.update({"exp": expire, "iat": datetime.utcnow(), "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(token: str, credentials_exception):
+def decode_token(token: str, credentials_exception) -> dict:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        return username
     except jwt.PyJWTError:
         raise credentials_exception
+    if payload.get("sub") is None:
+        raise credentials_exception
+    return payload
+
+def verify_token(token: str, credentials_exception):
+    return decode_token(token, credentials_exception)["sub"]
+
+# Scope key under which shared.batch passes the user it authenticated
+BATCH_USER = "clicko.batch_user"
+
+def get_current_user(request: Request, token: str = Depends(oauth2_scheme), db: Session = Depends(get_read_db)):
+    # Sub-requests of a batch reuse the batch's authentication
+    batch_user = request.scope.get(BATCH_USER)
+    if batch_user is not None:
+        return batch_user
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    # Outside the try below: its fallback must not accept a revoked token
+    if revocations.is_revoked(db, decode_token(token, credentials_exception)):
+        raise credentials_exception
     
     try:
         username = verify_token(token, credentials_exception)
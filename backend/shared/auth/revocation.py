@@ -0,0 +1,155 @@
+"""
+Access token revocation check.
+
+Every authenticated request has to know whether its token was revoked, but
+almost none are. The keys in revoked_tokens (shared.auth.tokens) are kept in
+a Bloom filter: a token whose jti and subject keys are both absent from the
+filter is not revoked, with no database access. Only when a key may be
+present (a real revocation, or a false positive at about ERROR_RATE) is the
+row looked up by primary key to decide.
+
+The filter learns new revocations from the change bus, including ones made
+by other workers, and is rebuilt from the table every REBUILD_INTERVAL so
+expired keys (which a Bloom filter can't remove) fall out of it.
+"""
+import asyncio
+import calendar
+import hashlib
+import logging
+import math
+import threading
+from datetime import datetime, timedelta
+from typing import Iterable, List
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from ..database import ReadSessionLocal
+from ..events import change_bus, ChangeEvent, DELETE, REVOKED_TOKEN
+from .tokens import RevokedToken, jti_key, subject_key
+
+logger = logging.getLogger(__name__)
+
+CAPACITY = 100_000
+ERROR_RATE = 0.001
+REBUILD_INTERVAL = timedelta(minutes=10)
+
+class BloomFilter:
+    def __init__(self, capacity: int = CAPACITY, error_rate: float = ERROR_RATE):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        # Double hashing: position i is h1 + i * h2
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+class RevocationList:
+    def __init__(self):
+        self._filter = BloomFilter()
+        self._lock = threading.Lock()
+        self._added_during_load = None  # keys added while load() reads the table
+        self._task = None
+        self.lookups = 0  # exact lookups after a filter hit
+        self.revoked = 0
+
+    def _keys(self, payload: dict) -> List[str]:
+        keys = [jti_key(payload["jti"])] if payload.get("jti") else []
+        if payload.get("sub"):
+            keys.append(subject_key(payload["sub"]))
+        return keys
+
+    def is_revoked(self, db: Session, payload: dict) -> bool:
+        """Whether the decoded access token payload was revoked"""
+        candidates = [key for key in self._keys(payload) if key in self._filter]
+        if not candidates:
+            return False
+        now = datetime.utcnow()
+        for key in candidates:
+            self.lookups += 1
+            row = db.get(RevokedToken, key)
+            if row is None or row.expires_at < now:
+                continue
+            issued_at = payload.get("iat")
+            # Subject keys revoke what was issued before not_before (in JWT's whole seconds)
+            if row.not_before is None or issued_at is None or issued_at < calendar.timegm(row.not_before.utctimetuple()):
+                self.revoked += 1
+                return True
+        return False
+
+    def add(self, keys: Iterable[str]):
+        keys = list(keys)
+        with self._lock:
+            for key in keys:
+                self._filter.add(key)
+            if self._added_during_load is not None:
+                self._added_during_load.extend(keys)
+
+    def load(self):
+        """Rebuild the filter from the unexpired rows"""
+        rebuilt = BloomFilter()
+        with self._lock:
+            self._added_during_load = []
+        db = ReadSessionLocal()
+        try:
+            for key, in db.query(RevokedToken.key).filter(RevokedToken.expires_at >= datetime.utcnow()).yield_per(5000):
+                rebuilt.add(key)
+        finally:
+            db.close()
+        with self._lock:
+            # Revocations committed after the read started may not be in it
+            for key in self._added_during_load:
+                rebuilt.add(key)
+            self._filter = rebuilt
+            self._added_during_load = None
+        if rebuilt.count > CAPACITY:
+            logger.warning(f"{rebuilt.count} revoked tokens exceed the filter capacity of {CAPACITY}")
+
+    # Lifecycle
+
+    async def start(self):
+        if self._task is not None:
+            return
+        await run_in_threadpool(self.load)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(REBUILD_INTERVAL.total_seconds())
+            try:
+                await run_in_threadpool(self.load)
+            except Exception as e:
+                logger.error(f"Rebuilding the revocation filter failed: {e}")
+
+    def stats(self) -> dict:
+        return {"keys": self._filter.count, "lookups": self.lookups, "revoked": self.revoked}
+
+# Process-wide revocation list
+revocations = RevocationList()
+
+def _learn_revocations(events: List[ChangeEvent]):
+    revocations.add(event.id for event in events if event.entity == REVOKED_TOKEN and event.op != DELETE)
+
+change_bus.subscribe(_learn_revocations, inline=True)
@@ -1,12 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Body
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from typing import Optional
-import os
+import jwt
 from ..user.models import User
-from ..database import get_db
-from .jwt import verify_password, get_password_hash, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from ..database import get_read_db
+from ..writer import write_queue
+from .jwt import (
+    verify_password, get_password_hash, create_access_token, get_current_user, oauth2_scheme,
+    ACCESS_TOKEN_EXPIRE_MINUTES, ALGORITHM, SECRET_KEY
+)
+from .tokens import PASSWORD_RESET, issue_reset_token, redeem_token, revoke_subject, revoke_token
+from ..notify.outbox import notify, reset_url
+from . import jobs  # noqa: F401 - registers the token sweep job
 from pydantic import BaseModel, EmailStr
 
 router = APIRouter(prefix="/auth", tags=["auth"])
@@ -39,34 +47,39 @@ class UserLogin(BaseModel):
     email: EmailStr
     password: str
 @router.post("/register", response_model=Token)
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
-    # Check if user already exists
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
-    if existing_user:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already registered"
+async def register(user_data: UserCreate):
+    # Hash outside the writer (and off the event loop) so neither waits on bcrypt
+    hashed_password = await run_in_threadpool(get_password_hash, user_data.password)
+
+    def create(db: Session):
+        # Check if user already exists
+        existing_user = db.query(User).filter(User.email == user_data.email).first()
+        if existing_user:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Email already registered"
+            )
+
+        # Create new user
+        new_user = User(
+            name=user_data.name,
+            email=user_data.email,
+            password_hash=hashed_password,
+            phone=user_data.phone
         )
-    
-    # Create new user
-    hashed_password = get_password_hash(user_data.password)
-    new_user = User(
-        name=user_data.name,
-        email=user_data.email,
-        password_hash=hashed_password,
-        phone=user_data.phone
-    )
-    
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    
+
+        db.add(new_user)
+        db.flush()
+        return new_user
+
+    new_user = await write_queue.run(create)
+
     # Generate access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": new_user.email}, expires_delta=access_token_expires
     )
-    
+
     return {
         "access_token": access_token,
         "token_type": "bearer",
@@ -76,10 +89,11 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     }
 
 @router.post("/login", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_read_db)):
     user = db.query(User).filter(User.email == form_data.username).first()
     
-    if not user or not verify_password(form_data.password, user.password_hash):
+    # bcrypt runs in the threadpool so logins don't stall the event loop
+    if not user or not await run_in_threadpool(verify_password, form_data.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -100,43 +114,51 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
         "is_agent": user.is_agent
     }
 
+@router.post("/logout")
+async def logout(token: str = Depends(oauth2_scheme), current_user: User = Depends(get_current_user)):
+    """Revoke the access token this request was made with"""
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+    def revoke(db: Session):
+        if payload.get("jti"):
+            revoke_token(db, payload["jti"], datetime.utcfromtimestamp(payload["exp"]))
+        else:
+            # Issued before tokens had ids; these can only be revoked all together
+            revoke_subject(db, payload["sub"], timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+
+    await write_queue.run(revoke)
+    return {"message": "Logged out"}
+
 @router.post("/request-password-reset")
-async def request_password_reset(email: str = Body(...), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == email).first()
-    
-    if not user:
-        # Don't reveal that the user doesn't exist
-        return {"message": "If your email is registered, you will receive a password reset link"}
-    
-    # Generate a reset token
-    reset_token = os.urandom(16).hex()
-    user.reset_token = reset_token
-    user.reset_token_expires = datetime.utcnow() + timedelta(hours=1)
-    
-    db.commit()
-    
-    # In production, send an email with the reset link
-    # For now, just return the token for testing
-    return {"message": "If your email is registered, you will receive a password reset link", "token": reset_token}
+async def request_password_reset(email: str = Body(...)):
+    def issue(db: Session):
+        user = db.query(User).filter(User.email == email).first()
+        if user:
+            # The link is emailed through the outbox once this commits
+            notify(db, user, "auth.password_reset", url=reset_url(issue_reset_token(db, user.id)))
+
+    await write_queue.run(issue)
+    # The same answer either way, so it doesn't reveal whether the user exists
+    return {"message": "If your email is registered, you will receive a password reset link"}
 
 @router.post("/reset-password")
 async def reset_password(
     token: str = Body(...), 
-    new_password: str = Body(...), 
-    db: Session = Depends(get_db)
+    new_password: str = Body(...)
 ):
-    user = db.query(User).filter(User.reset_token == token).first()
-    
-    if not user or not user.reset_token_expires or user.reset_token_expires < datetime.utcnow():
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Invalid or expired reset token"
-        )
-    
-    user.password_hash = get_password_hash(new_password)
-    user.reset_token = None
-    user.reset_token_expires = None
-    
-    db.commit()
-    
+    password_hash = await run_in_threadpool(get_password_hash, new_password)
+
+    def reset(db: Session):
+        user_id = redeem_token(db, token, PASSWORD_RESET)
+        user = db.get(User, user_id) if user_id is not None else None
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid or expired reset token"
+            )
+        user.password_hash = password_hash
+        # Sessions from before the reset end with it
+        revoke_subject(db, user.email, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+
+    await write_queue.run(reset)
     return {"message": "Password has been reset successfully"}
@@ -0,0 +1,100 @@
+"""
+Token store.
+
+auth_tokens holds single-use tokens (password resets) by the SHA-256 of the
+token, never the token itself, so a leaked database doesn't leak usable
+links. The hash is the primary key: redeeming a token is one index lookup.
+
+revoked_tokens lists access tokens that must stop working before they
+expire: one token by its jti (logout), or every token of a subject issued
+before not_before (password change). Rows only need to live as long as the
+tokens they revoke, so both tables carry expires_at and sweep_expired()
+deletes expired rows in batches. shared.auth.revocation keeps an in-memory
+filter over revoked_tokens so most requests never query it.
+"""
+import hashlib
+import secrets
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import Column, Integer, String, DateTime, Index, delete, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from ..database import Base
+
+PASSWORD_RESET = "password_reset"
+RESET_TOKEN_TTL = timedelta(hours=1)
+SWEEP_BATCH_SIZE = 1000
+
+class AuthToken(Base):
+    __tablename__ = "auth_tokens"
+    __table_args__ = (
+        Index("ix_auth_tokens_expires_at", "expires_at"),
+        Index("ix_auth_tokens_user_id_kind", "user_id", "kind"),
+    )
+
+    token_hash = Column(String, primary_key=True)
+    kind = Column(String, nullable=False)
+    user_id = Column(Integer, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+    __table_args__ = (
+        Index("ix_revoked_tokens_expires_at", "expires_at"),
+    )
+
+    key = Column(String, primary_key=True)  # see jti_key and subject_key
+    not_before = Column(DateTime, nullable=True)  # subject keys: tokens issued earlier are revoked
+    expires_at = Column(DateTime, nullable=False)
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def jti_key(jti: str) -> str:
+    return f"jti:{jti}"
+
+def subject_key(subject: str) -> str:
+    return f"sub:{subject}"
+
+def issue_reset_token(db: Session, user_id: int) -> str:
+    """A new password reset token for the user, replacing any earlier one"""
+    db.execute(delete(AuthToken).where(AuthToken.user_id == user_id, AuthToken.kind == PASSWORD_RESET))
+    token = secrets.token_urlsafe(32)
+    db.add(AuthToken(
+        token_hash=hash_token(token),
+        kind=PASSWORD_RESET,
+        user_id=user_id,
+        expires_at=datetime.utcnow() + RESET_TOKEN_TTL
+    ))
+    return token
+
+def redeem_token(db: Session, token: str, kind: str) -> Optional[int]:
+    """The user id of an unexpired token of this kind, which is used up; None if there is none"""
+    stored = db.get(AuthToken, hash_token(token))
+    if stored is None or stored.kind != kind:
+        return None
+    db.delete(stored)
+    if stored.expires_at < datetime.utcnow():
+        return None
+    return stored.user_id
+
+def revoke_token(db: Session, jti: str, expires_at: datetime):
+    """Revoke one access token (until it would have expired anyway)"""
+    db.merge(RevokedToken(key=jti_key(jti), expires_at=expires_at))
+
+def revoke_subject(db: Session, subject: str, lifetime: timedelta):
+    """Revoke every access token of the subject issued until now; lifetime is the longest token lifetime"""
+    now = datetime.utcnow()
+    db.merge(RevokedToken(key=subject_key(subject), not_before=now, expires_at=now + lifetime))
+
+def sweep_expired(connection: Connection, now: datetime = None, batch_size: int = SWEEP_BATCH_SIZE) -> int:
+    """Delete up to batch_size expired rows from each table; returns how many were deleted"""
+    now = now or datetime.utcnow()
+    deleted = 0
+    for key, expires_at in ((AuthToken.token_hash, AuthToken.expires_at), (RevokedToken.key, RevokedToken.expires_at)):
+        expired = select(key).where(expires_at < now).limit(batch_size)
+        deleted += connection.execute(delete(key.table).where(key.in_(expired))).rowcount
+    return deleted
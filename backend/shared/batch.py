@@ -0,0 +1,139 @@
+"""
+Multiplexed read requests.
+
+POST /api/batch runs several GET sub-requests in one round trip. The batch
+authenticates once and opens one read session; each sub-request is passed
+to the app (with a scope built for it) and its dependencies pick up that
+session and user instead of opening their own. Sub-requests run
+concurrently on the event loop, interleaving wherever they wait (cache
+loads, admission), and nothing touching the shared session is moved to a
+worker thread while they run.
+
+Sub-requests go through the middleware like any other request, so each is
+admitted and rate limited by its own route class.
+"""
+import asyncio
+from typing import Dict, List, Optional
+from urllib.parse import urlencode
+
+from fastapi import APIRouter, HTTPException, Request, status
+from fastapi.responses import Response
+from pydantic import BaseModel, Field
+
+from .database import ReadSessionLocal, BATCH_SESSION, session_shared
+from .auth.jwt import oauth2_scheme, get_current_user, BATCH_USER
+from .responses import dumps
+
+router = APIRouter(prefix="/batch", tags=["batch"])
+
+MAX_SUB_REQUESTS = 20
+# Request headers passed on to sub-requests
+_FORWARDED_HEADERS = {b"authorization", b"accept", b"accept-language"}
+
+class SubRequest(BaseModel):
+    id: str
+    method: str = "GET"
+    path: str  # e.g. /api/agents/12 or /api/agents/nearby?latitude=...
+    query: Optional[Dict[str, str]] = None
+
+class BatchRequest(BaseModel):
+    requests: List[SubRequest] = Field(..., min_length=1)
+
+def _sub_scope(request: Request, sub: SubRequest, db, user) -> dict:
+    path, _, query_string = sub.path.partition("?")
+    if sub.query:
+        query_string = "&".join(part for part in (query_string, urlencode(sub.query)) if part)
+    parent = request.scope
+    scope = {
+        "type": "http",
+        "asgi": parent.get("asgi", {"version": "3.0"}),
+        "http_version": parent.get("http_version", "1.1"),
+        "method": "GET",
+        "scheme": parent["scheme"],
+        "server": parent.get("server"),
+        "client": parent.get("client"),
+        "root_path": parent.get("root_path", ""),
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query_string.encode(),
+        "headers": [(name, value) for name, value in parent["headers"] if name in _FORWARDED_HEADERS],
+        "state": dict(parent.get("state", {})),
+        BATCH_SESSION: db,
+        BATCH_USER: user,
+    }
+    return scope
+
+async def _run(request: Request, sub: SubRequest, db, user) -> bytes:
+    """The sub-request's result as a JSON object"""
+    scope = _sub_scope(request, sub, db, user)
+    started = {}
+    chunks = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            started.update(message)
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    try:
+        await request.app(scope, receive, send)
+    except Exception:
+        # Already logged, and answered with a 500, by the error middleware
+        if started:
+            return dumps({"id": sub.id, "status": started["status"], "body": {"detail": "Internal server error"}})
+        return dumps({"id": sub.id, "status": 500, "body": {"detail": "Internal server error"}})
+
+    body = b"".join(chunks)
+    headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in started.get("headers", [])}
+    head = {"id": sub.id, "status": started.get("status", 500)}
+    if "etag" in headers:
+        head["etag"] = headers["etag"]
+    # JSON bodies are spliced in as they are rather than decoded and re-encoded
+    if not headers.get("content-type", "").startswith("application/json") or not body:
+        head["body"] = body.decode("utf-8", "replace") if body else None
+        return dumps(head)
+    return dumps(head)[:-1] + b',"body":' + body + b"}"
+
+@router.post("")
+async def run_batch(batch: BatchRequest, request: Request):
+    """
+    Run up to MAX_SUB_REQUESTS read (GET) requests under one authentication
+    and one database session and return their results together, in order:
+    {"responses": [{"id", "status", "etag"?, "body"}]}. Each sub-request
+    succeeds or fails on its own; a bad token fails the whole batch.
+    """
+    if len(batch.requests) > MAX_SUB_REQUESTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_SUB_REQUESTS} requests can be batched"
+        )
+    for sub in batch.requests:
+        if sub.method.upper() != "GET":
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Request {sub.id}: only GET requests can be batched"
+            )
+        if not sub.path.startswith("/api/") or sub.path.startswith("/api/batch"):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Request {sub.id}: path must be an /api/ endpoint"
+            )
+
+    db = ReadSessionLocal()
+    token = session_shared.set(True)
+    try:
+        user = None
+        if request.headers.get("authorization"):
+            user = get_current_user(request, await oauth2_scheme(request), db)
+        results = await asyncio.gather(*(_run(request, sub, db, user) for sub in batch.requests))
+    finally:
+        session_shared.reset(token)
+        db.close()
+
+    return Response(
+        b'{"responses":[' + b",".join(results) + b"]}",
+        media_type="application/json"
+    )
@@ -0,0 +1 @@
+# Booking module
\ No newline at end of file
@@ -0,0 +1,96 @@
+"""
+Cold storage for finished bookings.
+
+Bookings that reached a final status (completed, cancelled, rejected,
+expired) and were scheduled more than ARCHIVE_AFTER ago are moved, with
+their ratings, from bookings and ratings into bookings_archive and
+ratings_archive. The hot tables then only hold recent and open bookings,
+which is what dispatch, availability and the scheduler read.
+
+archive_batch() moves at most one batch per call, so each transaction is
+short and other writes get the write lock in between. The booking.archive
+job (shared.booking.jobs) calls it repeatedly; archive_bookings.py runs it
+by hand. Booking ids are kept, so an archived booking has the same id it
+had in the hot table and history can page across both.
+"""
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import Column, Integer, String, Float, DateTime, Index, delete, func, insert, literal, select
+from sqlalchemy.engine import Connection
+
+from ..database import Base
+from ..user.models import Booking, Rating
+
+ARCHIVE_AFTER = timedelta(days=int(os.getenv("BOOKING_ARCHIVE_AFTER_DAYS", "90")))
+ARCHIVE_BATCH_SIZE = int(os.getenv("BOOKING_ARCHIVE_BATCH_SIZE", "500"))
+# Final statuses; bookings in any other status are never archived
+ARCHIVED_STATUSES = ("completed", "cancelled", "rejected", "expired")
+
+class BookingArchive(Base):
+    __tablename__ = "bookings_archive"
+    __table_args__ = (
+        # Same history indexes as bookings; see shared.booking.history
+        Index("ix_bookings_archive_user_id_status_scheduled_time", "user_id", "status", "scheduled_time"),
+        Index("ix_bookings_archive_user_id_scheduled_time", "user_id", "scheduled_time"),
+        Index("ix_bookings_archive_agent_id_status_scheduled_time", "agent_id", "status", "scheduled_time"),
+        Index("ix_bookings_archive_agent_id_scheduled_time", "agent_id", "scheduled_time"),
+    )
+
+    id = Column(Integer, primary_key=True)  # the booking's id
+    user_id = Column(Integer, nullable=False)
+    agent_id = Column(Integer, nullable=False)
+    category_id = Column(Integer, nullable=False)
+    status = Column(String, nullable=False)
+    scheduled_time = Column(DateTime, nullable=False)
+    visit_charge = Column(Float, nullable=False)
+    user_location = Column(String, nullable=False)
+    address = Column(String, nullable=False)
+    notes = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime, nullable=False)
+
+class RatingArchive(Base):
+    __tablename__ = "ratings_archive"
+
+    booking_id = Column(Integer, primary_key=True)
+    id = Column(Integer, nullable=False)  # the rating's id
+    rating = Column(Integer, nullable=False)
+    feedback = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=True)
+
+_BOOKING_COLUMNS = ("id", "user_id", "agent_id", "category_id", "status", "scheduled_time", "visit_charge",
+                    "user_location", "address", "notes", "created_at", "updated_at")
+_RATING_COLUMNS = ("booking_id", "id", "rating", "feedback", "created_at")
+
+def archive_batch(connection: Connection, now: datetime = None, batch_size: int = None) -> int:
+    """Move one batch of old finished bookings; returns how many were moved"""
+    now = now or datetime.utcnow()
+    batch_size = batch_size or ARCHIVE_BATCH_SIZE
+
+    booking_ids = connection.execute(
+        select(Booking.id).where(
+            Booking.status.in_(ARCHIVED_STATUSES),
+            Booking.scheduled_time < now - ARCHIVE_AFTER,
+            # bookings.id isn't AUTOINCREMENT, so SQLite would hand the
+            # highest id out again once it left the table
+            Booking.id < select(func.max(Booking.id)).scalar_subquery()
+        ).limit(batch_size)
+    ).scalars().all()
+    if not booking_ids:
+        return 0
+
+    connection.execute(insert(BookingArchive).from_select(
+        [*_BOOKING_COLUMNS, "archived_at"],
+        select(*(getattr(Booking, name) for name in _BOOKING_COLUMNS), literal(now)).where(
+            Booking.id.in_(booking_ids)
+        )
+    ))
+    connection.execute(insert(RatingArchive).from_select(
+        list(_RATING_COLUMNS),
+        select(*(getattr(Rating, name) for name in _RATING_COLUMNS)).where(Rating.booking_id.in_(booking_ids))
+    ))
+    connection.execute(delete(Rating).where(Rating.booking_id.in_(booking_ids)))
+    connection.execute(delete(Booking).where(Booking.id.in_(booking_ids)))
+    return len(booking_ids)
@@ -0,0 +1,148 @@
+"""
+Booking history pages.
+
+Pages are keyset paginated on (scheduled_time, id): the cursor is the last
+booking of the previous page and the next page starts right after it in
+index order, so page N costs the same as page 1 however many bookings the
+user or agent has.
+
+The page query reads only the owner, status and scheduled_time index
+(whose entries end with the rowid, the booking id), so it never touches the
+table. A filter covering several statuses runs one such query per status
+and merges them, since a single query over "status IN (...)" would have to
+sort every matching booking. The page's bookings and their agent, user,
+category and rating details are then loaded by id, one query each.
+
+Finished bookings may have moved to bookings_archive (shared.booking.archive)
+with their ids unchanged. Every page merges runs from both tables, so
+archival never shows up in the results.
+"""
+import heapq
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import Session
+
+from ..user.models import User, Agent, Category, Booking, Rating
+from .archive import ARCHIVED_STATUSES, BookingArchive, RatingArchive
+
+# filter -> (statuses, oldest first); no filter lists every booking, newest first
+HISTORY_FILTERS = {
+    "upcoming": (("pending", "accepted"), True),
+    "completed": (("completed",), False),
+    "cancelled": (("cancelled", "rejected", "expired"), False),
+}
+
+Cursor = Tuple[datetime, int]
+
+def encode_cursor(scheduled_time: datetime, booking_id: int) -> str:
+    return f"{scheduled_time.isoformat()},{booking_id}"
+
+def decode_cursor(cursor: str) -> Cursor:
+    """Raises ValueError for a malformed cursor"""
+    moment, booking_id = cursor.rsplit(",", 1)
+    return datetime.fromisoformat(moment), int(booking_id)
+
+def _page_keys(db: Session, model, owner: str, owner_id: int, status: Optional[str], ascending: bool,
+               after: Optional[Cursor], limit: int) -> List[Cursor]:
+    """(scheduled_time, id) of the next limit bookings in model's table, from the covering index"""
+    key = tuple_(model.scheduled_time, model.id)
+    query = select(model.scheduled_time, model.id).where(getattr(model, owner) == owner_id)
+    if status is not None:
+        query = query.where(model.status == status)
+    if after is not None:
+        query = query.where(key > tuple_(*after) if ascending else key < tuple_(*after))
+    if ascending:
+        query = query.order_by(model.scheduled_time, model.id)
+    else:
+        query = query.order_by(model.scheduled_time.desc(), model.id.desc())
+    return [tuple(row) for row in db.execute(query.limit(limit))]
+
+def page_keys(db: Session, owner: str, owner_id: int, statuses: Optional[Sequence[str]], ascending: bool,
+              after: Optional[Cursor], limit: int) -> List[Cursor]:
+    """
+    Keys of the next limit bookings across the statuses (all if None) in
+    both tables, in page order. owner is "user_id" or "agent_id".
+    """
+    runs = []
+    for model in (Booking, BookingArchive):
+        if statuses is None:
+            runs.append(_page_keys(db, model, owner, owner_id, None, ascending, after, limit))
+            continue
+        for status in statuses:
+            if model is BookingArchive and status not in ARCHIVED_STATUSES:
+                continue
+            runs.append(_page_keys(db, model, owner, owner_id, status, ascending, after, limit))
+    return list(heapq.merge(*runs, reverse=not ascending))[:limit]
+
+def load_history(db: Session, booking_ids: Sequence[int]) -> Dict[int, dict]:
+    """Bookings by id with agent, customer, category and rating details"""
+    if not booking_ids:
+        return {}
+    bookings = db.execute(select(Booking).where(Booking.id.in_(booking_ids))).scalars().all()
+    archived = set(booking_ids) - {booking.id for booking in bookings}
+    if archived:
+        bookings += db.execute(select(BookingArchive).where(BookingArchive.id.in_(archived))).scalars().all()
+
+    agent_ids = {booking.agent_id for booking in bookings}
+    agent_names = dict(db.execute(
+        select(Agent.id, User.name).join(User, Agent.user_id == User.id).where(Agent.id.in_(agent_ids))
+    ).all())
+    user_names = dict(db.execute(
+        select(User.id, User.name).where(User.id.in_({booking.user_id for booking in bookings}))
+    ).all())
+    category_names = dict(db.execute(
+        select(Category.id, Category.name).where(Category.id.in_({booking.category_id for booking in bookings}))
+    ).all())
+    ratings = {
+        row.booking_id: row for row in db.execute(
+            select(Rating.booking_id, Rating.rating, Rating.feedback).where(Rating.booking_id.in_(booking_ids))
+        )
+    }
+    if archived:
+        ratings.update((row.booking_id, row) for row in db.execute(
+            select(RatingArchive.booking_id, RatingArchive.rating, RatingArchive.feedback).where(
+                RatingArchive.booking_id.in_(archived)
+            )
+        ))
+
+    history = {}
+    for booking in bookings:
+        rating = ratings.get(booking.id)
+        history[booking.id] = {
+            "id": booking.id,
+            "user_id": booking.user_id,
+            "user_name": user_names.get(booking.user_id),
+            "agent_id": booking.agent_id,
+            "agent_name": agent_names.get(booking.agent_id),
+            "category_id": booking.category_id,
+            "category_name": category_names.get(booking.category_id),
+            "status": booking.status,
+            "scheduled_time": booking.scheduled_time,
+            "visit_charge": booking.visit_charge,
+            "address": booking.address,
+            "notes": booking.notes,
+            "created_at": booking.created_at,
+            "rating": rating.rating if rating else None,
+            "feedback": rating.feedback if rating else None,
+        }
+    return history
+
+def history_page(db: Session, owner: str, owner_id: int, filter: Optional[str],
+                 cursor: Optional[str], limit: int) -> dict:
+    """
+    One page of an owner's bookings (owner is "user_id" or "agent_id").
+    Raises ValueError for a malformed cursor.
+    """
+    statuses, ascending = HISTORY_FILTERS[filter] if filter else (None, False)
+    after = decode_cursor(cursor) if cursor else None
+
+    keys = page_keys(db, owner, owner_id, statuses, ascending, after, limit + 1)
+    has_more = len(keys) > limit
+    keys = keys[:limit]
+    details = load_history(db, [booking_id for _, booking_id in keys])
+    return {
+        "bookings": [details[booking_id] for _, booking_id in keys if booking_id in details],
+        "next_cursor": encode_cursor(*keys[-1]) if has_more else None,
+    }
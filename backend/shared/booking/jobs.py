@@ -0,0 +1,74 @@
+"""
+Timed booking work run by the job scheduler.
+
+Handlers re-check the booking or agent state before acting, so a job that
+became moot (booking accepted before it expired, cooldown overridden) is a
+no-op.
+"""
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import Session
+
+from ..scheduler import scheduler
+from ..user.models import Agent, Booking
+from .archive import ARCHIVE_BATCH_SIZE, archive_batch
+from .notifications import notify_booking
+
+logger = logging.getLogger(__name__)
+
+# How long an agent has to accept a booking that isn't scheduled later
+ACCEPT_WINDOW = timedelta(minutes=15)
+# How long before a scheduled booking the reminder fires
+REMINDER_LEAD = timedelta(minutes=30)
+# Automatic offline period after an agent accepts a booking
+AGENT_COOLDOWN = timedelta(hours=2)
+# How often archival looks for finished bookings once it has caught up
+ARCHIVE_INTERVAL = timedelta(hours=1)
+
+def schedule_expiry(db: Session, booking: Booking):
+    """Expire the booking if it is still pending when its accept window closes"""
+    expires_at = max(booking.scheduled_time, datetime.utcnow() + ACCEPT_WINDOW)
+    scheduler.schedule(db, "booking.expire", expires_at, booking_id=booking.id)
+
+def schedule_acceptance_jobs(db: Session, booking: Booking, cooldown_until: datetime):
+    """Reminder before a scheduled booking, and the end of the agent's cooldown"""
+    remind_at = booking.scheduled_time - REMINDER_LEAD
+    if remind_at > datetime.utcnow():
+        scheduler.schedule(db, "booking.reminder", remind_at, booking_id=booking.id)
+    scheduler.schedule(db, "agent.cooldown_end", cooldown_until, agent_id=booking.agent_id)
+
+def schedule_archival(db: Session, run_at: datetime = None):
+    """Queue the next archival run unless one is already queued (called at startup)"""
+    scheduler.schedule_once(db, "booking.archive", run_at or datetime.utcnow())
+
+@scheduler.handler("booking.expire")
+def expire_booking(db: Session, booking_id: int):
+    booking = db.get(Booking, booking_id)
+    if booking is not None and booking.status == "pending":
+        booking.status = "expired"
+        logger.info(f"Booking {booking_id} expired without being accepted")
+
+@scheduler.handler("booking.reminder")
+def remind_booking(db: Session, booking_id: int):
+    booking = db.get(Booking, booking_id)
+    if booking is not None and booking.status == "accepted":
+        notify_booking(db, booking, "booking.reminder", "user", "agent")
+
+@scheduler.handler("agent.cooldown_end")
+def end_agent_cooldown(db: Session, agent_id: int):
+    # The presence tracker lifts the break in memory; this makes sure the
+    # column is cleared even if the worker that accepted the booking is gone
+    agent = db.get(Agent, agent_id)
+    if agent is not None and agent.offline_until is not None and agent.offline_until <= datetime.utcnow():
+        agent.offline_until = None
+
+@scheduler.handler("booking.archive")
+def archive_bookings(db: Session):
+    # One batch per job, so the write lock is released between batches
+    moved = archive_batch(db.connection())
+    if moved:
+        logger.info(f"Archived {moved} finished bookings")
+    # Straight on to the next batch while there is a backlog
+    backlog = moved == ARCHIVE_BATCH_SIZE
+    schedule_archival(db, datetime.utcnow() if backlog else datetime.utcnow() + ARCHIVE_INTERVAL)
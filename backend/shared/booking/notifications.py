@@ -0,0 +1,23 @@
+"""
+Booking notifications, queued in the outbox (shared.notify) in the same
+transaction as the booking change they announce.
+"""
+from sqlalchemy.orm import Session
+
+from ..notify.outbox import notify
+from ..user.models import Booking, Category
+
+def notify_booking(db: Session, booking: Booking, kind: str, *recipients: str):
+    """Queue the kind's message about the booking to "user" and/or "agent" """
+    customer = booking.user
+    agent_user = booking.agent.user
+    category = db.get(Category, booking.category_id)
+    fields = {
+        "customer": customer.name,
+        "agent": agent_user.name,
+        "category": category.name if category else "service",
+        "time": booking.scheduled_time.strftime("%d %b %H:%M UTC"),
+    }
+    data = {"booking_id": booking.id, "status": booking.status}
+    for recipient in recipients:
+        notify(db, customer if recipient == "user" else agent_user, kind, data=data, **fields)
@@ -0,0 +1,353 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from ..database import get_read_db
+from ..writer import write_queue
+from ..auth.jwt import get_current_user
+from ..user.models import User, Agent, AgentCategory, Booking, Rating
+from ..agent.geo import agent_position, calculate_distance
+from ..agent.presence import presence
+from ..agent.ranking import add_rating
+from ..scheduler import scheduler
+from .jobs import AGENT_COOLDOWN, schedule_expiry, schedule_acceptance_jobs
+from .history import HISTORY_FILTERS, history_page
+from .notifications import notify_booking
+from pydantic import BaseModel, Field
+from datetime import datetime
+
+router = APIRouter(prefix="/bookings", tags=["bookings"])
+
+class CreateBookingRequest(BaseModel):
+    agent_id: int
+    category_id: int
+    latitude: float
+    longitude: float
+    address: str
+    scheduled_time: Optional[datetime] = None  # UTC; defaults to now
+    notes: Optional[str] = None
+
+class BookingResponse(BaseModel):
+    id: int
+    user_id: int
+    agent_id: int
+    category_id: int
+    status: str
+    scheduled_time: datetime
+    visit_charge: float
+    user_location: str
+    address: str
+    notes: Optional[str] = None
+    created_at: datetime
+
+class UpdateBookingStatusRequest(BaseModel):
+    status: str  # rejected, completed (agent) or cancelled (user)
+
+class RateBookingRequest(BaseModel):
+    rating: int = Field(..., ge=1, le=5)
+    feedback: Optional[str] = None
+
+class RatingResponse(BaseModel):
+    id: int
+    booking_id: int
+    rating: int
+    feedback: Optional[str] = None
+    created_at: datetime
+    agent_avg_rating: float
+    agent_total_ratings: int
+
+class BookingHistoryItem(BaseModel):
+    id: int
+    user_id: int
+    user_name: Optional[str] = None
+    agent_id: int
+    agent_name: Optional[str] = None
+    category_id: int
+    category_name: Optional[str] = None
+    status: str
+    scheduled_time: datetime
+    visit_charge: float
+    address: str
+    notes: Optional[str] = None
+    created_at: datetime
+    rating: Optional[int] = None
+    feedback: Optional[str] = None
+
+class BookingHistoryPage(BaseModel):
+    bookings: List[BookingHistoryItem]
+    next_cursor: Optional[str] = None  # None on the last page
+
+def _booking_response(booking: Booking) -> BookingResponse:
+    return BookingResponse(
+        id=booking.id,
+        user_id=booking.user_id,
+        agent_id=booking.agent_id,
+        category_id=booking.category_id,
+        status=booking.status,
+        scheduled_time=booking.scheduled_time,
+        visit_charge=booking.visit_charge,
+        user_location=booking.user_location,
+        address=booking.address,
+        notes=booking.notes,
+        created_at=booking.created_at
+    )
+
+def _get_booking(db: Session, booking_id: int) -> Booking:
+    booking = db.query(Booking).filter(Booking.id == booking_id).first()
+    if not booking:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Booking not found"
+        )
+    return booking
+
+def _own_agent(db: Session, user_id: int, booking: Booking) -> Agent:
+    agent = db.query(Agent).filter(Agent.user_id == user_id).first()
+    if not agent or agent.id != booking.agent_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to update this booking"
+        )
+    return agent
+
+@router.post("/", response_model=BookingResponse)
+async def create_booking(
+    booking_data: CreateBookingRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """Book an agent; it expires if the agent doesn't accept in time"""
+    user_id = current_user.id
+    scheduled_time = booking_data.scheduled_time or datetime.utcnow()
+    if scheduled_time.tzinfo is not None:
+        scheduled_time = scheduled_time.replace(tzinfo=None) - scheduled_time.utcoffset()
+
+    def create(db: Session):
+        agent = db.query(Agent).filter(Agent.id == booking_data.agent_id).first()
+        if not agent or agent.kyc_status != "verified":
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Agent not found"
+            )
+        if agent.user_id == user_id:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="You cannot book yourself"
+            )
+
+        offers_category = db.query(AgentCategory).filter(
+            AgentCategory.agent_id == agent.id,
+            AgentCategory.category_id == booking_data.category_id
+        ).first()
+        if not offers_category:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Agent does not offer this category"
+            )
+
+        # Visit charge is the agent's per-km rate over the distance to the user
+        agent_lat, agent_lng = agent_position(agent.id, agent.user.location)
+        distance = calculate_distance(booking_data.latitude, booking_data.longitude, agent_lat, agent_lng)
+
+        booking = Booking(
+            user_id=user_id,
+            agent_id=agent.id,
+            category_id=booking_data.category_id,
+            status="pending",
+            scheduled_time=scheduled_time,
+            visit_charge=round(agent.rate_per_km * distance, 2),
+            user_location=f"{booking_data.latitude},{booking_data.longitude}",
+            address=booking_data.address,
+            notes=booking_data.notes
+        )
+        db.add(booking)
+        db.flush()
+
+        schedule_expiry(db, booking)
+        notify_booking(db, booking, "booking.created", "agent")
+        return _booking_response(booking)
+
+    return await write_queue.run(create)
+
+@router.get("/scheduler/stats")
+async def get_scheduler_stats():
+    """Counters of this worker's job scheduler"""
+    return scheduler.stats()
+
+def _history(db: Session, owner: str, owner_id: int, status_filter: Optional[str], cursor: Optional[str], limit: int):
+    if status_filter is not None and status_filter not in HISTORY_FILTERS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid status. Must be one of: {', '.join(HISTORY_FILTERS)}"
+        )
+    try:
+        return history_page(db, owner, owner_id, status_filter, cursor, limit)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+@router.get("/history", response_model=BookingHistoryPage)
+async def get_booking_history(
+    status_filter: Optional[str] = Query(None, alias="status", description="upcoming, completed or cancelled"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    The current user's bookings: upcoming ones soonest first, the rest most
+    recent first. Fetch further pages with next_cursor.
+    """
+    return _history(db, "user_id", current_user.id, status_filter, cursor, limit)
+
+@router.get("/agent/history", response_model=BookingHistoryPage)
+async def get_agent_booking_history(
+    status_filter: Optional[str] = Query(None, alias="status", description="upcoming, completed or cancelled"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """The bookings made with the current user's agent profile, paged like /bookings/history"""
+    agent_id = db.query(Agent.id).filter(Agent.user_id == current_user.id).scalar()
+    if agent_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Agent profile not found"
+        )
+    return _history(db, "agent_id", agent_id, status_filter, cursor, limit)
+
+@router.get("/{booking_id}", response_model=BookingResponse)
+async def get_booking(
+    booking_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """Get a booking; visible to the user who made it and the booked agent"""
+    booking = _get_booking(db, booking_id)
+    if booking.user_id != current_user.id:
+        _own_agent(db, current_user.id, booking)
+    return _booking_response(booking)
+
+@router.put("/{booking_id}/accept", response_model=BookingResponse)
+async def accept_booking(
+    booking_id: int,
+    current_user: User = Depends(get_current_user)
+):
+    """Accept a pending booking; the agent goes offline for the cooldown period"""
+    user_id = current_user.id
+
+    def accept(db: Session):
+        booking = _get_booking(db, booking_id)
+        agent = _own_agent(db, user_id, booking)
+        if booking.status != "pending":
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Booking is already {booking.status}"
+            )
+
+        booking.status = "accepted"
+        cooldown_until = datetime.utcnow() + AGENT_COOLDOWN
+        agent.offline_until = cooldown_until
+        if agent.is_online:
+            agent.is_online = False
+            agent.last_online = datetime.utcnow()
+
+        schedule_acceptance_jobs(db, booking, cooldown_until)
+        notify_booking(db, booking, "booking.accepted", "user")
+        return _booking_response(booking), agent.id, cooldown_until
+
+    response, agent_id, cooldown_until = await write_queue.run(accept)
+    presence.pause(agent_id, cooldown_until)
+    return response
+
+# Allowed status changes: status -> (who, statuses it can be reached from)
+_TRANSITIONS = {
+    "rejected": ("agent", {"pending"}),
+    "completed": ("agent", {"accepted"}),
+    "cancelled": ("user", {"pending", "accepted"}),
+}
+
+@router.put("/{booking_id}/status", response_model=BookingResponse)
+async def update_booking_status(
+    booking_id: int,
+    status_data: UpdateBookingStatusRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """Reject or complete a booking (agent) or cancel it (user)"""
+    user_id = current_user.id
+    transition = _TRANSITIONS.get(status_data.status)
+    if transition is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid status. Must be one of: {', '.join(_TRANSITIONS)}"
+        )
+    role, from_statuses = transition
+
+    def update(db: Session):
+        booking = _get_booking(db, booking_id)
+        if role == "agent":
+            _own_agent(db, user_id, booking)
+        elif booking.user_id != user_id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not authorized to update this booking"
+            )
+        if booking.status not in from_statuses:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Cannot change a {booking.status} booking to {status_data.status}"
+            )
+
+        booking.status = status_data.status
+        # Tell the other side
+        notify_booking(db, booking, f"booking.{status_data.status}", "user" if role == "agent" else "agent")
+        return _booking_response(booking)
+
+    return await write_queue.run(update)
+
+@router.post("/{booking_id}/rating", response_model=RatingResponse)
+async def rate_booking(
+    booking_id: int,
+    rating_data: RateBookingRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """Rate a completed booking (once); the agent's rating is updated with it"""
+    user_id = current_user.id
+
+    def rate(db: Session):
+        booking = _get_booking(db, booking_id)
+        if booking.user_id != user_id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not authorized to rate this booking"
+            )
+        if booking.status != "completed":
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Only completed bookings can be rated"
+            )
+        if booking.rating is not None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Booking is already rated"
+            )
+
+        rating = Rating(booking_id=booking.id, rating=rating_data.rating, feedback=rating_data.feedback)
+        db.add(rating)
+        # Same transaction as the rating, so the aggregates never miss or double count one
+        agent = booking.agent
+        add_rating(agent, rating_data.rating)
+        db.flush()
+
+        return RatingResponse(
+            id=rating.id,
+            booking_id=booking.id,
+            rating=rating.rating,
+            feedback=rating.feedback,
+            created_at=rating.created_at,
+            agent_avg_rating=round(agent.avg_rating, 2),
+            agent_total_ratings=agent.total_ratings
+        )
+
+    return await write_queue.run(rate)
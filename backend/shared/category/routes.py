@@ -1,9 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from ..database import get_db
+from ..database import get_read_db
 from ..auth.jwt import get_current_user
 from ..user.models import User, Category, Agent, AgentCategory
+from ..responses import FastJSONResponse
+from ..conditional import make_etag, not_modified, set_validators
+from ..versions import current_version
+from ..writer import write_queue
 from pydantic import BaseModel
 import sqlalchemy as sa
 from sqlalchemy.sql.expression import func
@@ -17,67 +21,79 @@ class CategoryResponse(BaseModel):
     icon_url: Optional[str] = None
     agent_count: int = 0
 
-@router.get("/", response_model=List[CategoryResponse])
-async def get_all_categories(db: Session = Depends(get_db)):
-    """
-    Get all service categories with agent counts
-    """
-    # Query categories with agent counts
-    categories = db.query(
-        Category,
+def _category_rows(db: Session):
+    """Category columns with agent counts as plain rows (no ORM entities)"""
+    return db.query(
+        Category.id,
+        Category.name,
+        Category.description,
+        Category.icon_url,
         sa.func.count(AgentCategory.agent_id).label('agent_count')
     ).outerjoin(
         AgentCategory, Category.id == AgentCategory.category_id
     ).group_by(
         Category.id
-    ).all()
+    )
+
+def _category_dict(row) -> dict:
+    category_id, name, description, icon_url, agent_count = row
+    return {
+        "id": category_id,
+        "name": name,
+        "description": description,
+        "icon_url": icon_url,
+        "agent_count": agent_count
+    }
+
+@router.get("/", response_model=List[CategoryResponse])
+async def get_all_categories(request: Request, db: Session = Depends(get_read_db)):
+    """
+    Get all service categories with agent counts
+    """
+    etag = make_etag("categories", current_version(db, "categories"))
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
     
-    return [
-        {
-            "id": category.id,
-            "name": category.name,
-            "description": category.description,
-            "icon_url": category.icon_url,
-            "agent_count": agent_count
-        }
-        for category, agent_count in categories
-    ]
+    # Query categories with agent counts
+    categories = _category_rows(db).all()
+    
+    return set_validators(FastJSONResponse([_category_dict(row) for row in categories]), etag)
 
 @router.get("/featured/", response_model=List[CategoryResponse])
 @router.get("/featured", response_model=List[CategoryResponse])
-async def get_featured_categories(db: Session = Depends(get_db)):
+async def get_featured_categories(request: Request, db: Session = Depends(get_read_db)):
     """
     Get featured service categories (categories with most agents)
     """
+    etag = make_etag("categories/featured", current_version(db, "categories"))
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    
     # Query categories with most agents (limit to 5)
-    featured = db.query(
-        Category,
-        sa.func.count(AgentCategory.agent_id).label('agent_count')
-    ).outerjoin(
-        AgentCategory, Category.id == AgentCategory.category_id
-    ).group_by(
-        Category.id
-    ).order_by(
+    featured = _category_rows(db).order_by(
         sa.desc('agent_count')
     ).limit(5).all()
     
-    return [
-        {
-            "id": category.id,
-            "name": category.name,
-            "description": category.description,
-            "icon_url": category.icon_url,
-            "agent_count": agent_count
-        }
-        for category, agent_count in featured
-    ]
+    return set_validators(FastJSONResponse([_category_dict(row) for row in featured]), etag)
 
 @router.get("/{category_id}/", response_model=CategoryResponse)
 @router.get("/{category_id}", response_model=CategoryResponse)
-async def get_category_by_id(category_id: int, db: Session = Depends(get_db)):
+async def get_category_by_id(
+    category_id: int,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db)
+):
     """
     Get a specific category by ID
     """
+    etag = make_etag("category", category_id, current_version(db, "categories"))
+    cached = not_modified(request, etag, any_match=False)  # before the lookup
+    if cached:
+        return cached
+    
     # Query category with agent count
     result = db.query(
         Category,
@@ -96,6 +112,7 @@ async def get_category_by_id(category_id: int, db: Session = Depends(get_db)):
             detail=f"Category with id {category_id} not found"
         )
     
+    set_validators(response, etag)
     category, agent_count = result
     
     return {
@@ -112,7 +129,6 @@ async def create_category(
     name: str,
     description: Optional[str] = None,
     icon_url: Optional[str] = None,
-    db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -124,15 +140,17 @@ async def create_category(
             detail="Only admin users can create categories"
         )
     
-    new_category = Category(
-        name=name,
-        description=description,
-        icon_url=icon_url
-    )
-    
-    db.add(new_category)
-    db.commit()
-    db.refresh(new_category)
+    def create(db: Session):
+        new_category = Category(
+            name=name,
+            description=description,
+            icon_url=icon_url
+        )
+        db.add(new_category)
+        db.flush()
+        return new_category
+
+    new_category = await write_queue.run(create)
     
     return {
         "id": new_category.id,
@@ -0,0 +1,113 @@
+"""
+Agent change feed for delta sync.
+
+Every write that changes what a client shows for an agent (the agent row
+itself, including status and rating; the user's name or location; the
+agent's category links; a new rating) moves the agent to the end of the
+agent_changes sequence, in the same transaction as the write. The feed
+keeps one row per agent (its latest change), so reading everything since
+a cursor is a primary key range scan sized by the number of agents that
+changed, not by the number of writes.
+
+seq is an AUTOINCREMENT key, so it only grows and is never reused. SQLite
+allows one writer at a time, so seq order is also commit order and a
+reader can never see seq N+1 before N.
+"""
+from datetime import datetime
+from itertools import chain
+
+from sqlalchemy import Column, Integer, String, DateTime, Index, delete, insert, literal, select, event, inspect
+from sqlalchemy.orm import Session
+
+from .database import Base
+
+UPSERT = "upsert"
+DELETE = "delete"
+
+# User columns that agents expose
+_USER_FIELDS = ("name", "location")
+
+class AgentChange(Base):
+    __tablename__ = "agent_changes"
+    __table_args__ = (
+        Index("ix_agent_changes_agent_id", "agent_id", unique=True),
+        {"sqlite_autoincrement": True},
+    )
+
+    seq = Column(Integer, primary_key=True)
+    agent_id = Column(Integer, nullable=False)
+    op = Column(String, nullable=False)  # upsert, delete
+    changed_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+def changes_since(db: Session, since: int, limit: int):
+    """(seq, agent_id, op) rows after the cursor, oldest first"""
+    return db.query(AgentChange.seq, AgentChange.agent_id, AgentChange.op).filter(
+        AgentChange.seq > since
+    ).order_by(AgentChange.seq).limit(limit).all()
+
+def backfill(db: Session) -> int:
+    """Add agents that predate the feed (run at startup; a no-op once done)"""
+    from .user.models import Agent
+
+    result = db.execute(
+        insert(AgentChange).from_select(
+            ["agent_id", "op", "changed_at"],
+            select(Agent.id, literal(UPSERT), literal(datetime.utcnow())).where(
+                Agent.id.not_in(select(AgentChange.agent_id))
+            )
+        )
+    )
+    return result.rowcount
+
+def changed_agents(session, flush_context):
+    """
+    (upserted, deleted) agent ids whose listing a flush changed; computed
+    once per flush and shared by the hooks that need it
+    """
+    cached = flush_context.attributes.get("changed_agents")
+    if cached is not None:
+        return cached
+    from .user.models import Agent, Booking
+
+    upserts, deletes, user_ids, booking_ids = set(), set(), set(), set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        table = getattr(obj, "__tablename__", None)
+        if table == "agents":
+            if obj in session.deleted:
+                deletes.add(obj.id)
+            elif obj in session.new or session.is_modified(obj, include_collections=False):
+                upserts.add(obj.id)
+        elif table == "users" and obj in session.dirty:
+            state = inspect(obj)
+            if any(state.attrs[field].history.has_changes() for field in _USER_FIELDS):
+                user_ids.add(obj.id)
+        elif table == "agent_category":
+            upserts.add(obj.agent_id)
+        elif table == "ratings" and obj in session.new:
+            booking_ids.add(obj.booking_id)
+
+    if user_ids or booking_ids:
+        connection = session.connection()
+        if user_ids:
+            upserts.update(connection.execute(select(Agent.id).where(Agent.user_id.in_(user_ids))).scalars())
+        if booking_ids:
+            upserts.update(connection.execute(select(Booking.agent_id).where(Booking.id.in_(booking_ids))).scalars())
+    upserts -= deletes
+
+    flush_context.attributes["changed_agents"] = upserts, deletes
+    return upserts, deletes
+
+@event.listens_for(Session, "after_flush")
+def _record_agent_changes(session, flush_context):
+    upserts, deletes = changed_agents(session, flush_context)
+    changed = upserts | deletes
+    if not changed:
+        return
+
+    connection = session.connection()
+    connection.execute(delete(AgentChange).where(AgentChange.agent_id.in_(changed)))
+    now = datetime.utcnow()
+    connection.execute(insert(AgentChange), [
+        {"agent_id": agent_id, "op": DELETE if agent_id in deletes else UPSERT, "changed_at": now}
+        for agent_id in sorted(changed)
+    ])
@@ -0,0 +1,71 @@
+"""
+Conditional GET helpers (ETag / Last-Modified).
+
+Handlers compute a validator from cheap columns (updated_at, version
+counters) before running their full query, return not_modified() when the
+client's copy is current, and otherwise attach the validators to the
+response with set_validators(). A check made before the resource is known
+to exist passes any_match=False, so If-None-Match: * can't turn a 404 into
+a 304.
+"""
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response
+
+def make_etag(*parts) -> str:
+    """Strong ETag from the values that determine a representation"""
+    digest = hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:20]
+    return f'"{digest}"'
+
+def _http_date(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)  # columns are stored as naive UTC
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+def _headers(etag: str, last_modified: Optional[datetime]) -> dict:
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = _http_date(last_modified)
+    return headers
+
+def is_conditional(request: Request) -> bool:
+    """True if the client sent a validator to check"""
+    return "if-none-match" in request.headers or "if-modified-since" in request.headers
+
+def is_fresh(request: Request, etag: str, last_modified: Optional[datetime] = None, any_match: bool = True) -> bool:
+    """
+    True if the client's cached copy matches (If-None-Match wins over
+    If-Modified-Since); If-None-Match: * matches only with any_match
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return any_match
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return etag in candidates
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=timezone.utc)
+        # HTTP dates have one-second resolution
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+def not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None,
+                 any_match: bool = True) -> Optional[Response]:
+    """A 304 response if the client's copy is current, else None"""
+    if is_fresh(request, etag, last_modified, any_match):
+        return Response(status_code=304, headers=_headers(etag, last_modified))
+    return None
+
+def set_validators(response: Response, etag: str, last_modified: Optional[datetime] = None) -> Response:
+    response.headers.update(_headers(etag, last_modified))
+    return response
@@ -1,6 +1,8 @@
-from sqlalchemy import create_engine, MetaData
+from sqlalchemy import create_engine, MetaData, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from contextvars import ContextVar
+from fastapi import Request
 import os
 
 # Database URL - using SQLite for simplicity
@@ -15,23 +17,67 @@ sqlite_connect_args = {
 # Create engine with optimizations
 if "sqlite" in DATABASE_URL:
     engine = create_engine(
-        DATABASE_URL, 
+        DATABASE_URL,
         connect_args=sqlite_connect_args,
         pool_timeout=20,
         pool_recycle=-1,
         echo=False  # Set to True for SQL debugging
     )
+    # Separate pool for read-only sessions so GET handlers never hold
+    # (or wait on) SQLite's single write lock
+    read_engine = create_engine(
+        DATABASE_URL,
+        connect_args=sqlite_connect_args,
+        pool_size=int(os.getenv("DB_READ_POOL_SIZE", "10")),
+        max_overflow=-1,  # never block the event loop waiting for a read connection
+        pool_timeout=20,
+        pool_recycle=-1,
+        echo=False
+    )
+
+    @event.listens_for(engine, "connect")
+    def _configure_write_connection(dbapi_connection, connection_record):
+        # pysqlite only emits BEGIN before DML on its own, so SAVEPOINTs (the
+        # write queue's per-job rollback) and DDL would run outside any
+        # transaction; take over transaction control (see _begin_write)
+        dbapi_connection.isolation_level = None
+        # WAL lets readers proceed while the writer holds the lock
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def _begin_write(connection):
+        # IMMEDIATE takes the write lock up front, so a transaction that read
+        # first never fails to upgrade its lock halfway through
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+    @event.listens_for(read_engine, "connect")
+    def _configure_read_connection(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
 else:
     engine = create_engine(DATABASE_URL)
+    read_engine = engine
 
 # Create session factory with optimized settings
 SessionLocal = sessionmaker(
-    autocommit=False, 
-    autoflush=False, 
+    autocommit=False,
+    autoflush=False,
     bind=engine,
     expire_on_commit=False  # Keep objects accessible after commit
 )
 
+# Session factory for the read-only pool
+ReadSessionLocal = sessionmaker(
+    autocommit=False,
+    autoflush=False,
+    bind=read_engine,
+    expire_on_commit=False
+)
+
 # Create declarative base
 Base = declarative_base()
 
@@ -46,6 +92,25 @@ def get_db():
     finally:
         db.close()
 
+# Scope key under which shared.batch hands its session to sub-requests
+BATCH_SESSION = "clicko.batch_session"
+
+# True while sub-requests share one session; it must then stay on the event
+# loop thread (sessions are not thread safe), so work is not offloaded
+session_shared: ContextVar[bool] = ContextVar("session_shared", default=False)
+
+# Dependency for handlers that only read; mutations go through shared.writer
+def get_read_db(request: Request):
+    shared = request.scope.get(BATCH_SESSION)
+    if shared is not None:
+        yield shared  # closed by the batch
+        return
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
 # Create tables
 def create_tables():
     Base.metadata.create_all(bind=engine)
\ No newline at end of file
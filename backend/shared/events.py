@@ -0,0 +1,330 @@
+"""
+Commit-driven change events.
+
+Session hooks record which users, agents, categories, agent-category links,
+bookings and revoked tokens each flush touched. Once the outermost transaction commits,
+the changes are coalesced (one event per row) and published on the change
+bus.
+Changes flushed inside a rolled-back SAVEPOINT, or a rolled-back
+transaction, are dropped, so subscribers only hear about committed data.
+
+A commit only queues its events: subscribers run on the bus's dispatch
+thread, in commit order, so the work they do (reloading rows, rebuilding
+indexes) never holds up the writer thread. Subscribers that only drop
+cache entries subscribe inline and run in the committing thread, so the
+caller of a write never reads stale entries right after it. Events can
+also be consumed from an asyncio queue. A transport carries the events to
+other worker processes. LocalTransport is the default and stays inside one
+process. FileLogTransport is a stand-in for multi-worker deployments on a
+single host.
+"""
+import asyncio
+import json
+import logging
+import os
+import queue
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Tuple, Union
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Entity names
+USER = "user"
+AGENT = "agent"
+CATEGORY = "category"
+AGENT_CATEGORY = "agent_category"
+BOOKING = "booking"
+REVOKED_TOKEN = "revoked_token"
+PRESENCE = "presence"  # agent presence inputs, shared between workers (shared.agent.presence)
+
+# Operations
+INSERT = "insert"
+UPDATE = "update"
+DELETE = "delete"
+
+# table name -> entity name
+TRACKED_TABLES = {
+    "users": USER,
+    "agents": AGENT,
+    "categories": CATEGORY,
+    "agent_category": AGENT_CATEGORY,
+    "bookings": BOOKING,
+    "revoked_tokens": REVOKED_TOKEN,
+}
+
+@dataclass(frozen=True)
+class ChangeEvent:
+    entity: str
+    id: Union[int, str, Tuple[int, ...]]  # composite keys (agent_category) are (agent_id, category_id)
+    op: str
+
+    def to_dict(self) -> dict:
+        return {"entity": self.entity, "id": self.id, "op": self.op}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ChangeEvent":
+        entity_id = data["id"]
+        if isinstance(entity_id, list):
+            entity_id = tuple(entity_id)
+        return cls(entity=data["entity"], id=entity_id, op=data["op"])
+
+def _coalesce(previous: str, current: str):
+    """Net effect of two operations on the same row within one transaction"""
+    if previous == INSERT:
+        return None if current == DELETE else INSERT
+    if previous == DELETE and current == INSERT:
+        return UPDATE
+    return current
+
+def coalesce(changes: Iterable[Tuple[str, object, str]]) -> List[ChangeEvent]:
+    net = OrderedDict()
+    for entity, entity_id, op in changes:
+        key = (entity, entity_id)
+        if key in net:
+            op = _coalesce(net.pop(key), op)
+            if op is None:
+                continue
+        net[key] = op
+    return [ChangeEvent(entity, entity_id, op) for (entity, entity_id), op in net.items()]
+
+class LocalTransport:
+    """In-process transport: nothing to forward"""
+
+    def start(self, deliver: Callable[[List[ChangeEvent]], None]):
+        pass
+
+    def publish(self, events: List[ChangeEvent]):
+        pass
+
+    def stop(self):
+        pass
+
+class FileLogTransport:
+    """
+    Cross-process stand-in for one host: every worker appends its committed
+    events as a JSON line to a shared log file and tails the file for
+    events written by the other workers.
+    """
+
+    def __init__(self, path: str, poll_interval: float = 0.05):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._origin = f"{os.getpid()}-{id(self)}"
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, deliver: Callable[[List[ChangeEvent]], None]):
+        if self._thread is not None:
+            return
+        open(self.path, "a").close()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._tail, args=(deliver,), name="change-log-tail", daemon=True)
+        self._thread.start()
+
+    def publish(self, events: List[ChangeEvent]):
+        line = json.dumps({"origin": self._origin, "events": [e.to_dict() for e in events]}) + "\n"
+        # One write() per batch on an O_APPEND descriptor keeps lines whole
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode("utf-8"))
+        finally:
+            os.close(fd)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(1.0)
+            self._thread = None
+
+    def _tail(self, deliver):
+        with open(self.path, "r") as log:
+            log.seek(0, os.SEEK_END)  # only events committed after startup
+            buffered = ""
+            while not self._stop.is_set():
+                chunk = log.readline()
+                if not chunk:
+                    self._stop.wait(self.poll_interval)
+                    continue
+                buffered += chunk
+                if not buffered.endswith("\n"):
+                    continue  # partial line, wait for the rest
+                line, buffered = buffered, ""
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning("Skipping malformed change log line")
+                    continue
+                if record.get("origin") != self._origin:
+                    deliver([ChangeEvent.from_dict(e) for e in record["events"]])
+
+class ChangeBus:
+    def __init__(self, transport=None):
+        self._subscribers = []  # (callback, inline)
+        self._lock = threading.Lock()
+        self._pending = queue.Queue()  # (events, local, forward) for the dispatch thread
+        self._thread = None
+        self.transport = transport or LocalTransport()
+        self.transport.start(self._receive)
+        self.published = 0
+
+    def set_transport(self, transport):
+        self.transport.stop()
+        self.transport = transport
+        self.transport.start(self._receive)
+
+    def subscribe(self, callback: Callable[[List[ChangeEvent]], None], inline: bool = False) -> Callable[[], None]:
+        """
+        Call callback(events) after every commit (and for events from other
+        workers), on the dispatch thread; with inline, in the committing
+        thread before the commit returns (keep those callbacks cheap).
+        Returns a function that unsubscribes.
+        """
+        entry = (callback, inline)
+        with self._lock:
+            self._subscribers.append(entry)
+
+        def unsubscribe():
+            with self._lock:
+                if entry in self._subscribers:
+                    self._subscribers.remove(entry)
+        return unsubscribe
+
+    def queue(self, maxsize: int = 10000, loop=None) -> asyncio.Queue:
+        """
+        An asyncio.Queue fed with events on the given (or running) loop.
+        Events are dropped with a warning if the consumer falls behind.
+        """
+        loop = loop or asyncio.get_running_loop()
+        events_queue = asyncio.Queue(maxsize=maxsize)
+
+        def put(event):
+            try:
+                events_queue.put_nowait(event)
+            except asyncio.QueueFull:
+                logger.warning(f"Change event queue full, dropping {event}")
+
+        def forward(events):
+            for event in events:
+                loop.call_soon_threadsafe(put, event)
+
+        self.subscribe(forward)
+        return events_queue
+
+    def publish(self, events: List[ChangeEvent], local: bool = True):
+        """Deliver events to subscribers here (unless local is False) and in the other workers"""
+        if not events:
+            return
+        if local:
+            self._call(events, inline=True)
+        self._enqueue(events, local, forward=True)
+
+    def drain(self):
+        """Block until every queued event has been dispatched"""
+        self._pending.join()
+
+    def stop(self):
+        """Dispatch what is queued, then stop the dispatch thread and the transport"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._pending.put(None)
+            thread.join()
+        self.transport.stop()
+
+    def _receive(self, events: List[ChangeEvent]):
+        # Events from another worker, on the transport's thread
+        self._call(events, inline=True)
+        self._enqueue(events, local=True, forward=False)
+
+    def _enqueue(self, events, local: bool, forward: bool):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._dispatch, name="change-bus", daemon=True)
+                self._thread.start()
+        self._pending.put((events, local, forward))
+
+    def _dispatch(self):
+        while True:
+            item = self._pending.get()
+            try:
+                if item is None:
+                    return
+                events, local, forward = item
+                if local:
+                    self.published += len(events)
+                    self._call(events, inline=False)
+                if forward:
+                    try:
+                        self.transport.publish(events)
+                    except Exception as e:
+                        logger.error(f"Change event transport failed: {e}")
+            finally:
+                self._pending.task_done()
+
+    def _call(self, events: List[ChangeEvent], inline: bool):
+        with self._lock:
+            subscribers = [callback for callback, is_inline in self._subscribers if is_inline == inline]
+        for callback in subscribers:
+            try:
+                callback(events)
+            except Exception as e:
+                logger.error(f"Change event subscriber {callback!r} failed: {e}")
+
+# Process-wide bus; set CHANGE_EVENTS_LOG to share events between local workers
+change_bus = ChangeBus(
+    FileLogTransport(os.environ["CHANGE_EVENTS_LOG"]) if os.getenv("CHANGE_EVENTS_LOG") else None
+)
+
+def _identity(obj):
+    # New rows don't have an identity key until the flush finalizes, but their
+    # primary key attributes are already populated in after_flush
+    identity = inspect(obj).mapper.primary_key_from_instance(obj)
+    if any(value is None for value in identity):
+        return None
+    return identity[0] if len(identity) == 1 else tuple(identity)
+
+@event.listens_for(Session, "after_flush")
+def _record_changes(session, flush_context):
+    changes = []
+    for objects, op in ((session.new, INSERT), (session.dirty, UPDATE), (session.deleted, DELETE)):
+        for obj in objects:
+            entity = TRACKED_TABLES.get(getattr(obj, "__tablename__", None))
+            if entity is None:
+                continue
+            if op == UPDATE and not session.is_modified(obj, include_collections=False):
+                continue
+            entity_id = _identity(obj)
+            if entity_id is not None:
+                changes.append((entity, entity_id, op))
+    if changes:
+        # Tag with the innermost transaction so a SAVEPOINT rollback can drop them
+        transaction = session.get_nested_transaction() or session.get_transaction()
+        session.info.setdefault("change_log", []).extend((transaction, *change) for change in changes)
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_changes(session, previous_transaction):
+    log = session.info.get("change_log")
+    if not log:
+        return
+
+    def rolled_back(transaction):
+        while transaction is not None:
+            if transaction is previous_transaction:
+                return True
+            transaction = transaction.parent
+        return False
+
+    session.info["change_log"] = [entry for entry in log if not rolled_back(entry[0])]
+
+@event.listens_for(Session, "after_commit")
+def _publish_changes(session):
+    if session.in_nested_transaction():
+        return  # a SAVEPOINT released; wait for the outermost commit
+    log = session.info.pop("change_log", None)
+    if log:
+        change_bus.publish(coalesce(entry[1:] for entry in log))
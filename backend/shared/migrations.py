@@ -0,0 +1,147 @@
+"""
+Schema migrations.
+
+create_tables() adds missing tables but never changes existing ones, so
+changes to existing tables (new columns, new indexes) are listed here as
+numbered steps. Each step runs once per database, in order, in its own
+transaction, and is recorded in schema_migrations.
+
+A database just made by create_tables() already has the current schema, so
+steps must check before they add anything. On SQLite a step's transaction
+starts with BEGIN IMMEDIATE, so workers starting together take turns; each
+re-reads schema_migrations inside its transaction and skips a step another
+worker has applied meanwhile.
+"""
+import logging
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, select, text, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+_metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    _metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+def _columns(connection: Connection, table: str) -> set:
+    return {column["name"] for column in inspect(connection).get_columns(table)}
+
+def _add_ranking_score(connection: Connection):
+    from .user.models import Agent
+    from .agent.ranking import ranking_score_sql
+
+    if "ranking_score" not in _columns(connection, "agents"):
+        connection.execute(text("ALTER TABLE agents ADD COLUMN ranking_score FLOAT NOT NULL DEFAULT 0"))
+    # Score the agents that predate the column
+    agents = Agent.__table__
+    connection.execute(update(agents).values(
+        ranking_score=ranking_score_sql(
+            func.coalesce(agents.c.avg_rating, 0.0), func.coalesce(agents.c.total_ratings, 0)
+        ),
+        updated_at=agents.c.updated_at  # not a change clients need to see
+    ))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_agents_kyc_status_ranking_score ON agents (kyc_status, ranking_score)"
+    ))
+
+def _fill_agent_cards(connection: Connection):
+    from .agent.card_table import rebuild
+
+    rebuild(connection)
+
+# Index name and definition; each list's indexes are also declared on the
+# models (User, Agent, AgentCategory, Booking, AgentCard), so a database made
+# by create_tables() already has them
+HOT_QUERY_INDEXES = [
+    ("ix_agents_user_id", "agents (user_id)"),
+    ("ix_agents_kyc_status_updated_at", "agents (kyc_status, updated_at)"),
+    ("ix_agents_present", "agents (id) WHERE is_online = 1 OR offline_until IS NOT NULL"),
+    ("ix_agent_category_category_id_agent_id", "agent_category (category_id, agent_id)"),
+    ("ix_bookings_status_scheduled_time", "bookings (status, scheduled_time)"),
+]
+
+HISTORY_INDEXES = [
+    ("ix_bookings_user_id_status_scheduled_time", "bookings (user_id, status, scheduled_time)"),
+    ("ix_bookings_user_id_scheduled_time", "bookings (user_id, scheduled_time)"),
+    ("ix_bookings_agent_id_status_scheduled_time", "bookings (agent_id, status, scheduled_time)"),
+    ("ix_bookings_agent_id_scheduled_time", "bookings (agent_id, scheduled_time)"),
+]
+
+CARD_INDEXES = [
+    ("ix_agent_cards_latitude", "agent_cards (latitude)"),
+]
+
+def _create_indexes(connection: Connection, indexes):
+    for name, definition in indexes:
+        connection.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}"))
+
+def _add_hot_query_indexes(connection: Connection):
+    _create_indexes(connection, HOT_QUERY_INDEXES)
+
+def _add_history_indexes(connection: Connection):
+    _create_indexes(connection, HISTORY_INDEXES)
+
+def _add_card_indexes(connection: Connection):
+    _create_indexes(connection, CARD_INDEXES)
+
+def _retire_plaintext_reset_tokens(connection: Connection):
+    # Reset tokens are kept hashed in auth_tokens now (shared.auth.tokens)
+    connection.execute(text(
+        "UPDATE users SET reset_token = NULL, reset_token_expires = NULL WHERE reset_token IS NOT NULL"
+    ))
+    # Step 3 created this index before reset tokens moved out of users
+    connection.execute(text("DROP INDEX IF EXISTS ix_users_reset_token"))
+
+def _add_push_token(connection: Connection):
+    if "push_token" not in _columns(connection, "users"):
+        connection.execute(text("ALTER TABLE users ADD COLUMN push_token VARCHAR"))
+
+# (version, name, step); append only, never renumber
+MIGRATIONS = [
+    (1, "agents.ranking_score", _add_ranking_score),
+    (2, "agent_cards", _fill_agent_cards),
+    (3, "hot query indexes", _add_hot_query_indexes),
+    (4, "booking history indexes", _add_history_indexes),
+    (5, "retire users.reset_token", _retire_plaintext_reset_tokens),
+    (6, "users.push_token", _add_push_token),
+    (7, "agent card location index", _add_card_indexes),
+]
+
+def _applied(connection: Connection, version: int) -> bool:
+    return connection.execute(
+        select(schema_migrations.c.version).where(schema_migrations.c.version == version)
+    ).first() is not None
+
+def migrate(engine: Engine) -> list:
+    """Run the steps this database hasn't had yet; returns their versions"""
+    _metadata.create_all(bind=engine)
+    with engine.connect() as connection:
+        applied = set(connection.execute(select(schema_migrations.c.version)).scalars())
+
+    ran = []
+    for version, name, step in MIGRATIONS:
+        if version in applied:
+            continue
+        try:
+            with engine.begin() as connection:
+                if _applied(connection, version):
+                    logger.info(f"Migration {version} ({name}) was applied by another worker")
+                    continue
+                step(connection)
+                connection.execute(schema_migrations.insert().values(
+                    version=version, name=name, applied_at=datetime.utcnow()
+                ))
+        except IntegrityError:
+            logger.info(f"Migration {version} ({name}) was applied by another worker")
+            continue
+        logger.info(f"Applied migration {version} ({name})")
+        ran.append(version)
+    return ran
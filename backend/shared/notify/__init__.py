@@ -0,0 +1 @@
+# Notification module
\ No newline at end of file
@@ -0,0 +1,269 @@
+"""
+Outbox dispatcher.
+
+A background task claims due outbox rows in batches, by setting a lease
+(owner + expiry) with a conditional UPDATE, so several workers can run
+dispatchers without sending a message twice. It groups the claimed
+messages by channel, cuts each group into its provider's batch size and
+sends the batches concurrently, each after taking tokens from the
+provider's rate limiter. All outcomes of a round are then recorded in one
+write: sent, retried later with exponential backoff and jitter, or failed.
+
+The task wakes as soon as a transaction that queued a message commits in
+this process, and polls every poll_interval for messages queued by other
+workers or due for a retry. A poll first looks for due rows on the read
+pool and only takes the write path to claim them when there are some. A
+message whose lease expired (its worker died mid-send) is claimed again,
+so delivery is at least once.
+"""
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, or_, select
+
+from ..database import ReadSessionLocal
+from ..writer import write_queue
+from .outbox import OutboxMessage, MAX_ATTEMPTS, SENSITIVE_KINDS
+from .providers import DeliveryError, Provider, default_providers
+
+logger = logging.getLogger(__name__)
+
+class RateLimiter:
+    """Token bucket: rate tokens per second, up to burst"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int):
+        tokens = min(tokens, self.burst)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+class OutboxDispatcher:
+    def __init__(
+        self,
+        providers: Optional[Dict[str, Provider]] = None,
+        batch_size: int = 500,
+        lease: float = 60.0,
+        poll_interval: float = 1.0,
+        retry_delay: float = 5.0,
+        max_retry_delay: float = 3600.0,
+        concurrency: int = 4,
+    ):
+        self.providers = providers
+        self.batch_size = batch_size  # messages claimed per round
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay  # doubled on every further attempt
+        self.max_retry_delay = max_retry_delay
+        self.concurrency = concurrency  # batches in flight per provider
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._limiters: Dict[str, RateLimiter] = {}
+        self._in_flight: Dict[str, asyncio.Semaphore] = {}
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.batches = 0
+
+    def wake(self):
+        """A message was queued; callable from any thread"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    # Claiming
+
+    @staticmethod
+    def _due(now: datetime):
+        return select(OutboxMessage.id).where(or_(
+            and_(OutboxMessage.status == "pending", OutboxMessage.available_at <= now),
+            and_(OutboxMessage.status == "sending", OutboxMessage.lease_expires_at < now),
+        ))
+
+    def _any_due(self) -> bool:
+        db = ReadSessionLocal()
+        try:
+            return db.execute(self._due(datetime.utcnow()).limit(1)).first() is not None
+        finally:
+            db.close()
+
+    async def _claim(self) -> list:
+        if not await run_in_threadpool(self._any_due):
+            return []  # an idle poll never queues a write
+        owner = self.owner
+        lease = timedelta(seconds=self.lease)
+        batch_size = self.batch_size
+
+        def claim(db):
+            now = datetime.utcnow()
+            due = self._due(now).order_by(OutboxMessage.available_at).limit(batch_size)
+            db.query(OutboxMessage).filter(OutboxMessage.id.in_(due)).update({
+                OutboxMessage.status: "sending",
+                OutboxMessage.lease_owner: owner,
+                OutboxMessage.lease_expires_at: now + lease,
+                OutboxMessage.attempts: OutboxMessage.attempts + 1,
+            }, synchronize_session=False)
+            return db.query(
+                OutboxMessage.id, OutboxMessage.kind, OutboxMessage.channel, OutboxMessage.address,
+                OutboxMessage.subject, OutboxMessage.body, OutboxMessage.data, OutboxMessage.attempts
+            ).filter(
+                OutboxMessage.status == "sending", OutboxMessage.lease_owner == owner
+            ).order_by(OutboxMessage.id).all()
+
+        return await write_queue.run(claim)
+
+    # Sending
+
+    async def _send_batch(self, provider: Provider, messages: list) -> list:
+        async with self._in_flight[provider.name]:
+            await self._limiters[provider.name].acquire(len(messages))
+            try:
+                outcomes = await provider.send(messages)
+            except Exception as e:
+                outcomes = [DeliveryError(f"{type(e).__name__}: {e}")] * len(messages)
+            self.batches += 1
+            return list(zip(messages, outcomes))
+
+    async def _deliver(self, messages: list):
+        by_channel = defaultdict(list)
+        for message in messages:
+            by_channel[message.channel].append(message)
+        sends, results = [], []
+        for channel, group in by_channel.items():
+            provider = self.providers.get(channel)
+            if provider is None:
+                results.extend((message, DeliveryError(f"No provider for {channel}", retryable=False)) for message in group)
+                continue
+            for start in range(0, len(group), provider.batch_size):
+                sends.append(self._send_batch(provider, group[start:start + provider.batch_size]))
+        for batch in await asyncio.gather(*sends):
+            results.extend(batch)
+        await self._record(results)
+
+    def _retry_at(self, attempts: int) -> datetime:
+        delay = min(self.max_retry_delay, self.retry_delay * 2 ** (attempts - 1))
+        return datetime.utcnow() + timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+    async def _record(self, results: list):
+        owner = self.owner
+        sent = [message.id for message, error in results if error is None]
+        sensitive = [message.id for message, error in results if message.kind in SENSITIVE_KINDS]
+        retries, failures = [], []
+        for message, error in results:
+            if error is None:
+                continue
+            if error.retryable and message.attempts < MAX_ATTEMPTS:
+                retries.append((message.id, self._retry_at(message.attempts), str(error)[:500]))
+            else:
+                failures.append((message.id, str(error)[:500]))
+                logger.warning(f"Giving up on {message.channel} message {message.id} ({message.kind}): {error}")
+
+        def record(db):
+            # Only rows we still hold; another worker may have taken an expired lease over
+            mine = and_(OutboxMessage.lease_owner == owner, OutboxMessage.status == "sending")
+            released = {OutboxMessage.lease_owner: None, OutboxMessage.lease_expires_at: None}
+            if sent:
+                db.query(OutboxMessage).filter(OutboxMessage.id.in_(sent), mine).update(
+                    {**released, OutboxMessage.status: "sent", OutboxMessage.last_error: None},
+                    synchronize_session=False)
+            for message_id, available_at, error in retries:
+                db.query(OutboxMessage).filter(OutboxMessage.id == message_id, mine).update(
+                    {**released, OutboxMessage.status: "pending", OutboxMessage.available_at: available_at,
+                     OutboxMessage.last_error: error},
+                    synchronize_session=False)
+            for message_id, error in failures:
+                db.query(OutboxMessage).filter(OutboxMessage.id == message_id, mine).update(
+                    {**released, OutboxMessage.status: "failed", OutboxMessage.last_error: error},
+                    synchronize_session=False)
+            finished = set(sent) | {message_id for message_id, _ in failures}
+            cleared = [message_id for message_id in sensitive if message_id in finished]
+            if cleared:
+                # Reset links must not outlive their delivery in the table
+                db.query(OutboxMessage).filter(OutboxMessage.id.in_(cleared)).update(
+                    {OutboxMessage.body: ""}, synchronize_session=False)
+
+        await write_queue.run(record)
+        self.sent += len(sent)
+        self.retried += len(retries)
+        self.failed += len(failures)
+
+    # Lifecycle
+
+    async def start(self):
+        if self._task is not None:
+            return
+        if self.providers is None:
+            self.providers = default_providers()
+        for provider in self.providers.values():
+            await provider.start()
+            self._limiters[provider.name] = RateLimiter(provider.rate, provider.burst)
+            self._in_flight[provider.name] = asyncio.Semaphore(self.concurrency)
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        self._loop = None
+        for provider in self.providers.values():
+            await provider.stop()
+
+    async def _run(self):
+        while True:
+            try:
+                self._wakeup.clear()
+                messages = await self._claim()
+                if messages:
+                    await self._deliver(messages)
+                    continue
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Outbox dispatcher loop failed: {e}")
+                await asyncio.sleep(1.0)
+
+    def stats(self) -> dict:
+        return {
+            "owner": self.owner,
+            "providers": {channel: provider.name for channel, provider in (self.providers or {}).items()},
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "batches": self.batches,
+        }
+
+# Process-wide dispatcher, started with the app
+dispatcher = OutboxDispatcher()
@@ -0,0 +1,28 @@
+"""
+Outbox upkeep run by the job scheduler: finished messages older than the
+retention period are deleted in batches, one batch per job.
+"""
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import Session
+
+from ..scheduler import scheduler
+from .outbox import SWEEP_BATCH_SIZE, sweep_finished
+
+logger = logging.getLogger(__name__)
+
+# How often the sweep looks for finished messages once it has caught up
+SWEEP_INTERVAL = timedelta(hours=1)
+
+def schedule_outbox_sweep(db: Session, run_at: datetime = None):
+    """Queue the next sweep unless one is already queued (called at startup)"""
+    scheduler.schedule_once(db, "notify.sweep_outbox", run_at or datetime.utcnow())
+
+@scheduler.handler("notify.sweep_outbox")
+def sweep_outbox(db: Session):
+    deleted = sweep_finished(db.connection())
+    if deleted:
+        logger.info(f"Deleted {deleted} finished outbox messages")
+    backlog = deleted >= SWEEP_BATCH_SIZE
+    schedule_outbox_sweep(db, datetime.utcnow() if backlog else datetime.utcnow() + SWEEP_INTERVAL)
@@ -0,0 +1,120 @@
+"""
+Notification outbox.
+
+Handlers never talk to a push or email provider. They call notify() inside
+the transaction that makes the change (booking accepted, reset requested),
+which renders the message and adds an outbox row, so a notification is
+recorded if and only if its change commits. shared.notify.dispatcher
+delivers the rows in the background.
+
+Rows move pending -> sending (leased by one dispatcher) -> sent, or back
+to pending with a later available_at after a failed attempt, and to failed
+after MAX_ATTEMPTS or a permanent error. Bodies of SENSITIVE_KINDS (reset
+links) are cleared once the message is finished, and finished rows are
+swept after RETENTION.
+"""
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import Column, Integer, String, DateTime, JSON, Index, delete, event, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from ..database import Base
+
+EMAIL = "email"
+PUSH = "push"
+
+MAX_ATTEMPTS = 8
+RETENTION = timedelta(days=7)
+SWEEP_BATCH_SIZE = 1000
+RESET_URL = os.getenv("PASSWORD_RESET_URL", "clicko://reset-password?token={token}")
+
+# kind -> channels, subject, body; formatted with the notify() arguments
+TEMPLATES = {
+    "auth.password_reset": (
+        (EMAIL,), "Reset your ClickO password",
+        "Hi {name},\n\nUse this link within the next hour to choose a new password:\n{url}\n\n"
+        "If you didn't ask for this, you can ignore this email.",
+    ),
+    "booking.created": ((PUSH,), "New booking request", "{customer} booked you for {category} at {time}"),
+    "booking.accepted": ((PUSH,), "Booking confirmed", "{agent} accepted your {category} booking for {time}"),
+    "booking.rejected": ((PUSH,), "Booking declined", "{agent} can't take your {category} booking for {time}"),
+    "booking.cancelled": ((PUSH,), "Booking cancelled", "{customer} cancelled the {category} booking for {time}"),
+    "booking.completed": ((PUSH,), "Booking completed", "How was your {category} visit with {agent}? Rate it now"),
+    "booking.reminder": ((PUSH,), "Upcoming booking", "Your {category} booking starts at {time}"),
+}
+SENSITIVE_KINDS = {"auth.password_reset"}
+
+class OutboxMessage(Base):
+    __tablename__ = "outbox"
+    __table_args__ = (
+        # Dispatchers read the next due pending rows, and leases that expired
+        Index("ix_outbox_status_available_at", "status", "available_at"),
+        Index("ix_outbox_status_lease_expires_at", "status", "lease_expires_at"),
+        Index("ix_outbox_status_updated_at", "status", "updated_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    channel = Column(String, nullable=False)  # email, push
+    user_id = Column(Integer, nullable=True)
+    address = Column(String, nullable=False)  # email address or push token
+    subject = Column(String, nullable=False)
+    body = Column(String, nullable=False)
+    data = Column(JSON, nullable=True)  # extra push payload for the app
+    status = Column(String, nullable=False, default="pending")  # pending, sending, sent, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    available_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+def notify(db: Session, user, kind: str, data: Optional[dict] = None, **fields) -> List[OutboxMessage]:
+    """
+    Queue the kind's message to the user on each of its channels the user
+    can receive (push needs a registered device), in the caller's transaction
+    """
+    channels, subject, body = TEMPLATES[kind]
+    fields.setdefault("name", user.name)
+    messages = []
+    for channel in channels:
+        address = user.email if channel == EMAIL else user.push_token
+        if not address:
+            continue
+        message = OutboxMessage(
+            kind=kind, channel=channel, user_id=user.id, address=address,
+            subject=subject.format(**fields), body=body.format(**fields), data=data,
+        )
+        db.add(message)
+        messages.append(message)
+    if messages:
+        db.info["outbox_pending"] = True
+    return messages
+
+def reset_url(token: str) -> str:
+    return RESET_URL.format(token=token)
+
+def sweep_finished(connection: Connection, now: datetime = None, batch_size: int = SWEEP_BATCH_SIZE) -> int:
+    """Delete up to batch_size messages finished more than RETENTION ago"""
+    cutoff = (now or datetime.utcnow()) - RETENTION
+    finished = select(OutboxMessage.id).where(
+        OutboxMessage.status.in_(("sent", "failed")), OutboxMessage.updated_at < cutoff
+    ).limit(batch_size)
+    return connection.execute(delete(OutboxMessage).where(OutboxMessage.id.in_(finished))).rowcount
+
+@event.listens_for(Session, "after_commit")
+def _wake_dispatcher(session):
+    if session.in_nested_transaction():
+        return  # a SAVEPOINT released; wait for the outermost commit
+    if session.info.pop("outbox_pending", False):
+        from .dispatcher import dispatcher
+        dispatcher.wake()
+
+@event.listens_for(Session, "after_rollback")
+def _forget_pending(session):
+    if not session.in_nested_transaction():
+        session.info.pop("outbox_pending", None)
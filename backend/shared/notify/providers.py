@@ -0,0 +1,181 @@
+"""
+Delivery providers for the outbox dispatcher.
+
+A provider sends a batch of messages of one channel and returns one
+outcome per message: None when it was accepted, otherwise a DeliveryError
+saying whether a later attempt may succeed. An exception from send() fails
+the whole batch as retryable (network errors, timeouts).
+
+HTTP providers share one httpx.AsyncClient per provider, so the batches
+reuse pooled keep-alive connections. NOTIFY_PROVIDER picks the set:
+"live" (default) uses Expo for push and SendGrid for email. "local" uses
+LocalProvider for both channels, so nothing leaves the machine and every
+message is marked sent without being delivered; it is meant for
+development and benchmarks, and the app warns at startup when it is on.
+"""
+import asyncio
+import logging
+import os
+import random
+from collections import deque
+from typing import Dict, List, Optional, Sequence
+
+import httpx
+
+from .outbox import EMAIL, PUSH, SENSITIVE_KINDS
+
+logger = logging.getLogger(__name__)
+
+class DeliveryError(Exception):
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+def _status_error(response: httpx.Response) -> DeliveryError:
+    # Throttled or provider-side trouble may pass; other client errors won't
+    retryable = response.status_code == 429 or response.status_code >= 500
+    return DeliveryError(f"HTTP {response.status_code}: {response.text[:200]}", retryable)
+
+class Provider:
+    name = "provider"
+    batch_size = 100  # messages per send() call
+    rate = 50.0  # messages per second
+    burst = 100
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def send(self, messages: Sequence) -> List[Optional[DeliveryError]]:
+        raise NotImplementedError
+
+class HTTPProvider(Provider):
+    base_url = ""
+    max_connections = 10
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def headers(self) -> Dict[str, str]:
+        return {}
+
+    async def start(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers(),
+                timeout=httpx.Timeout(10.0, connect=5.0),
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+            )
+
+    async def stop(self):
+        client, self._client = self._client, None
+        if client is not None:
+            await client.aclose()
+
+class ExpoPushProvider(HTTPProvider):
+    """Expo push service: up to 100 notifications per request, one ticket each"""
+    name = "expo"
+    base_url = "https://exp.host"
+    batch_size = 100
+    rate = 500.0
+    burst = 600
+
+    def headers(self):
+        headers = {"Accept": "application/json", "Accept-Encoding": "gzip, deflate"}
+        token = os.getenv("EXPO_ACCESS_TOKEN")
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        return headers
+
+    async def send(self, messages):
+        response = await self._client.post("/--/api/v2/push/send", json=[
+            {"to": message.address, "title": message.subject, "body": message.body, "data": message.data or {},
+             "sound": "default"}
+            for message in messages
+        ])
+        if response.status_code != 200:
+            error = _status_error(response)
+            return [error] * len(messages)
+        outcomes = []
+        tickets = response.json().get("data", [])
+        for index in range(len(messages)):
+            ticket = tickets[index] if index < len(tickets) else {"status": "error", "message": "no ticket"}
+            if ticket.get("status") == "ok":
+                outcomes.append(None)
+            else:
+                # The device is gone or the token is malformed: no point retrying
+                code = (ticket.get("details") or {}).get("error")
+                outcomes.append(DeliveryError(f"{code or 'error'}: {ticket.get('message')}",
+                                              retryable=code not in ("DeviceNotRegistered", "InvalidCredentials")))
+        return outcomes
+
+class SendGridProvider(HTTPProvider):
+    """SendGrid v3 mail send: one message per request, sent concurrently over the pool"""
+    name = "sendgrid"
+    base_url = "https://api.sendgrid.com"
+    batch_size = 50
+    rate = 100.0
+    burst = 100
+
+    def headers(self):
+        return {"Authorization": f"Bearer {os.getenv('SENDGRID_API_KEY', '')}"}
+
+    async def _send_one(self, message) -> Optional[DeliveryError]:
+        response = await self._client.post("/v3/mail/send", json={
+            "personalizations": [{"to": [{"email": message.address}]}],
+            "from": {"email": os.getenv("NOTIFY_EMAIL_FROM", "no-reply@clicko.app"), "name": "ClickO"},
+            "subject": message.subject,
+            "content": [{"type": "text/plain", "value": message.body}],
+        })
+        return None if response.status_code in (200, 202) else _status_error(response)
+
+    async def send(self, messages):
+        results = await asyncio.gather(*(self._send_one(message) for message in messages), return_exceptions=True)
+        return [
+            DeliveryError(f"{type(result).__name__}: {result}") if isinstance(result, Exception) else result
+            for result in results
+        ]
+
+class LocalProvider(Provider):
+    """
+    Offline stand-in: waits `latency` seconds per batch like a provider
+    round trip, fails a `failure_rate` share of messages (retryably), and
+    logs delivered messages (id, kind and address; never the body) and
+    keeps the last ones in memory, without the body of sensitive kinds
+    """
+    batch_size = 100
+    rate = 5000.0
+    burst = 5000
+
+    def __init__(self, channel: str, latency: float = None, failure_rate: float = None, keep: int = 1000):
+        self.name = f"local-{channel}"
+        self.latency = latency if latency is not None else float(os.getenv("NOTIFY_LOCAL_LATENCY_MS", "20")) / 1000
+        self.failure_rate = failure_rate if failure_rate is not None else float(os.getenv("NOTIFY_LOCAL_FAILURE_RATE", "0"))
+        self.delivered = deque(maxlen=keep)  # (id, address, subject, body)
+        self.sent = 0
+        self.batches = 0
+
+    async def send(self, messages):
+        await asyncio.sleep(self.latency)
+        self.batches += 1
+        outcomes = []
+        for message in messages:
+            if self.failure_rate and random.random() < self.failure_rate:
+                outcomes.append(DeliveryError("simulated provider failure"))
+                continue
+            body = "" if message.kind in SENSITIVE_KINDS else message.body
+            self.delivered.append((message.id, message.address, message.subject, body))
+            logger.info(f"{self.name} delivered message {message.id} ({message.kind}) to {message.address}")
+            self.sent += 1
+            outcomes.append(None)
+        return outcomes
+
+def default_providers() -> Dict[str, Provider]:
+    """channel -> provider, from NOTIFY_PROVIDER"""
+    if os.getenv("NOTIFY_PROVIDER", "live") != "local":
+        return {PUSH: ExpoPushProvider(), EMAIL: SendGridProvider()}
+    logger.warning("NOTIFY_PROVIDER=local: notifications are marked sent but never delivered")
+    return {PUSH: LocalProvider(PUSH), EMAIL: LocalProvider(EMAIL)}
@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+
+from .dispatcher import dispatcher
+
+router = APIRouter(prefix="/notifications", tags=["notifications"])
+
+@router.get("/stats")
+async def get_notification_stats():
+    """Counters of this worker's outbox dispatcher"""
+    return dispatcher.stats()
@@ -0,0 +1,26 @@
+"""
+Fast JSON responses for list endpoints.
+
+Returning a Response directly skips FastAPI's response_model validation and
+jsonable_encoder pass, so handlers that already build plain dicts/lists in
+the documented schema can hand them straight to the encoder. The
+response_model on the route is still used for the OpenAPI schema.
+"""
+import json
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+def dumps(content) -> bytes:
+    """Serialize plain Python data to compact UTF-8 JSON"""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -0,0 +1,288 @@
+"""
+Durable job scheduler.
+
+Timed work (booking expiry, reminders, agent cooldowns) is stored as rows
+in the jobs table, written in the same transaction as the change that
+needs it. Each worker keeps a heap of the jobs due within the next
+`horizon` seconds. The heap is refilled in batches from the
+(status, run_at) index, so the number of pending jobs further out doesn't
+matter. Jobs scheduled by this process are pushed onto the heap when their
+transaction commits.
+
+A due job is claimed by setting a lease (owner + expiry) with a
+conditional UPDATE, so only one worker runs it even when several hold it
+in their heaps. The handler and the job's completion commit together
+through the write queue. Failed jobs are retried with backoff up to
+max_attempts. Jobs whose lease expired (their worker died) are claimed
+again.
+
+Handlers take (db, **payload) and must be idempotent: a handler can run
+again if its lease expires before it completes.
+"""
+import asyncio
+import heapq
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, event, or_
+from sqlalchemy.orm import Session
+
+from .database import ReadSessionLocal
+from .user.models import Job
+from .writer import write_queue
+
+logger = logging.getLogger(__name__)
+
+class JobScheduler:
+    def __init__(
+        self,
+        batch_size: int = 500,
+        horizon: float = 60.0,
+        refill_interval: float = 5.0,
+        lease: float = 60.0,
+        retry_delay: float = 30.0,
+    ):
+        self.batch_size = batch_size
+        self.horizon = horizon  # seconds ahead loaded into the heap
+        self.refill_interval = refill_interval
+        self.lease = lease
+        self.retry_delay = retry_delay  # doubled on every further attempt
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._handlers: Dict[str, Callable] = {}
+        self._heap = []  # (run_at, job_id)
+        self._queued = set()  # job ids in the heap
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+
+    def handler(self, kind: str):
+        """Register the decorated function as the handler for jobs of this kind"""
+        def register(fn):
+            self._handlers[kind] = fn
+            return fn
+        return register
+
+    def schedule(self, db: Session, kind: str, run_at: datetime, max_attempts: int = 5, **payload) -> Job:
+        """Add a job in the caller's transaction; it is durable once that commits"""
+        job = Job(kind=kind, run_at=run_at, payload=payload, max_attempts=max_attempts)
+        db.add(job)
+        db.info.setdefault("scheduled_jobs", []).append(job)
+        return job
+
+    def schedule_once(self, db: Session, kind: str, run_at: datetime, **payload) -> Optional[Job]:
+        """
+        schedule() unless a job of this kind is already pending; for recurring
+        work whose handler queues its own next run
+        """
+        queued = db.query(Job.id).filter(Job.status == "pending", Job.kind == kind).first()
+        if queued is not None:
+            return None
+        return self.schedule(db, kind, run_at, **payload)
+
+    # Heap
+
+    def _notify(self, jobs: List[Job]):
+        """Called after commit, from any thread"""
+        if self._loop is None:
+            return
+        entries = [(job.run_at, job.id) for job in jobs if job.id is not None]
+        if entries:
+            self._loop.call_soon_threadsafe(self._push, entries)
+
+    def _push(self, entries):
+        horizon = datetime.utcnow() + timedelta(seconds=self.horizon)
+        earliest = self._heap[0][0] if self._heap else None
+        for run_at, job_id in entries:
+            if run_at <= horizon and job_id not in self._queued:
+                heapq.heappush(self._heap, (run_at, job_id))
+                self._queued.add(job_id)
+        if self._heap and (earliest is None or self._heap[0][0] < earliest):
+            self._wakeup.set()
+
+    def _pop_due(self) -> List[int]:
+        now = datetime.utcnow()
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+            _, job_id = heapq.heappop(self._heap)
+            self._queued.discard(job_id)
+            due.append(job_id)
+        return due
+
+    async def _refill(self) -> bool:
+        """Load jobs due within the horizon; returns True if there may be more"""
+        now = datetime.utcnow()
+        horizon = now + timedelta(seconds=self.horizon)
+
+        def fetch():
+            db = ReadSessionLocal()
+            try:
+                pending = db.query(Job.run_at, Job.id).filter(
+                    Job.status == "pending", Job.run_at <= horizon
+                ).order_by(Job.run_at).limit(self.batch_size).all()
+                # Jobs whose worker died mid-run
+                stale = db.query(Job.id).filter(
+                    Job.status == "running", Job.lease_expires_at < now
+                ).limit(self.batch_size).all()
+                return pending, stale
+            finally:
+                db.close()
+
+        pending, stale = await run_in_threadpool(fetch)
+        self._push([tuple(row) for row in pending] + [(now, job_id) for job_id, in stale])
+        return len(pending) == self.batch_size
+
+    # Execution
+
+    async def _dispatch(self, job_ids: List[int]):
+        owner = self.owner
+        lease = timedelta(seconds=self.lease)
+
+        def claim(db):
+            now = datetime.utcnow()
+            db.query(Job).filter(
+                Job.id.in_(job_ids),
+                Job.run_at <= now,
+                or_(
+                    Job.status == "pending",
+                    and_(Job.status == "running", Job.lease_expires_at < now)
+                )
+            ).update({
+                Job.status: "running",
+                Job.lease_owner: owner,
+                Job.lease_expires_at: now + lease,
+                Job.attempts: Job.attempts + 1,
+            }, synchronize_session=False)
+            return db.query(Job.id, Job.kind, Job.payload, Job.attempts, Job.max_attempts).filter(
+                Job.id.in_(job_ids), Job.status == "running", Job.lease_owner == owner
+            ).all()
+
+        claimed = await write_queue.run(claim)
+        # Submitted together so they share one group commit
+        await asyncio.gather(*(self._execute(*job) for job in claimed))
+
+    async def _execute(self, job_id, kind, payload, attempts, max_attempts):
+        handler = self._handlers.get(kind)
+
+        def run(db):
+            if handler is None:
+                raise LookupError(f"No handler registered for job kind {kind!r}")
+            handler(db, **payload)
+            self._release(db, job_id, status="done", last_error=None)
+
+        try:
+            await write_queue.run(run)
+            self.completed += 1
+        except Exception as e:
+            logger.error(f"Job {job_id} ({kind}) failed on attempt {attempts}: {e}")
+            retry = handler is not None and attempts < max_attempts
+            if retry:
+                self.retried += 1
+                run_at = datetime.utcnow() + timedelta(seconds=self.retry_delay * 2 ** (attempts - 1))
+            else:
+                self.failed += 1
+                run_at = None
+
+            def record(db):
+                self._release(
+                    db, job_id,
+                    status="pending" if retry else "failed",
+                    last_error=str(e)[:500],
+                    **({"run_at": run_at} if retry else {})
+                )
+
+            await write_queue.run(record)
+
+    def _release(self, db, job_id, **columns):
+        # Only while we still hold the lease; another worker may have taken it over
+        db.query(Job).filter(Job.id == job_id, Job.lease_owner == self.owner).update({
+            **columns,
+            "lease_owner": None,
+            "lease_expires_at": None,
+        }, synchronize_session=False)
+
+    # Lifecycle
+
+    async def start(self):
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        self._loop = None
+        self._heap.clear()
+        self._queued.clear()
+
+    async def _run(self):
+        next_refill = 0.0
+        backlog = False
+        while True:
+            try:
+                if time.monotonic() >= next_refill or (backlog and not self._heap):
+                    backlog = await self._refill()
+                    next_refill = time.monotonic() + self.refill_interval
+
+                due = self._pop_due()
+                if due:
+                    await self._dispatch(due)
+                    continue
+
+                timeout = next_refill - time.monotonic()
+                if self._heap:
+                    timeout = min(timeout, (self._heap[0][0] - datetime.utcnow()).total_seconds())
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), max(0.0, timeout))
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Scheduler loop failed: {e}")
+                await asyncio.sleep(1.0)
+
+    def stats(self) -> dict:
+        return {
+            "owner": self.owner,
+            "queued": len(self._heap),
+            "next_run_at": self._heap[0][0].isoformat() if self._heap else None,
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+# Process-wide scheduler, started with the app
+scheduler = JobScheduler()
+
+@event.listens_for(Session, "after_commit")
+def _notify_scheduler(session):
+    if session.in_nested_transaction():
+        return  # a SAVEPOINT released; wait for the outermost commit
+    jobs = session.info.pop("scheduled_jobs", None)
+    if jobs:
+        # Heap entries are only hints: claiming re-checks the row, so a job
+        # from a rolled-back SAVEPOINT just fails to claim
+        scheduler._notify(jobs)
+
+@event.listens_for(Session, "after_rollback")
+def _forget_scheduled(session):
+    if not session.in_nested_transaction():
+        session.info.pop("scheduled_jobs", None)
@@ -0,0 +1 @@
+# Search module
\ No newline at end of file
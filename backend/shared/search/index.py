@@ -0,0 +1,352 @@
+"""
+In-memory autocomplete index over agent names and category names and
+descriptions.
+
+Text is split into lowercase tokens. Every token goes into a prefix trie,
+for completions of what the user has typed so far, and into a trigram
+index. Trigrams find candidate tokens for misspelled input ("plumbr"),
+and candidates within a small edit distance of a prefix of the token are
+accepted. Every query term must match (as a prefix or fuzzily) for a
+document to be suggested.
+
+The index is built once and then updated per document from committed
+change events.
+"""
+import heapq
+import logging
+import re
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from ..database import ReadSessionLocal
+from ..events import change_bus, USER, AGENT, CATEGORY
+from ..user.models import User, Agent, Category
+
+logger = logging.getLogger(__name__)
+
+AGENT_DOC = "agent"
+CATEGORY_DOC = "category"
+
+# Relative weight of where a token came from
+NAME_WEIGHT = 1.0
+DESCRIPTION_WEIGHT = 0.5
+# Completions visited per prefix; the trie is walked breadth first, so
+# these are the shortest ones
+MAX_COMPLETIONS = 200
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return _TOKEN.findall(text.lower()) if text else []
+
+def trigrams(token: str) -> set:
+    padded = f"${token}"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def max_edits(term: str) -> int:
+    if len(term) < 3:
+        return 0
+    return 1 if len(term) <= 5 else 2
+
+def prefix_edit_distance(term: str, token: str, limit: int) -> int:
+    """
+    Edit distance between term and the closest prefix of token, or
+    limit + 1 if it is larger than limit
+    """
+    previous = list(range(len(token) + 1))
+    for i, char in enumerate(term, 1):
+        current = [i] + [0] * len(token)
+        for j, other in enumerate(token, 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char != other)
+            )
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return min(previous)
+
+class _TrieNode:
+    __slots__ = ("children", "token")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.token: Optional[str] = None  # set when a token ends here
+
+class SuggestIndex:
+    def __init__(self):
+        self._docs: Dict[Tuple[str, int], dict] = {}  # (kind, id) -> {"text", "boost", "tokens"}
+        self._token_docs: Dict[str, Dict[Tuple[str, int], float]] = {}  # token -> doc -> weight
+        self._trie = _TrieNode()
+        self._trigrams: Dict[str, set] = {}  # trigram -> tokens
+        self._ranked: Dict[str, list] = {}  # token -> documents best first (see _ranked_docs)
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._docs)
+
+    # Updates
+
+    def put(self, kind: str, doc_id: int, text: str, boost: float = 0.0, description: Optional[str] = None):
+        """Add or replace a document"""
+        tokens = {token: NAME_WEIGHT for token in tokenize(text)}
+        for token in tokenize(description):
+            tokens.setdefault(token, DESCRIPTION_WEIGHT)
+        with self._lock:
+            self._remove((kind, doc_id))
+            key = (kind, doc_id)
+            self._docs[key] = {"text": text, "boost": boost, "tokens": tuple(tokens)}
+            for token, weight in tokens.items():
+                docs = self._token_docs.get(token)
+                if docs is None:
+                    docs = self._token_docs[token] = {}
+                    self._add_token(token)
+                docs[key] = weight
+                self._ranked.pop(token, None)
+
+    def remove(self, kind: str, doc_id: int):
+        with self._lock:
+            self._remove((kind, doc_id))
+
+    def _remove(self, key):
+        doc = self._docs.pop(key, None)
+        if doc is None:
+            return
+        for token in doc["tokens"]:
+            docs = self._token_docs[token]
+            docs.pop(key, None)
+            self._ranked.pop(token, None)
+            if not docs:
+                del self._token_docs[token]
+                self._drop_token(token)
+
+    def _add_token(self, token: str):
+        node = self._trie
+        for char in token:
+            node = node.children.setdefault(char, _TrieNode())
+        node.token = token
+        for trigram in trigrams(token):
+            self._trigrams.setdefault(trigram, set()).add(token)
+
+    def _drop_token(self, token: str):
+        path = [self._trie]
+        for char in token:
+            path.append(path[-1].children[char])
+        path[-1].token = None
+        # Prune nodes that no longer lead anywhere
+        for depth in range(len(token), 0, -1):
+            node = path[depth]
+            if node.children or node.token is not None:
+                break
+            del path[depth - 1].children[token[depth - 1]]
+        for trigram in trigrams(token):
+            tokens = self._trigrams[trigram]
+            tokens.discard(token)
+            if not tokens:
+                del self._trigrams[trigram]
+
+    # Queries
+
+    def _completions(self, prefix: str) -> List[str]:
+        node = self._trie
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        found = []
+        queue = deque([node])
+        while queue and len(found) < MAX_COMPLETIONS:
+            node = queue.popleft()
+            if node.token is not None:
+                found.append(node.token)
+            queue.extend(node.children.values())
+        return found
+
+    def _fuzzy(self, term: str, exclude) -> Dict[str, int]:
+        """Tokens with a prefix within max_edits(term) of term -> edits"""
+        limit = max_edits(term)
+        if not limit:
+            return {}
+        term_trigrams = trigrams(term)
+        shared = {}
+        for trigram in term_trigrams:
+            for token in self._trigrams.get(trigram, ()):
+                shared[token] = shared.get(token, 0) + 1
+        # Each edit breaks at most three trigrams
+        needed = max(1, len(term_trigrams) - 3 * limit)
+        found = {}
+        for token, count in shared.items():
+            if count >= needed and token not in exclude:
+                edits = prefix_edit_distance(term, token, limit)
+                if edits <= limit:
+                    found[token] = edits
+        return found
+
+    def _term_tokens(self, term: str) -> Dict[str, float]:
+        """Index tokens matching one query term -> match score"""
+        completions = self._completions(term)
+        # Exact token beats a completion; shorter completions beat longer ones
+        scores = {
+            token: 1.0 if token == term else 0.8 - 0.01 * min(20, len(token) - len(term))
+            for token in completions
+        }
+        for token, edits in self._fuzzy(term, scores.keys()).items():
+            scores[token] = 0.6 - 0.15 * edits
+        return scores
+
+    def _ranked_docs(self, token: str) -> list:
+        """(weight, boost, key) for a token's documents, best first; cached until they change"""
+        ranked = self._ranked.get(token)
+        if ranked is None:
+            ranked = sorted(
+                ((weight, self._docs[key]["boost"], key) for key, weight in self._token_docs[token].items()),
+                key=lambda item: (-item[0], -item[1])
+            )
+            self._ranked[token] = ranked
+        return ranked
+
+    def suggest(self, query: str, limit: int = 10) -> List[dict]:
+        terms = tokenize(query)
+        if not terms:
+            return []
+        with self._lock:
+            term_tokens = [self._term_tokens(term) for term in terms]
+            if not all(term_tokens):
+                return []
+
+            # Walk the rarest term's documents from the best match down, and
+            # stop once nothing left can beat the current top `limit`
+            driver = min(
+                range(len(terms)),
+                key=lambda i: sum(len(self._token_docs[token]) for token in term_tokens[i])
+            )
+            others = [tokens for i, tokens in enumerate(term_tokens) if i != driver]
+            best_others = sum(max(tokens.values()) for tokens in others)
+            scored = {}  # key -> score
+            top = []  # min-heap of the best `limit` scores
+            threshold = float("-inf")
+
+            for token, token_score in sorted(term_tokens[driver].items(), key=lambda item: -item[1]):
+                if len(top) >= limit and (token_score + best_others) / len(terms) + _MAX_BOOST <= threshold:
+                    break
+                for weight, boost, key in self._ranked_docs(token):
+                    if len(top) >= limit and (token_score * weight + best_others) / len(terms) + boost <= threshold:
+                        break
+                    total = token_score * weight
+                    doc_tokens = self._docs[key]["tokens"]
+                    for tokens in others:
+                        match = max(
+                            (tokens[t] * self._token_docs[t][key] for t in doc_tokens if t in tokens),
+                            default=None
+                        )
+                        if match is None:
+                            break
+                        total += match
+                    else:
+                        score = total / len(terms) + boost
+                        if score > scored.get(key, float("-inf")):
+                            scored[key] = score
+                            # A re-scored document leaves a stale entry behind, which
+                            # only makes the threshold lower (safe, prunes less)
+                            heapq.heappush(top, score)
+                            if len(top) > limit:
+                                heapq.heappop(top)
+                            if len(top) == limit:
+                                threshold = top[0]
+
+            ranked = sorted(scored.items(), key=lambda item: (-item[1], self._docs[item[0]]["text"]))
+            return [
+                {"type": kind, "id": doc_id, "text": self._docs[(kind, doc_id)]["text"], "score": round(score, 3)}
+                for (kind, doc_id), score in ranked[:limit]
+            ]
+
+    # Loading
+
+    def load(self):
+        """Build the index from verified agents and all categories"""
+        db = ReadSessionLocal()
+        try:
+            agents = _agent_rows(db)
+            categories = db.query(Category.id, Category.name, Category.description).all()
+        finally:
+            db.close()
+        for row in agents:
+            self.put(AGENT_DOC, row[0], row[1], _agent_boost(*row[2:]))
+        for category_id, name, description in categories:
+            self.put(CATEGORY_DOC, category_id, name, _CATEGORY_BOOST, description)
+        self.loaded = True
+        logger.info(f"Suggest index loaded {len(agents)} agents and {len(categories)} categories")
+
+    def refresh(self, agent_ids=(), user_ids=(), category_ids=()):
+        """Re-read the given documents (agents also by their user id)"""
+        db = ReadSessionLocal()
+        try:
+            agents = []
+            if agent_ids:
+                agents += _agent_rows(db, Agent.id.in_(agent_ids), verified_only=False)
+            if user_ids:
+                agents += _agent_rows(db, User.id.in_(user_ids), verified_only=False)
+            categories = db.query(Category.id, Category.name, Category.description).filter(
+                Category.id.in_(category_ids)
+            ).all() if category_ids else []
+        finally:
+            db.close()
+
+        seen = set()
+        for agent_id, name, avg_rating, total_ratings, kyc_status in agents:
+            seen.add(agent_id)
+            if kyc_status == "verified":
+                self.put(AGENT_DOC, agent_id, name, _agent_boost(avg_rating, total_ratings))
+            else:
+                self.remove(AGENT_DOC, agent_id)
+        for agent_id in set(agent_ids) - seen:
+            self.remove(AGENT_DOC, agent_id)
+
+        found = set()
+        for category_id, name, description in categories:
+            found.add(category_id)
+            self.put(CATEGORY_DOC, category_id, name, _CATEGORY_BOOST, description)
+        for category_id in set(category_ids) - found:
+            self.remove(CATEGORY_DOC, category_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "loaded": self.loaded,
+                "documents": len(self._docs),
+                "tokens": len(self._token_docs),
+                "trigrams": len(self._trigrams),
+            }
+
+# Categories rank slightly above agents with an equal text match
+_CATEGORY_BOOST = 0.1
+_MAX_BOOST = max(_CATEGORY_BOOST, 0.05)
+
+def _agent_boost(avg_rating, total_ratings, *_):
+    # At most 0.05, so rating only breaks ties between equal text matches
+    return 0.01 * (avg_rating or 0.0) * min(1.0, (total_ratings or 0) / 10)
+
+def _agent_rows(db, *criterion, verified_only=True):
+    query = db.query(
+        Agent.id, User.name, Agent.avg_rating, Agent.total_ratings, Agent.kyc_status
+    ).join(User, Agent.user_id == User.id)
+    if verified_only:
+        query = query.filter(Agent.kyc_status == "verified")
+    return query.filter(*criterion).all()
+
+# Process-wide suggest index, loaded at startup
+suggest_index = SuggestIndex()
+
+def _refresh_on_change(events):
+    if not suggest_index.loaded:
+        return
+    agent_ids = [event.id for event in events if event.entity == AGENT]
+    user_ids = [event.id for event in events if event.entity == USER]
+    category_ids = [event.id for event in events if event.entity == CATEGORY]
+    if agent_ids or user_ids or category_ids:
+        suggest_index.refresh(agent_ids, user_ids, category_ids)
+
+change_bus.subscribe(_refresh_on_change)
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Query
+from fastapi.concurrency import run_in_threadpool
+from ..responses import FastJSONResponse
+from .index import suggest_index
+
+router = APIRouter(prefix="/search", tags=["search"])
+
+@router.get("/suggest")
+async def suggest(
+    q: str = Query(..., min_length=1, max_length=100, description="What the user has typed so far"),
+    limit: int = Query(10, ge=1, le=50, description="Maximum number of suggestions")
+):
+    """
+    Typo-tolerant autocomplete over agent and category names (and category
+    descriptions), best match first
+    """
+    if not suggest_index.loaded:
+        await run_in_threadpool(suggest_index.load)
+    return FastJSONResponse(suggest_index.suggest(q, limit))
+
+@router.get("/stats")
+async def get_search_stats():
+    """Size of the suggest index"""
+    return suggest_index.stats()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, Float, ForeignKey, DateTime, Table
+from sqlalchemy import Column, Integer, String, Boolean, Float, ForeignKey, DateTime, Table, Index, JSON, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from datetime import datetime
@@ -20,6 +20,8 @@ class User(Base):
     is_admin = Column(Boolean, default=False)
     is_agent = Column(Boolean, default=False)
     profile_image_url = Column(String, nullable=True)
+    # Expo push token of the user's device, for shared.notify
+    push_token = Column(String, nullable=True)
     
     # If user is also an agent
     agent = relationship("Agent", uselist=False, back_populates="user")
@@ -43,6 +45,8 @@ class Agent(Base):
     offline_until = Column(DateTime, nullable=True)
     avg_rating = Column(Float, default=0.0)
     total_ratings = Column(Integer, default=0)
+    # Bayesian average of the ratings, kept by shared.agent.ranking
+    ranking_score = Column(Float, nullable=False, default=0.0)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -55,6 +59,16 @@ class Agent(Base):
     user = relationship("User", back_populates="agent")
     categories = relationship("AgentCategory", back_populates="agent")
     bookings = relationship("Booking", back_populates="agent")
+    
+    __table_args__ = (
+        # Listed (verified) agents, best first, without a sort step
+        Index("ix_agents_kyc_status_ranking_score", "kyc_status", "ranking_score"),
+        # Admin KYC queue, newest first
+        Index("ix_agents_kyc_status_updated_at", "kyc_status", "updated_at"),
+        Index("ix_agents_user_id", "user_id"),
+        # Presence startup load: only the agents that are online or paused
+        Index("ix_agents_present", "id", sqlite_where=text("is_online = 1 OR offline_until IS NOT NULL")),
+    )
 
 # Association table for agent-category many-to-many relationship
 agent_categories = Table(
@@ -86,6 +100,11 @@ class AgentCategory(Base):
     agent = relationship("Agent", back_populates="categories")
     category = relationship("Category", back_populates="agents")
 
+    __table_args__ = (
+        # Agents per category; the primary key only leads with agent_id
+        Index("ix_agent_category_category_id_agent_id", "category_id", "agent_id"),
+    )
+
 class Booking(Base):
     __tablename__ = "bookings"
     
@@ -93,7 +112,7 @@ class Booking(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     agent_id = Column(Integer, ForeignKey("agents.id"), nullable=False)
     category_id = Column(Integer, ForeignKey("categories.id"), nullable=False)
-    status = Column(String, nullable=False, default="pending")  # pending, accepted, rejected, completed, cancelled
+    status = Column(String, nullable=False, default="pending")  # pending, accepted, rejected, completed, cancelled, expired
     scheduled_time = Column(DateTime, nullable=False, default=datetime.utcnow)
     visit_charge = Column(Float, nullable=False)
     # Using string for location coordinates as "lat,lng" for SQLite compatibility  
@@ -108,6 +127,16 @@ class Booking(Base):
     agent = relationship("Agent", back_populates="bookings")
     rating = relationship("Rating", uselist=False, back_populates="booking")
 
+    __table_args__ = (
+        # Upcoming open bookings (availability load, scheduler)
+        Index("ix_bookings_status_scheduled_time", "status", "scheduled_time"),
+        # History pages, keyset on (scheduled_time, id); see shared.booking.history
+        Index("ix_bookings_user_id_status_scheduled_time", "user_id", "status", "scheduled_time"),
+        Index("ix_bookings_user_id_scheduled_time", "user_id", "scheduled_time"),
+        Index("ix_bookings_agent_id_status_scheduled_time", "agent_id", "status", "scheduled_time"),
+        Index("ix_bookings_agent_id_scheduled_time", "agent_id", "scheduled_time"),
+    )
+
 class Rating(Base):
     __tablename__ = "ratings"
     
@@ -118,4 +147,42 @@ class Rating(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
-    booking = relationship("Booking", back_populates="rating")
\ No newline at end of file
+    booking = relationship("Booking", back_populates="rating")
+
+class Job(Base):
+    """Durable timed work for shared.scheduler"""
+    __tablename__ = "jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)  # handler name, e.g. "booking.expire"
+    payload = Column(JSON, nullable=False, default=dict)
+    run_at = Column(DateTime, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending, running, done, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        # Due-work lookups read a short range of this index instead of the table
+        Index("ix_jobs_status_run_at", "status", "run_at"),
+        Index("ix_jobs_status_lease_expires_at", "status", "lease_expires_at"),
+    )
+
+# Version counters for categories (used for HTTP validators)
+from ..versions import EntityVersion  # noqa: E402,F401 - registers version counter hooks
+# Agent change feed for delta sync
+from ..changefeed import AgentChange  # noqa: E402,F401 - registers change feed hooks
+# Rating aggregates and ranking score
+from ..agent import ranking  # noqa: E402,F401 - registers ranking score hooks
+# Materialized agent listing table
+from ..agent import card_table  # noqa: E402,F401 - registers agent card hooks
+# Archive tables for finished bookings
+from ..booking.archive import BookingArchive, RatingArchive  # noqa: E402,F401 - creates the archive tables
+# Notification outbox
+from ..notify.outbox import OutboxMessage  # noqa: E402,F401 - creates the outbox table
+# Commit-driven change events for caches and derived indexes
+from .. import events  # noqa: E402,F401 - registers session hooks
@@ -1,7 +1,8 @@
 from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from typing import Optional
-from ..database import get_db
+from ..database import get_read_db
+from ..writer import write_queue
 from ..auth.jwt import get_current_user
 from .models import User, Agent
 import shutil
@@ -33,12 +34,14 @@ class UserProfileUpdate(BaseModel):
 class AddressUpdate(BaseModel):
     address: str
 
+class PushTokenUpdate(BaseModel):
+    push_token: Optional[str] = None  # None unregisters the device
+
 @router.post("/agent/kyc/upload")
 async def upload_kyc_document(
     document_type: str = Form(...),
     file: UploadFile = File(...),
-    agent_id: int = Form(...),
-    db: Session = Depends(get_db)
+    agent_id: int = Form(...)
 ):
     # Save file to disk (e.g., ./kyc_docs/)
     kyc_dir = "./kyc_docs"
@@ -46,33 +49,41 @@ async def upload_kyc_document(
     file_path = os.path.join(kyc_dir, f"{agent_id}_{file.filename}")
     with open(file_path, "wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
-    # Update agent record
-    agent = db.query(Agent).filter(Agent.id == agent_id).first()
-    if not agent:
+
+    def update(db: Session):
+        # Update agent record
+        agent = db.query(Agent).filter(Agent.id == agent_id).first()
+        if not agent:
+            return False
+        agent.kyc_document_type = document_type
+        agent.kyc_document_path = file_path
+        agent.kyc_status = "pending"
+        return True
+
+    if not await write_queue.run(update):
         return {"error": "Agent not found"}
-    agent.kyc_document_type = document_type
-    agent.kyc_document_path = file_path
-    agent.kyc_status = "pending"
-    db.commit()
     return {"message": "KYC document uploaded", "status": "pending"}
 
 @router.post("/admin/agent/kyc/verify")
-def verify_kyc(
+async def verify_kyc(
     agent_id: int,
-    status: str,  # "verified" or "rejected"
-    db: Session = Depends(get_db)
+    status: str  # "verified" or "rejected"
 ):
-    agent = db.query(Agent).filter(Agent.id == agent_id).first()
-    if not agent:
+    def update(db: Session):
+        agent = db.query(Agent).filter(Agent.id == agent_id).first()
+        if not agent:
+            return False
+        agent.kyc_status = status
+        return True
+
+    if not await write_queue.run(update):
         return {"error": "Agent not found"}
-    agent.kyc_status = status
-    db.commit()
     return {"message": f"KYC status updated to {status}"}
 
 # User profile endpoints
 @router.get("/{user_id}/")
 @router.get("/{user_id}")
-async def get_user_profile(user_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def get_user_profile(user_id: int, db: Session = Depends(get_read_db), current_user: User = Depends(get_current_user)):
     # Add some debug logging
     print(f"DEBUG: Requesting profile for user_id: {user_id}")
     print(f"DEBUG: Type of current_user: {type(current_user)}")
@@ -128,7 +139,6 @@ async def get_user_profile(user_id: int, db: Session = Depends(get_db), current_
 async def update_user_profile(
     user_id: int, 
     user_data: UserProfileUpdate,
-    db: Session = Depends(get_db), 
     current_user: User = Depends(get_current_user)
 ):
     # Users can only update their own profile
@@ -138,26 +148,28 @@ async def update_user_profile(
             detail="Access denied"
         )
     
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-    
-    # Update fields if provided
-    if user_data.name is not None:
-        user.name = user_data.name
-    if user_data.phone is not None:
-        user.phone = user_data.phone
-    if user_data.email_notifications is not None:
-        user.email_notifications = user_data.email_notifications
-    if user_data.push_notifications is not None:
-        user.push_notifications = user_data.push_notifications
-    
-    user.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(user)
+    def update(db: Session):
+        user = db.query(User).filter(User.id == user_id).first()
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found"
+            )
+
+        # Update fields if provided
+        if user_data.name is not None:
+            user.name = user_data.name
+        if user_data.phone is not None:
+            user.phone = user_data.phone
+        if user_data.email_notifications is not None:
+            user.email_notifications = user_data.email_notifications
+        if user_data.push_notifications is not None:
+            user.push_notifications = user_data.push_notifications
+
+        user.updated_at = datetime.utcnow()
+        return user
+
+    user = await write_queue.run(update)
     
     return {
         "id": user.id,
@@ -172,7 +184,6 @@ async def update_user_profile(
 async def update_user_address(
     user_id: int, 
     address_data: AddressUpdate,
-    db: Session = Depends(get_db), 
     current_user: User = Depends(get_current_user)
 ):
     # Users can only update their own address
@@ -182,25 +193,56 @@ async def update_user_address(
             detail="Access denied"
         )
     
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-    
-    user.address = address_data.address
-    user.updated_at = datetime.utcnow()
-    db.commit()
+    def update(db: Session):
+        user = db.query(User).filter(User.id == user_id).first()
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found"
+            )
+
+        user.address = address_data.address
+        user.updated_at = datetime.utcnow()
+
+    await write_queue.run(update)
     
     return {"message": "Address updated successfully"}
 
+@router.put("/{user_id}/push-token/")
+@router.put("/{user_id}/push-token")
+async def update_push_token(
+    user_id: int,
+    token_data: PushTokenUpdate,
+    current_user: User = Depends(get_current_user)
+):
+    # Users can only register their own device
+    if current_user.id != user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+
+    def update(db: Session):
+        user = db.query(User).filter(User.id == user_id).first()
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found"
+            )
+
+        user.push_token = token_data.push_token
+        user.updated_at = datetime.utcnow()
+
+    await write_queue.run(update)
+
+    return {"message": "Push token updated successfully"}
+
 @router.post("/{user_id}/profile-image/")
 @router.post("/{user_id}/profile-image")
 async def upload_profile_image(
     user_id: int,
     profile_image: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     # Users can only update their own profile image
@@ -233,9 +275,13 @@ async def upload_profile_image(
     
     # Update user profile image URL
     file_url = f"/uploads/profile_images/{filename}"
-    user.profile_image_url = file_url
-    user.updated_at = datetime.utcnow()
-    db.commit()
+
+    def update(db: Session):
+        user = db.query(User).filter(User.id == user_id).first()
+        user.profile_image_url = file_url
+        user.updated_at = datetime.utcnow()
+
+    await write_queue.run(update)
     
     return {
         "message": "Profile image uploaded successfully",
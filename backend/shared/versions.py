@@ -0,0 +1,48 @@
+"""
+Persisted version counters for data without a usable updated_at.
+
+Categories have no updated_at, and their agent counts change whenever an
+agent_category link is written. A before_flush hook bumps the matching
+counter in the same transaction as the change, so validators derived from
+it (see shared.conditional) are consistent across workers.
+"""
+from itertools import chain
+
+from sqlalchemy import Column, Integer, String, event
+from sqlalchemy.orm import Session
+
+from .database import Base
+
+# table name -> version counter it bumps
+VERSIONED_TABLES = {
+    "categories": "categories",
+    "agent_category": "categories",
+}
+
+class EntityVersion(Base):
+    __tablename__ = "entity_versions"
+
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+def current_version(db: Session, name: str) -> int:
+    """Current counter value (0 if it has never been bumped)"""
+    version = db.query(EntityVersion.version).filter(EntityVersion.name == name).scalar()
+    return version or 0
+
+@event.listens_for(Session, "before_flush")
+def _bump_versions(session, flush_context, instances):
+    names = {
+        VERSIONED_TABLES[obj.__tablename__]
+        for obj in chain(session.new, session.dirty, session.deleted)
+        if getattr(obj, "__tablename__", None) in VERSIONED_TABLES
+    }
+    if not names:
+        return
+    with session.no_autoflush:
+        for name in names:
+            row = session.get(EntityVersion, name)
+            if row is None:
+                session.add(EntityVersion(name=name, version=1))
+            else:
+                row.version += 1
@@ -0,0 +1,125 @@
+"""
+Single-writer queue for database mutations.
+
+SQLite allows one writer at a time, so concurrent handlers committing on
+their own sessions just queue up inside the busy timeout. Instead, handlers
+submit a write function to the queue; a dedicated thread runs pending
+writes back to back and commits them together (group commit). Each write
+runs inside its own SAVEPOINT so one failing write doesn't discard the
+rest of the batch.
+"""
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+class _WriteJob:
+    __slots__ = ("fn", "future")
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.future = Future()
+
+class WriteQueue:
+    def __init__(self, session_factory=SessionLocal, max_batch=64, max_wait=0.002):
+        self._session_factory = session_factory
+        self._max_batch = max_batch
+        self._max_wait = max_wait  # seconds to wait for more writes to join a batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.writes = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def submit(self, fn):
+        """
+        Queue fn(session) for the writer thread. Returns a Future that resolves
+        to fn's return value once the batch containing it has committed.
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        job = _WriteJob(fn)
+        self._queue.put(job)
+        return job.future
+
+    async def run(self, fn):
+        """Submit fn(session) and await its committed result"""
+        return await asyncio.wrap_future(self.submit(fn))
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            batch = [job]
+            deadline = time.monotonic() + self._max_wait
+            stopping = False
+            while len(batch) < self._max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+            self._commit_batch(batch)
+            if stopping:
+                return
+
+    def _commit_batch(self, batch):
+        session = self._session_factory()
+        outcomes = []
+        try:
+            for job in batch:
+                if not job.future.set_running_or_notify_cancel():
+                    continue
+                savepoint = session.begin_nested()
+                try:
+                    result = job.fn(session)
+                    session.flush()
+                    savepoint.commit()
+                    outcomes.append((job, result, None))
+                except Exception as e:
+                    savepoint.rollback()
+                    outcomes.append((job, None, e))
+            session.commit()
+        except Exception as e:
+            logger.error(f"Write batch of {len(batch)} failed to commit: {e}")
+            session.rollback()
+            outcomes = [(job, None, error or e) for job, _, error in outcomes]
+        finally:
+            session.close()
+
+        self.batches += 1
+        self.writes += len(outcomes)
+        for job, result, error in outcomes:
+            if error is not None:
+                job.future.set_exception(error)
+            else:
+                job.future.set_result(result)
+
+# Process-wide writer used by the routers
+write_queue = WriteQueue()